@@ -1,7 +1,11 @@
 from models import model
+from models.instrumentation import instrumented, phase
+from algorithms.simulation import simulate_paths, weighted_average
+from algorithms.kernels import running_mean
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Asian_Option(
     asset_model: model,
     initial_price: float,
@@ -11,7 +15,9 @@ def Asian_Option(
     num_timesteps: int,
     call_option: bool = True,
     arithmetic_averaging: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    observation_times: np.ndarray = None
 ):
     """
     Calculates the price of an Asian option using Monte Carlo simulation.
@@ -39,6 +45,14 @@ def Asian_Option(
         Specifies whether to use arithmetic (True) or geometric (False) averaging of the asset prices. Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, or "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only). Defaults to "monte_carlo".
+    observation_times : ndarray, optional
+        The increasing fixing times in (0, period] whose prices are averaged (without the initial
+        price). When given, the paths are simulated at the fixing dates only, num_timesteps is ignored
+        and the option can only be exercised on them. Defaults to fixing the initial price and every
+        time step.
 
     Returns:
     --------
@@ -48,53 +62,40 @@ def Asian_Option(
 
     # Define the exercise value function based on the type of option (call or put).
     if call_option:
-        exercise_value = lambda mean: max(mean - strike, 0)
+        exercise_value = lambda mean: np.maximum(mean - strike, 0)
     else:
-        exercise_value = lambda mean: max(strike - mean, 0)
+        exercise_value = lambda mean: np.maximum(strike - mean, 0)
 
     # Simulate the price paths of the underlying asset using the asset model.
-    PRICE = asset_model.simulate(
-        S0=initial_price,  # Initial asset price
-        T=period,          # Time to maturity
-        M=num_simulations, # Number of simulations
-        N=num_timesteps    # Number of time steps
-    )
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            period,          # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain or jump-conditional simulation
+            observation_times # Fixing dates, or every time step
+        )
 
-    # Initialize an array to store the running average of the asset's price.
-    MEAN = np.zeros(shape=(num_simulations, num_timesteps + 1))
-    MEAN[:, 0] = PRICE[:, 0]  # Set the initial price for each simulation
-
-    # Calculate the running average of the asset's price.
-    if arithmetic_averaging:
-        # Use arithmetic averaging
-        for t in range(1, num_timesteps + 1):
-            MEAN[:, t] = (MEAN[:, t - 1] * t + PRICE[:, t]) / (t + 1)
-    else:
-        # Use geometric averaging
-        for t in range(1, num_timesteps + 1):
-            MEAN[:, t] = (PRICE[:, t] * MEAN[:, t - 1] ** t) ** (1 / (t + 1))
+    # Calculate the running average of the asset's price: over every time step including the
+    # initial price, or over the fixing dates only (the paths also end at maturity).
+    with phase("state", paths=num_simulations):
+        if observation_times is None:
+            MEAN = running_mean(PRICE, arithmetic_averaging)
+        else:
+            MEAN = running_mean(PRICE[:, 1:len(observation_times) + 1], arithmetic_averaging)
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # European-style option: only the final average price matters
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(MEAN[i][-1])  # Payoff at maturity
-
-        return np.mean(VALUE)  # Return the average payoff across all simulations
-    
-    else:
-        # American-style option: allow for early exercise
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # European-style option: only the final average price matters
+            VALUE = exercise_value(MEAN[:, -1])  # Payoff at maturity
 
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(MEAN[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(MEAN[i][t]), VALUE[i][t + 1])
+        else:
+            # American-style option: allow for early exercise. Comparing the payoff to continuing
+            # backwards from maturity leaves the best payoff along each simulation.
+            VALUE = np.max(exercise_value(MEAN), axis=1)
 
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT)  # Return the weighted average payoff across all simulations
@@ -1,7 +1,14 @@
 from models import model
+from models.instrumentation import instrumented, phase, count_draws
+from algorithms.simulation import simulate_paths, weighted_average, observation_grid
+from algorithms.kernels import barrier_hit
+from algorithms.bridge import step_variance, crossing_probability
+from algorithms.pde import pde_price
+from algorithms.lattice import lattice_price
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Barrier_Option(
     asset_model: model,
     initial_price: float,
@@ -13,7 +20,10 @@ def Barrier_Option(
     barrier_up: bool = True,
     knock_in: bool = True,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    observation_times: np.ndarray = None,
+    bridge_correction: str = None
 ):
     """
     Calculates the price of a Barrier option using Monte Carlo simulation.
@@ -46,6 +56,24 @@ def Barrier_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only), "importance_sampling" to shift the
+        simulated paths towards the barrier (for knock-ins that rarely trigger), "pde" to solve the
+        pricing PDE on num_timesteps time steps, or "binomial" or "trinomial" for backward induction on
+        a lattice of num_timesteps steps with a node on the barrier (StationaryModel only, see
+        algorithms/pde.py and algorithms/lattice.py), with the barrier monitored continuously unless
+        observation_times are given and optimal early exercise. Defaults to "monte_carlo".
+    observation_times : ndarray, optional
+        The increasing times in (0, period] at which the price is monitored (the maturity is always
+        observed), e.g. daily or monthly dates. When given, the paths are simulated at these dates
+        only and num_timesteps is ignored. Defaults to monitoring every time step.
+    bridge_correction : str, optional
+        Approximates continuous monitoring by the Brownian bridge probability that the price crossed the
+        barrier between two time steps: "probability" weights each path's knock-in and knock-out payoffs
+        by its probability of survival (European exercise only), and "sample" draws the crossings from
+        these probabilities. Simulation engines without observation_times only. Defaults to None,
+        monitoring the time steps only.
 
     Returns:
     --------
@@ -58,66 +86,115 @@ def Barrier_Option(
     if knock_in:
         if call_option:
             # Knock-in call option: payoff is nonzero only if the barrier is hit
-            exercise_value = lambda hit, price: max(price - strike, 0) if hit else 0
+            exercise_value = lambda hit, price: np.where(hit, np.maximum(price - strike, 0), 0)
         else:
             # Knock-in put option: payoff is nonzero only if the barrier is hit
-            exercise_value = lambda hit, price: max(strike - price, 0) if hit else 0
+            exercise_value = lambda hit, price: np.where(hit, np.maximum(strike - price, 0), 0)
     else:
         if call_option:
             # Knock-out call option: payoff is zero if the barrier is hit
-            exercise_value = lambda hit, price: 0 if hit else max(price - strike, 0)
+            exercise_value = lambda hit, price: np.where(hit, 0, np.maximum(price - strike, 0))
         else:
             # Knock-out put option: payoff is zero if the barrier is hit
-            exercise_value = lambda hit, price: 0 if hit else max(strike - price, 0)
+            exercise_value = lambda hit, price: np.where(hit, 0, np.maximum(strike - price, 0))
 
-    # Simulate the price paths of the underlying asset using the asset model.
-    PRICE = asset_model.simulate(
-        S0=initial_price,  # Initial asset price
-        T=period,          # Time to maturity
-        M=num_simulations, # Number of simulations
-        N=num_timesteps    # Number of time steps
-    )
-
-    # Initialize an array to keep track of whether the barrier is hit in each simulation.
-    HIT_BARRIER = np.zeros(shape=(num_simulations, num_timesteps + 1))
-
-    # Determine if the barrier is hit in each simulation.
-    if barrier_up:
-        # For an upper barrier, check if the price is ever above the barrier.
-        for i in range(num_simulations):
-            HIT_BARRIER[i][0] = PRICE[i][0] >= barrier
-            for t in range(1, num_timesteps + 1):
-                HIT_BARRIER[i, t] = max(HIT_BARRIER[i][t - 1], PRICE[i][t] >= barrier)
+    if bridge_correction not in (None, "probability", "sample"):
+        raise ValueError(f"Unknown bridge correction '{bridge_correction}', expected 'probability' or 'sample'")
+
+    if bridge_correction == "probability" and not european_exercise:
+        raise ValueError("The probability bridge correction only prices European exercise")
+
+    # The bridge corrects simulated time steps towards continuous monitoring, which contradicts
+    # monitoring dates, and the pde and lattice engines already monitor every step they take
+    if bridge_correction is not None and observation_times is not None:
+        raise ValueError("The bridge correction approximates continuous monitoring, not observation_times")
+
+    if bridge_correction is not None and engine in ("pde", "binomial", "trinomial"):
+        raise ValueError(f"The bridge correction applies to the simulation engines, not '{engine}'")
+
+    # Solve the pricing PDE by finite differences with the pde engine.
+    if engine == "pde":
+        return pde_price(
+            asset_model, initial_price, period,
+            (lambda s: np.maximum(s - strike, 0)) if call_option else (lambda s: np.maximum(strike - s, 0)),
+            num_timesteps, early_exercise=not european_exercise, focus=(strike,), barrier=barrier,
+            barrier_up=barrier_up, knock_in=knock_in, observation_times=observation_times
+        )
+
+    # Roll the payoff back on a recombining lattice with the binomial and trinomial engines.
+    if engine in ("binomial", "trinomial"):
+        return lattice_price(
+            asset_model, initial_price, period,
+            (lambda s: np.maximum(s - strike, 0)) if call_option else (lambda s: np.maximum(strike - s, 0)),
+            num_timesteps, early_exercise=not european_exercise, method=engine, barrier=barrier,
+            barrier_up=barrier_up, knock_in=knock_in, observation_times=observation_times
+        )
+
+    # The level the importance sampling engine centres the paths on: the barrier a knock-in must reach,
+    # or the strike when the payoff lies beyond it in the same direction. A single drift cannot favour
+    # both a barrier and a payoff on opposite sides, so those knock-ins stay centred on the initial price,
+    # and knock-outs on the strike.
+    if not knock_in:
+        target = strike
+    elif call_option == barrier_up:
+        target = max(barrier, strike) if barrier_up else min(barrier, strike)
     else:
-        # For a lower barrier, check if the price is ever below the barrier.
-        for i in range(num_simulations):
-            HIT_BARRIER[i][0] = PRICE[i][0] <= barrier
-            for t in range(1, num_timesteps + 1):
-                HIT_BARRIER[i, t] = max(HIT_BARRIER[i][t - 1], PRICE[i][t] <= barrier)
+        target = initial_price
+
+    # The price is always observed at maturity.
+    observation_times = observation_grid(observation_times, period)
+
+    # Simulate the price paths of the underlying asset using the asset model.
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            period,          # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain, jump-conditional or importance sampled simulation
+            observation_times, # Monitoring dates, or every time step
+            target           # Level the importance sampled paths are centred on
+        )
+
+    # Determine whether the barrier is hit in each simulation (from below for an upper barrier,
+    # from above for a lower one).
+    with phase("state", paths=num_simulations):
+        HIT_BARRIER = barrier_hit(PRICE, barrier, barrier_up)
+
+        # Probability that the barrier was crossed between the time steps
+        if bridge_correction is not None:
+            CROSSING = crossing_probability(
+                PRICE, barrier, barrier_up, step_variance(asset_model, period, num_timesteps, observation_times)
+            )
+
+        if bridge_correction == "probability":
+            # Probability that each path survives (does not hit the barrier) up to maturity
+            SURVIVAL = np.where(HIT_BARRIER[:, -1], 0.0, np.prod(1 - CROSSING, axis=1))
+
+        elif bridge_correction == "sample":
+            # Draw the crossings between the time steps and track the barrier hits including them
+            CROSSED = np.random.uniform(size=CROSSING.shape) < CROSSING
+            count_draws(CROSSED.size)
+            HIT_BARRIER[:, 1:] |= np.logical_or.accumulate(CROSSED, axis=1)
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        VALUE = np.zeros(shape=(num_simulations))
+    with phase("payoff", paths=num_simulations):
+        if bridge_correction == "probability":
+            # Expected payoff at maturity over the paths' barrier hits
+            VALUE = (
+                exercise_value(True, PRICE[:, -1]) * (1 - SURVIVAL) +
+                exercise_value(False, PRICE[:, -1]) * SURVIVAL
+            )
 
-        for i in range(num_simulations):
+        elif european_exercise:
             # Calculate the payoff at maturity for each simulation
-            VALUE[i] = exercise_value(HIT_BARRIER[i][-1], PRICE[i][-1])
-        
-        return np.mean(VALUE)  # Return the average payoff across all simulations
-    
-    else:
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
-        
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(HIT_BARRIER[i][t], PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(
-                        exercise_value(HIT_BARRIER[i][t], PRICE[i][t]), 
-                        VALUE[i][t + 1]
-                    )
-        
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = exercise_value(HIT_BARRIER[:, -1], PRICE[:, -1])
+
+        else:
+            # Comparing the payoff to continuing backwards from maturity leaves the best payoff
+            # along each simulation.
+            VALUE = np.max(exercise_value(HIT_BARRIER, PRICE), axis=1)
+
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT)  # Return the weighted average payoff across all simulations
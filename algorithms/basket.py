@@ -1,7 +1,13 @@
-from models import model
+from typing import Optional
+from models import model, MultiAssetModel
+from models.instrumentation import instrumented, phase
+from models.stratification import stratum_labels, stratum_weights
+from algorithms.closed_form import levy_basket_price, levy_basket_proxy, levy_basket_weights
+from algorithms.simulation import control_variate, weighted_average, diffusive_volatility
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Basket_Option(
     asset_models: list[model],
     asset_weights: list[float],
@@ -11,7 +17,11 @@ def Basket_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    correlation: Optional[np.ndarray] = None,
+    factor_loadings: Optional[np.ndarray] = None,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of a Basket option using Monte Carlo simulation.
@@ -40,11 +50,27 @@ def Basket_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    correlation : ndarray, optional
+        The correlation matrix of the assets' Brownian drivers. Defaults to independent assets.
+    factor_loadings : ndarray, optional
+        The (K, F) loadings of the assets on F systematic factors, an alternative to the correlation matrix
+        for large baskets whose weighted price is then accumulated asset by asset. Defaults to None.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "moment_matching" for Levy's log-normal
+        approximation, or "control_variate" for simulation with the Levy approximation as control variate.
+        The latter two require European exercise, StationaryModel assets and positive weights.
+        Defaults to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the basket's first order Brownian exposure at maturity
+        (the combination weighted by asset weight, initial price and volatility) to sample with, with
+        proportional allocation (European exercise only). Defaults to no stratification.
 
     Returns:
     --------
     float
         The estimated price of the Basket option based on the Monte Carlo simulations and the provided parameters.
+    tuple[float, float]
+        With the control variate engine, the estimated price and the variance reduction factor achieved.
     """
 
 
@@ -56,41 +82,91 @@ def Basket_Option(
         # For a put option, the payoff is the maximum of (strike - basket price, 0)
         exercise_value = lambda s: max(strike - s, 0)
 
-    # Simulate the price paths for each asset in the basket.
-    PRICES = np.array([
-        asset_models[i].simulate(
-            S0=initial_prices[i],  # Initial price of the asset
-            T=periods,             # Time to maturity
-            M=num_simulations,     # Number of simulations
-            N=num_timesteps        # Number of time steps
-        ) for i in range(len(asset_models))
-    ])
+    if engine not in ("monte_carlo", "moment_matching", "control_variate"):
+        raise ValueError(f"Unknown basket engine '{engine}'")
 
-    # Calculate the basket price at each time step by applying the asset weights.
-    # 'i,ijk->jk' einsum expression performs the weighted sum across assets and simulations.
-    BASKET_PRICE = np.einsum('i,ijk->jk', asset_weights, PRICES)
+    if engine != "monte_carlo" and not european_exercise:
+        raise ValueError(f"The {engine} engine only prices European exercise")
+
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
+    basket_model = MultiAssetModel(asset_models, correlation, factor_loadings)
+
+    # Price with Levy's moment matched log-normal approximation.
+    if engine == "moment_matching":
+        return levy_basket_price(
+            asset_models, asset_weights, initial_prices, strike, periods, basket_model.correlation, call_option
+        )
+
+    # Stratify the basket's sensitivity to the assets' Brownian motions, weighting the paths by stratum.
+    direction = [
+        weight * price * diffusive_volatility(asset_model)
+        for weight, price, asset_model in zip(asset_weights, initial_prices, asset_models)
+    ]
+    WEIGHT = stratum_weights(num_simulations, stratified)
+    STRATUM = stratum_labels(num_simulations, stratified)
+
+    # Jointly simulate the correlated assets and accumulate their weighted price at each time step.
+    with phase("simulate", paths=num_simulations):
+        if engine == "control_variate":
+            # Accumulate the log geometric basket driving the Levy proxy alongside the basket.
+            BASKET_PRICE, LOG_BASKET = basket_model.simulate_basket(
+                S0=initial_prices,      # Initial price of each asset
+                weights=asset_weights,  # Weight of each asset
+                T=periods,              # Time to maturity
+                M=num_simulations,      # Number of simulations
+                N=num_timesteps,        # Number of time steps
+                log_weights=levy_basket_weights(asset_models, asset_weights, initial_prices, periods),
+                stratified=stratified,  # Strata of the terminal Brownian exposure
+                direction=direction
+            )
+        else:
+            BASKET_PRICE = basket_model.simulate_basket(
+                S0=initial_prices,      # Initial price of each asset
+                weights=asset_weights,  # Weight of each asset
+                T=periods,              # Time to maturity
+                M=num_simulations,      # Number of simulations
+                N=num_timesteps,        # Number of time steps
+                stratified=stratified,  # Strata of the terminal Brownian exposure
+                direction=direction
+            )
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # For European-style options, calculate the payoff at maturity for each simulation.
-        VALUE = np.zeros(shape=(num_simulations))
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, calculate the payoff at maturity for each simulation.
+            VALUE = np.zeros(shape=(num_simulations))
         
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(BASKET_PRICE[i][-1])
-        
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            for i in range(num_simulations):
+                VALUE[i] = exercise_value(BASKET_PRICE[i][-1])
+
+            if engine == "control_variate":
+                # The same payoff on the Levy proxy has the Levy approximation as its exact expectation.
+                PROXY = levy_basket_proxy(
+                    asset_models, asset_weights, initial_prices, LOG_BASKET, periods, basket_model.correlation
+                )
+                CONTROL = np.maximum(PROXY - strike, 0) if call_option else np.maximum(strike - PROXY, 0)
+                control_mean = levy_basket_price(
+                    asset_models, asset_weights, initial_prices, strike, periods, basket_model.correlation, call_option
+                )
+
+                return control_variate(VALUE, CONTROL, control_mean, WEIGHT, STRATUM)
     
-    else:
-        # For American-style options, allow for early exercise.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, allow for early exercise.
+            VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
         
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(BASKET_PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(BASKET_PRICE[i][t]), VALUE[i][t + 1])
+            for i in range(num_simulations):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        # At the last timestep, the value is the payoff
+                        VALUE[i][t] = exercise_value(BASKET_PRICE[i][t])
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(BASKET_PRICE[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT, STRATUM)  # Return the weighted average payoff across all simulations
@@ -0,0 +1,385 @@
+"""
+Command line batch pricer streaming contract definitions from CSV or JSONL.
+
+Every input record names a pricer, its underlying model(s) and the pricer's arguments:
+
+    {"id": "A1", "pricer": "asian", "model": "stochastic_volatility", "model.kappa": 1.5,
+     "initial_price": 100, "strike": 105, "period": 1, "num_simulations": 10000, "num_timesteps": 252}
+
+The "model" field (with "model.<parameter>" fields) builds the asset_model argument; the other model
+arguments are given the same way ("asset_model_1": "stationary", "asset_model_1.sigma": 0.3), or in
+JSONL as an object {"model": "stationary", "sigma": 0.3} (or a list of them for baskets).
+CSV values are parsed as JSON where possible, so numbers, booleans and lists keep their types. The
+time to maturity may be given as "period" or "periods", whichever the pricer calls it.
+
+Records are read, priced and written one window at a time, and results are written in input order
+as soon as they are available, so memory does not grow with the size of the book. Because the
+output is always a prefix of the input, --resume continues an interrupted run after the last
+complete result line. Seeding each record from --seed and its position makes resumed runs
+reproduce the prices of an uninterrupted one.
+
+    python -m algorithms.batch book.csv prices.jsonl --workers 8 --seed 42
+    python -m algorithms.batch book.csv prices.jsonl --workers 8 --seed 42 --resume
+
+Contracts that cannot be priced get their error in the output, and the command exits with status 1.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from models import (
+    StationaryModel,
+    JumpDiffusionModel,
+    StochasticVolatilityModel,
+    StochasticVolatilityJumpModel
+)
+from algorithms.asian import Asian_Option
+from algorithms.barrier import Barrier_Option
+from algorithms.basket import Basket_Option
+from algorithms.digital import (
+    Cash_Digital_Option,
+    Asset_Digital_Option,
+    Cash_Double_Digital_Option,
+    Asset_Double_Digital_Option
+)
+from algorithms.lookback import Fixed_Strike_Lookback_Option, Floating_Strike_Lookback_Option
+from algorithms.spread import Spread_Option
+import numpy as np
+import itertools
+import argparse
+import inspect
+import json
+import csv
+import sys
+import os
+
+
+# The models, keyed by the names used in the input records.
+MODELS = {
+    "stationary": StationaryModel,
+    "jump_diffusion": JumpDiffusionModel,
+    "stochastic_volatility": StochasticVolatilityModel,
+    "stochastic_volatility_jump": StochasticVolatilityJumpModel,
+}
+
+# The pricers, keyed by the names used in the input records.
+PRICERS = {
+    "asian": Asian_Option,
+    "barrier": Barrier_Option,
+    "basket": Basket_Option,
+    "cash_digital": Cash_Digital_Option,
+    "asset_digital": Asset_Digital_Option,
+    "cash_double_digital": Cash_Double_Digital_Option,
+    "asset_double_digital": Asset_Double_Digital_Option,
+    "fixed_strike_lookback": Fixed_Strike_Lookback_Option,
+    "floating_strike_lookback": Floating_Strike_Lookback_Option,
+    "spread": Spread_Option,
+}
+
+
+def read_records(path: str):
+    """
+    Streams the contract records of a CSV or JSONL file (chosen by extension, "-" reads JSONL from stdin).
+
+    Parameters:
+    -----------
+    path : str
+        The input file.
+
+    Returns:
+    --------
+    iterator[dict]
+        The records in file order.
+    """
+
+    file = sys.stdin if path == "-" else open(path, newline="")
+
+    try:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(file):
+                yield {name: _parse_value(value) for name, value in row.items() if value not in (None, "")}
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def _parse_value(value: str):
+    """
+    Parses a CSV field as JSON (numbers, booleans, lists), falling back to the string itself.
+    """
+
+    if value in ("True", "False"):
+        return value == "True"
+
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def build_model(specification):
+    """
+    Instantiates a model from its name or a {"model": name, <parameter>: value} dictionary.
+    """
+
+    if isinstance(specification, str):
+        specification = {"model": specification}
+
+    parameters = dict(specification)
+    name = parameters.pop("model")
+
+    if name not in MODELS:
+        raise ValueError(f"Unknown model '{name}', expected one of {', '.join(MODELS)}")
+
+    return MODELS[name](**parameters)
+
+
+def price_record(record: dict, seed: int = None):
+    """
+    Prices a single contract record.
+
+    Parameters:
+    -----------
+    record : dict
+        The contract definition: the pricer name under "pricer", an optional "id", the models and
+        the remaining pricer arguments (with the time to maturity as "period" or "periods" for
+        every pricer).
+    seed : int, optional
+        The random seed for the record's simulation. Defaults to None.
+
+    Returns:
+    --------
+    dict
+        The record's id with its price, or with the error that prevented pricing it.
+    """
+
+    record = dict(record)
+    identifier = record.pop("id", None)
+
+    try:
+        name = record.pop("pricer")
+        if name not in PRICERS:
+            raise ValueError(f"Unknown pricer '{name}', expected one of {', '.join(PRICERS)}")
+
+        # Collect the "<argument>.<parameter>" fields of models given by name
+        arguments = {}
+        for key, value in record.items():
+            if "." in key:
+                argument, parameter = key.split(".", 1)
+                arguments.setdefault("asset_model" if argument == "model" else argument, {})[parameter] = value
+
+        for key, value in record.items():
+            if "." in key:
+                continue
+
+            key = "asset_model" if key == "model" else key
+
+            if "model" not in key:
+                arguments[key] = value
+            elif isinstance(value, list):
+                arguments[key] = [build_model(specification) for specification in value]
+            elif isinstance(value, str):
+                arguments[key] = build_model(dict(arguments.get(key, {}), model=value))
+            else:
+                arguments[key] = build_model(value)
+
+        # The pricers name the time to maturity "period" or "periods" (the digitals): accept either
+        parameters = inspect.signature(PRICERS[name]).parameters
+        for given, expected in (("period", "periods"), ("periods", "period")):
+            if given in arguments and given not in parameters and expected not in arguments:
+                arguments[expected] = arguments.pop(given)
+
+        if seed is not None:
+            np.random.seed(seed)
+
+        price = PRICERS[name](**arguments)
+
+        # The control variate engines also return their variance reduction
+        if isinstance(price, tuple):
+            price = price[0]
+
+        return {"id": identifier, "price": float(price), "error": None}
+
+    except Exception as error:
+        return {"id": identifier, "price": None, "error": f"{type(error).__name__}: {error}"}
+
+
+def _price_indexed(item: tuple):
+    """
+    Prices the (position, record, seed) item of a stream (executed in a worker process).
+    """
+
+    position, record, seed = item
+    result = price_record(record, seed)
+
+    if result["id"] is None:
+        result["id"] = position
+
+    return result
+
+
+def price_stream(records, workers: int = 1, seed: int = None, start: int = 0, window: int = None):
+    """
+    Prices a stream of records in parallel, yielding the results in input order.
+
+    At most window records are in flight at any time, so memory stays constant however long the stream is.
+
+    Parameters:
+    -----------
+    records : iterable[dict]
+        The contract records.
+    workers : int, optional
+        The number of worker processes, or 1 to price in the calling process. Defaults to 1.
+    seed : int, optional
+        The base random seed; the record at position i is priced with seed + i. Defaults to unseeded.
+    start : int, optional
+        The position of the first record in the stream, used for default ids and seeds. Defaults to 0.
+    window : int, optional
+        The maximum number of records in flight. Defaults to four per worker.
+
+    Returns:
+    --------
+    iterator[dict]
+        The result of every record, in input order.
+    """
+
+    items = (
+        (position, record, None if seed is None else seed + position)
+        for position, record in enumerate(records, start=start)
+    )
+
+    if workers <= 1:
+        yield from map(_price_indexed, items)
+        return
+
+    window = window or 4 * workers
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+
+        for item in items:
+            pending.append(executor.submit(_price_indexed, item))
+
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+class _Writer():
+    """
+    Appends result records to a CSV or JSONL file, flushing every line.
+    """
+
+    def __init__(self, path: str, append: bool):
+        self.csv = path.endswith(".csv")
+        new = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+
+        self.file = sys.stdout if path == "-" else open(path, "w" if new else "a", newline="")
+
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=["id", "price", "error"])
+            if new:
+                self.writer.writeheader()
+
+    def write(self, result: dict):
+        if self.csv:
+            self.writer.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def _completed_results(path: str):
+    """
+    Counts the complete result records of a previous run, dropping a partially written last record.
+    """
+
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "rb+") as file:
+        data = file.read()
+
+        # The end of the last complete line, or for CSV of the last complete record, whose quoted
+        # error message may span several lines
+        end = data.rfind(b"\n") + 1
+        records = data[:end].count(b"\n")
+
+        if path.endswith(".csv"):
+            end, records = _complete_csv_records(data[:end])
+
+        # Truncate there so that a record interrupted by a crash is rewritten
+        file.truncate(end)
+
+    # The CSV header is not a result
+    return max(records - 1, 0) if path.endswith(".csv") else records
+
+
+def _complete_csv_records(data: bytes):
+    """
+    Returns the byte offset after the last complete CSV record of data and the number of records.
+    """
+
+    offset = 0
+    ends = []
+
+    def lines():
+        nonlocal offset
+
+        # A sentinel line closes the last record unless it is inside an unterminated quoted field,
+        # which then swallows it and ends past the data
+        for line in data.splitlines(keepends=True) + [b"\n"]:
+            offset += len(line)
+            yield line.decode()
+
+    for _ in csv.reader(lines()):
+        ends.append(offset)
+
+    complete = [end for end in ends if end <= len(data)]
+
+    return (complete[-1] if complete else 0), len(complete)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Price a book of contracts streamed from CSV or JSONL.")
+    parser.add_argument("input", help="contract definitions (.csv or .jsonl, '-' for JSONL on stdin)")
+    parser.add_argument("output", help="results (.csv or .jsonl, '-' for JSONL on stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1, in process)")
+    parser.add_argument("--seed", type=int, help="base random seed, record i uses seed + i")
+    parser.add_argument("--resume", action="store_true", help="skip the records already in the output")
+    parser.add_argument("--window", type=int, help="records in flight (default: 4 per worker)")
+    args = parser.parse_args(argv)
+
+    start = _completed_results(args.output) if args.resume and args.output != "-" else 0
+    records = itertools.islice(read_records(args.input), start, None)
+
+    writer = _Writer(args.output, append=start > 0 or args.resume)
+    failures = 0
+
+    try:
+        for result in price_stream(records, args.workers, args.seed, start, args.window):
+            writer.write(result)
+            failures += result["error"] is not None
+    finally:
+        writer.close()
+
+    # A non-zero exit status lets scripted runs detect the contracts that could not be priced
+    if failures:
+        print(f"{failures} contract(s) could not be priced", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
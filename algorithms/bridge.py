@@ -0,0 +1,149 @@
+"""
+Brownian bridge corrections for continuously monitored contracts simulated on a discrete grid.
+
+Given the simulated log prices at both ends of a step, the log price in between is (to first order)
+a Brownian bridge with the diffusive variance of the step, so the probability that it crossed a
+level, and the distribution of its extremum within the step, are known in closed form. For the
+stochastic volatility models the variance is taken at its long-run level theta, and the jumps of
+the jump models are treated as part of the diffusive move, both approximations that vanish as the
+time step shrinks.
+"""
+
+from models import model
+from models.instrumentation import count_draws
+from algorithms.simulation import diffusive_volatility
+import numpy as np
+
+
+def step_variance(
+    asset_model: model,
+    period: float,
+    num_timesteps: int,
+    observation_times: np.ndarray = None
+):
+    """
+    Computes the diffusive variance of the log price over each simulated step.
+
+    Parameters:
+    -----------
+    asset_model : model
+        The asset model the paths were simulated with.
+    period : float
+        The time to maturity of the paths.
+    num_timesteps : int
+        The number of uniform time steps, when no observation times are given.
+    observation_times : ndarray, optional
+        The increasing times the paths were simulated at. Defaults to the uniform grid.
+
+    Returns:
+    --------
+    VARIANCE : ndarray
+        The variance of the log price increment of each step, with shape (N,), or (B, N) for a
+        model with a batch of B parameter sets (see models.batching).
+    """
+
+    if observation_times is None:
+        dt = np.full(num_timesteps, period / num_timesteps)
+    else:
+        dt = np.diff(np.asarray(observation_times, dtype=float), prepend=0.0)
+
+    return np.multiply.outer(diffusive_volatility(asset_model) ** 2, dt)
+
+
+def _path_variance(PRICE: np.ndarray, VARIANCE: np.ndarray):
+    """
+    Repeats the (B, N) step variances of a batch for the M paths of every parameter set in PRICE.
+    """
+
+    if VARIANCE.ndim < 2:
+        return VARIANCE
+
+    return np.repeat(VARIANCE, len(PRICE) // len(VARIANCE), axis=0)
+
+
+def crossing_probability(PRICE: np.ndarray, level: float, upward: bool, VARIANCE: np.ndarray):
+    """
+    Computes the probability that each path crossed a level within each step.
+
+    For log prices x0 and x1 on the same side of the log level h, the Brownian bridge between them
+    crosses h with probability exp(-2 (h - x0) (h - x1) / variance). Steps ending on or beyond the
+    level have crossed it with certainty.
+
+    Parameters:
+    -----------
+    PRICE : ndarray
+        The price paths with shape (M, N + 1).
+    level : float
+        The level, e.g. a barrier.
+    upward : bool
+        Whether the level is crossed from below (True) or from above (False).
+    VARIANCE : ndarray
+        The variance of the log price increment of each step, with shape (N,) (or (B, N), see step_variance).
+
+    Returns:
+    --------
+    CROSSING : ndarray
+        The crossing probability of every step, with shape (M, N).
+    """
+
+    VARIANCE = _path_variance(PRICE, VARIANCE)
+
+    # Log distances of both ends of every step to the level, positive before it is reached
+    DISTANCE = np.log(level / PRICE) if upward else np.log(PRICE / level)
+
+    with np.errstate(over="ignore"):
+        CROSSING = np.exp(-2 * DISTANCE[:, :-1] * DISTANCE[:, 1:] / VARIANCE)
+
+    return np.where((DISTANCE[:, :-1] <= 0) | (DISTANCE[:, 1:] <= 0), 1.0, CROSSING)
+
+
+def bridge_extremum(PRICE: np.ndarray, maximum: bool, VARIANCE: np.ndarray):
+    """
+    Draws the maximum or minimum price of each path within each step.
+
+    The maximum of a Brownian bridge from x0 to x1 with variance v is distributed as
+    (x0 + x1 + sqrt((x1 - x0)^2 - 2 v log U)) / 2 for a uniform U (the minimum with the root
+    subtracted), so it is sampled exactly by inversion.
+
+    Parameters:
+    -----------
+    PRICE : ndarray
+        The price paths with shape (M, N + 1).
+    maximum : bool
+        Whether to draw the maxima (True) or the minima (False).
+    VARIANCE : ndarray
+        The variance of the log price increment of each step, with shape (N,) (or (B, N), see step_variance).
+
+    Returns:
+    --------
+    EXTREMUM : ndarray
+        The initial prices followed by the extreme price within each step, with shape (M, N + 1), whose
+        running extremum is the extremum of the continuously monitored path up to each time step.
+    """
+
+    VARIANCE = _path_variance(PRICE, VARIANCE)
+    X = np.log(PRICE)
+
+    # 1 - U lies in (0, 1], so that the extremum of a step is at least as extreme as its end points
+    ROOT = np.random.uniform(size=(PRICE.shape[0], PRICE.shape[1] - 1))
+    count_draws(ROOT.size)
+
+    # sqrt((x1 - x0)^2 - 2 v log(1 - U)), computed in place to bound the temporaries
+    np.log1p(-ROOT, out=ROOT)
+    ROOT *= -2 * VARIANCE
+    ROOT += np.diff(X, axis=1) ** 2
+    np.sqrt(ROOT, out=ROOT)
+
+    if not maximum:
+        ROOT *= -1
+
+    # Midpoint of the step's log prices shifted by half the root
+    ROOT += X[:, :-1]
+    ROOT += X[:, 1:]
+    ROOT *= 0.5
+
+    EXTREMUM = X
+    EXTREMUM[:, 0] = PRICE[:, 0]
+    EXTREMUM[:, 1:] = np.exp(ROOT)
+
+    return EXTREMUM
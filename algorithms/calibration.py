@@ -0,0 +1,179 @@
+from models import model, StochasticVolatilityModel, StochasticVolatilityJumpModel
+from algorithms.closed_form import heston_vanilla_price, black_price, norm_pdf
+import numpy as np
+
+
+# The calibrated parameters of each model, and the transforms mapping them to and from unconstrained
+# values (log scale for positive parameters, arctanh for the correlation and the mean log jump size).
+_PARAMETERS = {
+    StochasticVolatilityModel: ["kappa", "theta", "sigma", "rho"],
+    StochasticVolatilityJumpModel: ["kappa", "theta", "sigma", "rho", "lambda_J", "mu_J", "sigma_J"],
+}
+
+_TRANSFORMS = {
+    "kappa": (np.log, np.exp),
+    "theta": (np.log, np.exp),
+    "sigma": (np.log, np.exp),
+    "rho": (np.arctanh, np.tanh),
+    "lambda_J": (np.log, np.exp),
+    "mu_J": (np.arctanh, np.tanh),
+    "sigma_J": (np.log, np.exp),
+}
+
+
+def calibrate_model(
+    asset_model: model,
+    initial_price: float,
+    strikes,
+    periods,
+    prices=None,
+    implied_volatilities=None,
+    call_option=True,
+    max_iterations: int = 100,
+    tolerance: float = 1e-10
+):
+    """
+    Fits a StochasticVolatilityModel or StochasticVolatilityJumpModel to a surface of vanilla option quotes.
+
+    The options are priced with the semi-analytic characteristic function pricer, all strikes and
+    maturities in one vectorized evaluation, and the parameters fitted by Levenberg-Marquardt on
+    finite difference Jacobians. Positive parameters are optimized on a log scale, the correlation
+    and the mean log jump size through arctanh, so every iterate is a valid model. The drift mu is
+    kept fixed and plays the role of the rate at which the forward grows; like the pricers, quotes
+    are expected payoffs at maturity (undiscounted).
+
+    Parameters:
+    -----------
+    asset_model : model
+        The model to calibrate, whose parameters are the starting point of the fit.
+    initial_price : float
+        The initial price of the underlying asset.
+    strikes : ndarray
+        The strike price of every quote.
+    periods : ndarray
+        The time to maturity of every quote.
+    prices : ndarray, optional
+        The undiscounted market prices of the options, all finite (a ValueError names any invalid quote).
+    implied_volatilities : ndarray, optional
+        The Black implied volatilities of the options (relative to the forward initial_price * exp(mu T)),
+        used instead of prices. The residuals are then scaled by vega to approximate volatility errors.
+        StochasticVolatilityModel only: the forward of a StochasticVolatilityJumpModel also grows
+        with its uncompensated jumps, lambda_J (exp(mu_J + sigma_J^2 / 2) - 1), which changes with
+        the fitted parameters, so it is calibrated to prices.
+    call_option : bool or ndarray, optional
+        Whether each quote is a call (True) or a put (False). Defaults to True.
+    max_iterations : int, optional
+        The maximum number of Levenberg-Marquardt iterations. Defaults to 100.
+    tolerance : float, optional
+        The relative decrease of the squared error below which the fit stops. Defaults to 1e-10.
+
+    Returns:
+    --------
+    calibrated_model : model
+        A new model of the same type with the fitted parameters.
+    rmse : float
+        The root mean squared error of the fit, in price units (or volatility units for implied volatilities).
+    """
+
+    if type(asset_model) not in _PARAMETERS:
+        raise ValueError(
+            f"Calibration requires a StochasticVolatilityModel or StochasticVolatilityJumpModel, "
+            f"got {type(asset_model).__name__}"
+        )
+    if (prices is None) == (implied_volatilities is None):
+        raise ValueError("Specify either market prices or implied volatilities")
+
+    # The forward of the Bates model grows with the uncompensated jumps, so it moves with the fitted
+    # jump parameters and gives implied volatilities no fixed reference
+    if implied_volatilities is not None and isinstance(asset_model, StochasticVolatilityJumpModel):
+        raise ValueError("Calibrate a StochasticVolatilityJumpModel to prices, not implied volatilities")
+
+    quotes = prices if implied_volatilities is None else implied_volatilities
+    strikes, periods, call_option, quotes = np.broadcast_arrays(
+        np.asarray(strikes, dtype=float), np.asarray(periods, dtype=float), np.asarray(call_option),
+        np.asarray(quotes, dtype=float)
+    )
+
+    # A single non-finite quote would make every squared error NaN and stop the fit at its start
+    invalid = ~(np.isfinite(quotes) & np.isfinite(strikes) & (strikes > 0) & np.isfinite(periods) & (periods > 0))
+    if implied_volatilities is not None:
+        invalid |= ~(quotes > 0)
+
+    if np.any(invalid):
+        raise ValueError(
+            f"{np.count_nonzero(invalid)} of the {invalid.size} quotes are invalid (non-finite, or non-positive "
+            f"strikes, periods or volatilities), e.g. at index {np.argwhere(invalid)[0].tolist()}"
+        )
+
+    if implied_volatilities is not None:
+        # Convert the volatilities to prices and weight the price errors by the inverse vega
+        forward = initial_price * np.exp(asset_model.mu * periods)
+        variance = quotes ** 2 * periods
+
+        prices = np.where(
+            call_option,
+            black_price(forward, strikes, variance, True),
+            black_price(forward, strikes, variance, False)
+        )
+        d1 = (np.log(forward / strikes) + 0.5 * variance) / np.sqrt(variance)
+        scale = 1 / (forward * norm_pdf(d1) * np.sqrt(periods))
+    else:
+        prices = quotes
+        scale = np.ones_like(prices)
+
+    names = _PARAMETERS[type(asset_model)]
+    parameters = vars(asset_model).copy()
+
+    def build(x):
+        return type(asset_model)(**dict(parameters, **{
+            name: _TRANSFORMS[name][1](value) for name, value in zip(names, x)
+        }))
+
+    def residuals(x):
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            return scale * (heston_vanilla_price(build(x), initial_price, strikes, periods, call_option) - prices)
+
+    x = np.array([_TRANSFORMS[name][0](parameters[name]) for name in names], dtype=float)
+    r = residuals(x)
+    cost = r @ r
+    damping = 1e-3
+
+    if not np.isfinite(cost):
+        raise ValueError("The starting model does not price every quote; start from other parameters")
+
+    for _ in range(max_iterations):
+        # Forward difference Jacobian of the residuals
+        J = np.empty((len(r), len(x)))
+        for p in range(len(x)):
+            step = 1e-6 * max(1.0, abs(x[p]))
+            shifted = x.copy()
+            shifted[p] += step
+            J[:, p] = (residuals(shifted) - r) / step
+
+        A = J.T @ J
+        gradient = J.T @ r
+
+        # Increase the damping until the step decreases the squared error
+        while damping < 1e10:
+            delta = np.linalg.solve(A + damping * np.diag(np.diag(A) + 1e-12), -gradient)
+
+            # Move each unconstrained parameter by at most one unit (a factor e on a log scale)
+            candidate = x + delta / max(1.0, np.max(np.abs(delta)))
+            r_candidate = residuals(candidate)
+            cost_candidate = r_candidate @ r_candidate
+
+            if np.isfinite(cost_candidate) and cost_candidate < cost:
+                damping = max(damping / 3, 1e-12)
+                break
+
+            damping *= 3
+        else:
+            break
+
+        converged = cost - cost_candidate <= tolerance * cost
+        x, r, cost = candidate, r_candidate, cost_candidate
+
+        if converged:
+            break
+
+    return build(x), float(np.sqrt(cost / len(r)))
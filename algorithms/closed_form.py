@@ -0,0 +1,630 @@
+from models import (
+    model,
+    StationaryModel,
+    JumpDiffusionModel,
+    StochasticVolatilityModel,
+    StochasticVolatilityJumpModel
+)
+import functools
+import math
+import numpy as np
+
+
+def norm_cdf(x):
+    """
+    Evaluates the standard normal cumulative distribution function.
+
+    Uses Hart's double precision rational approximation (as given by West, 2005),
+    which only requires NumPy and is accurate to roughly machine precision.
+
+    Parameters:
+    -----------
+    x : float or ndarray
+        The point(s) at which to evaluate the distribution function.
+
+    Returns:
+    --------
+    float or ndarray
+        The probability that a standard normal variable is less than or equal to x.
+    """
+
+    x = np.asarray(x, dtype=float)
+    z = np.minimum(np.abs(x), 38.0)
+    e = np.exp(-0.5 * z ** 2)
+
+    # Rational approximation of the tail probability for moderate arguments.
+    numerator = ((((((
+        0.0352624965998911 * z + 0.700383064443688) * z + 6.37396220353165) * z +
+        33.912866078383) * z + 112.079291497871) * z + 221.213596169931) * z +
+        220.206867912376
+    )
+    denominator = (((((((
+        0.0883883476483184 * z + 1.75566716318264) * z + 16.064177579207) * z +
+        86.7807322029461) * z + 296.564248779674) * z + 637.333633378831) * z +
+        793.826512519948) * z + 440.413735824752
+    )
+
+    # Continued fraction expansion of the tail probability for large arguments.
+    fraction = z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))
+
+    tail = np.where(z < 7.07106781186547, e * numerator / denominator, e / fraction / 2.506628274631)
+    tail = np.where(z > 37, 0.0, tail)
+
+    return np.where(x > 0, 1 - tail, tail)
+
+
+def norm_pdf(x):
+    """
+    Evaluates the standard normal probability density function.
+
+    Parameters:
+    -----------
+    x : float or ndarray
+        The point(s) at which to evaluate the density.
+
+    Returns:
+    --------
+    float or ndarray
+        The standard normal density at x.
+    """
+
+    return np.exp(-0.5 * np.asarray(x, dtype=float) ** 2) / np.sqrt(2 * np.pi)
+
+
+def poisson_weights(intensity: float, tolerance: float = 1e-12):
+    """
+    Computes the Poisson probabilities of observing 0, 1, 2, ... jumps, truncated once the
+    remaining tail mass falls below a tolerance.
+
+    Parameters:
+    -----------
+    intensity : float
+        The expected number of jumps (the jump intensity multiplied by the time horizon).
+    tolerance : float, optional
+        The maximum probability mass discarded in the tail. Defaults to 1e-12.
+
+    Returns:
+    --------
+    ndarray
+        The probabilities of 0, 1, ..., n jumps, where n is the first count for which the
+        cumulative probability exceeds 1 - tolerance.
+    """
+
+    # From their logarithms, which do not underflow for large intensities
+    weights, total = [], 0.0
+
+    while 1 - total > tolerance and (len(weights) <= intensity or weights[-1] > 0):
+        n = len(weights)
+        weights.append(np.exp((n * np.log(intensity) if n else 0.0) - intensity - math.lgamma(n + 1)))
+        total += weights[-1]
+
+    return np.array(weights)
+
+
+def _merton_parameters(asset_model: model):
+    """
+    Extracts the (mu, sigma, lambda_J, mu_J, sigma_J) parameters of a log-normal jump diffusion
+    from a StationaryModel (no jumps) or a JumpDiffusionModel.
+    """
+
+    if isinstance(asset_model, JumpDiffusionModel):
+        return (
+            asset_model.mu, asset_model.sigma,
+            asset_model.lambda_J, asset_model.mu_J, asset_model.sigma_J
+        )
+    elif isinstance(asset_model, StationaryModel):
+        return asset_model.mu, asset_model.sigma, 0.0, 0.0, 0.0
+    else:
+        raise ValueError(
+            f"The analytic engine requires a StationaryModel or JumpDiffusionModel, "
+            f"got {type(asset_model).__name__}"
+        )
+
+
+def merton_digital_price(
+    asset_model: model,
+    initial_price: float,
+    lower_strike: float,
+    upper_strike: float,
+    periods: float,
+    asset_or_nothing: bool = False,
+    tolerance: float = 1e-12
+):
+    """
+    Calculates the expected terminal payoff of a digital paying inside a price band in closed form.
+
+    Conditional on n jumps the terminal log-price of the jump diffusion is normal, so the price is
+    a fast converging Poisson-weighted sum of log-normal (Black-Scholes) digitals. Like the Monte
+    Carlo pricers, the result is the expectation under the model's drift and is not discounted.
+    A StationaryModel is treated as a jump diffusion with zero jump intensity.
+
+    Parameters:
+    -----------
+    asset_model : model
+        A StationaryModel or JumpDiffusionModel describing the underlying asset.
+    initial_price : float
+        The initial price of the underlying asset.
+    lower_strike : float
+        The lower bound of the paying band (0 for a digital call).
+    upper_strike : float
+        The upper bound of the paying band (np.inf for a digital put).
+    periods : float
+        The time to maturity of the option, typically expressed in years.
+    asset_or_nothing : bool, optional
+        Specifies whether the digital pays the asset (True) or one unit of cash (False). Defaults to False.
+    tolerance : float, optional
+        The maximum Poisson probability mass discarded when truncating the series. Defaults to 1e-12.
+
+    Returns:
+    --------
+    float
+        The expected payoff of the digital at maturity.
+    """
+
+    mu, sigma, lambda_J, mu_J, sigma_J = _merton_parameters(asset_model)
+
+    # Poisson weights of the number of jumps up to maturity.
+    P = poisson_weights(lambda_J * periods, tolerance)
+    n = np.arange(len(P))
+
+    # Mean and variance of the terminal log-price conditional on n jumps.
+    mean = np.log(initial_price) + (mu - 0.5 * sigma ** 2) * periods + n * mu_J
+    variance = sigma ** 2 * periods + n * sigma_J ** 2
+    std = np.sqrt(variance)
+
+    with np.errstate(divide='ignore'):
+        log_lower = np.log(lower_strike) if lower_strike > 0 else -np.inf
+        log_upper = np.log(upper_strike)
+
+    if asset_or_nothing:
+        # E[S_T 1{a < S_T < b}] under a log-normal law, shifted by the variance (change of numeraire).
+        scale = np.exp(mean + 0.5 * variance)
+        band = norm_cdf((log_upper - mean - variance) / std) - norm_cdf((log_lower - mean - variance) / std)
+        value = scale * band
+    else:
+        # P(a < S_T < b) under a log-normal law.
+        value = norm_cdf((log_upper - mean) / std) - norm_cdf((log_lower - mean) / std)
+
+    return float(np.sum(P * value) / np.sum(P))
+
+
+def black_price(forward, strike, variance, call_option: bool = True):
+    """
+    Calculates the undiscounted Black price of a European option on a log-normal underlying.
+
+    Parameters:
+    -----------
+    forward : float or ndarray
+        The expected value of the underlying at maturity.
+    strike : float or ndarray
+        The strike price of the option.
+    variance : float or ndarray
+        The total variance of the underlying's log-price at maturity (sigma^2 T).
+    call_option : bool, optional
+        Specifies whether the option is a call (True) or a put (False). Defaults to True.
+
+    Returns:
+    --------
+    float or ndarray
+        The expected payoff of the option at maturity.
+    """
+
+    std = np.sqrt(variance)
+    d1 = (np.log(forward / strike) + 0.5 * variance) / std
+    d2 = d1 - std
+
+    if call_option:
+        return forward * norm_cdf(d1) - strike * norm_cdf(d2)
+    else:
+        return strike * norm_cdf(-d2) - forward * norm_cdf(-d1)
+
+
+def _gbm_parameters(asset_model: model):
+    """
+    Extracts the (mu, sigma) parameters of a StationaryModel.
+    """
+
+    if not isinstance(asset_model, StationaryModel):
+        raise ValueError(
+            f"The analytic approximations require StationaryModel assets, got {type(asset_model).__name__}"
+        )
+
+    return asset_model.mu, asset_model.sigma
+
+
+def kirk_spread_price(
+    asset_model_1: model,
+    asset_model_2: model,
+    initial_price_1: float,
+    initial_price_2: float,
+    strike: float,
+    periods: float,
+    correlation: float = 0.0,
+    call_option: bool = True
+):
+    """
+    Calculates the price of a European spread option with Kirk's approximation.
+
+    Kirk's approximation treats S2 + K as log-normal with volatility sigma_2 F2 / (F2 + K) and prices
+    the spread as a Margrabe exchange option. The price is undiscounted, like the Monte Carlo pricers.
+
+    Parameters:
+    -----------
+    asset_model_1 : model
+        The StationaryModel of the first underlying asset.
+    asset_model_2 : model
+        The StationaryModel of the second underlying asset.
+    initial_price_1 : float
+        The initial price of the first underlying asset.
+    initial_price_2 : float
+        The initial price of the second underlying asset.
+    strike : float
+        The strike price of the option.
+    periods : float
+        The time to maturity of the option, typically in years.
+    correlation : float, optional
+        The correlation between the Brownian drivers of the two assets. Defaults to 0.0.
+    call_option : bool, optional
+        Specifies whether the option is a call (True) or a put (False). Defaults to True.
+
+    Returns:
+    --------
+    float
+        The approximate expected payoff of the spread option at maturity.
+    """
+
+    mu_1, sigma_1 = _gbm_parameters(asset_model_1)
+    mu_2, sigma_2 = _gbm_parameters(asset_model_2)
+
+    # Forward prices of the assets
+    F1 = initial_price_1 * np.exp(mu_1 * periods)
+    F2 = initial_price_2 * np.exp(mu_2 * periods)
+
+    if F2 + strike <= 0:
+        raise ValueError("Kirk's approximation requires the forward of the second asset plus the strike to be positive")
+
+    # Volatility of the log-normal proxy for S2 + K, and of the ratio S1 / (S2 + K)
+    sigma_Y = sigma_2 * F2 / (F2 + strike)
+    variance = (sigma_1 ** 2 - 2 * correlation * sigma_1 * sigma_Y + sigma_Y ** 2) * periods
+
+    return float(black_price(F1, F2 + strike, variance, call_option))
+
+
+def kirk_spread_proxy(
+    asset_model_2: model,
+    initial_price_2: float,
+    terminal_price_2: np.ndarray,
+    strike: float,
+    periods: float
+):
+    """
+    Maps simulated terminal prices of the second asset to the log-normal proxy of S2 + K in Kirk's approximation.
+
+    The proxy (F2 + K) exp(sigma_Y W_T - sigma_Y^2 T / 2) is driven by the same Brownian motion as the
+    second asset, so the spread payoff written on the proxy has exactly the Kirk price as expectation.
+    This makes it a control variate for simulated spread payoffs.
+
+    Parameters:
+    -----------
+    asset_model_2 : model
+        The StationaryModel of the second underlying asset.
+    initial_price_2 : float
+        The initial price of the second underlying asset.
+    terminal_price_2 : ndarray
+        The simulated prices of the second asset at maturity.
+    strike : float
+        The strike price of the option.
+    periods : float
+        The time to maturity of the option, typically in years.
+
+    Returns:
+    --------
+    ndarray
+        The proxy value of S2 + K on each simulated path.
+    """
+
+    mu_2, sigma_2 = _gbm_parameters(asset_model_2)
+
+    F2 = initial_price_2 * np.exp(mu_2 * periods)
+    sigma_Y = sigma_2 * F2 / (F2 + strike)
+
+    # Recover the terminal Brownian motion from the simulated geometric Brownian motion
+    W = (np.log(terminal_price_2 / initial_price_2) - (mu_2 - 0.5 * sigma_2 ** 2) * periods) / sigma_2
+
+    return (F2 + strike) * np.exp(sigma_Y * W - 0.5 * sigma_Y ** 2 * periods)
+
+
+def _levy_moments(
+    asset_models: list,
+    asset_weights: list[float],
+    initial_prices: list[float],
+    periods: float,
+    correlation: np.ndarray
+):
+    """
+    Computes the forwards, volatilities, mean and log-variance of the moment matched log-normal basket.
+    """
+
+    mu, sigma = np.array([_gbm_parameters(asset_model) for asset_model in asset_models]).T
+    weights = np.asarray(asset_weights, dtype=float)
+
+    # First two moments of the basket at maturity
+    F = np.asarray(initial_prices, dtype=float) * np.exp(mu * periods)
+    M1 = np.dot(weights, F)
+    M2 = np.einsum('i,j,ij->', weights * F, weights * F, np.exp(correlation * np.outer(sigma, sigma) * periods))
+
+    return F, sigma, M1, np.log(M2 / M1 ** 2)
+
+
+def levy_basket_price(
+    asset_models: list,
+    asset_weights: list[float],
+    initial_prices: list[float],
+    strike: float,
+    periods: float,
+    correlation: np.ndarray = None,
+    call_option: bool = True
+):
+    """
+    Calculates the price of a European basket option with Levy's moment matching approximation.
+
+    The basket is approximated by a log-normal variable with the same first two moments and priced
+    with Black's formula. The price is undiscounted, like the Monte Carlo pricers.
+
+    Parameters:
+    -----------
+    asset_models : list[model]
+        The StationaryModels of the underlying assets.
+    asset_weights : list[float]
+        The (positive) weight of each asset in the basket.
+    initial_prices : list[float]
+        The initial price of each asset in the basket.
+    strike : float
+        The strike price of the option.
+    periods : float
+        The time to maturity of the option, typically expressed in years.
+    correlation : ndarray, optional
+        The correlation matrix of the assets' Brownian drivers. Defaults to independent assets.
+    call_option : bool, optional
+        Specifies whether the option is a call (True) or a put (False). Defaults to True.
+
+    Returns:
+    --------
+    float
+        The approximate expected payoff of the basket option at maturity.
+    """
+
+    if correlation is None:
+        correlation = np.eye(len(asset_models))
+
+    _, _, M1, variance = _levy_moments(asset_models, asset_weights, initial_prices, periods, correlation)
+
+    return float(black_price(M1, strike, variance, call_option))
+
+
+def levy_basket_proxy(
+    asset_models: list,
+    asset_weights: list[float],
+    initial_prices: list[float],
+    log_basket: np.ndarray,
+    periods: float,
+    correlation: np.ndarray = None
+):
+    """
+    Maps a simulated geometric basket to the log-normal proxy of the basket in Levy's approximation.
+
+    The proxy is driven by the standardized log of the geometric basket sum_k c_k log S_k(T), with the
+    linearization weights c_k = w_k F_k / sum_l w_l F_l, and has exactly the matched mean and log-variance
+    of Levy's approximation. Basket payoffs written on the proxy therefore have the Levy price as
+    expectation, making them a control variate for simulated basket payoffs.
+
+    Parameters:
+    -----------
+    asset_models : list[model]
+        The StationaryModels of the underlying assets.
+    asset_weights : list[float]
+        The (positive) weight of each asset in the basket.
+    initial_prices : list[float]
+        The initial price of each asset in the basket.
+    log_basket : ndarray
+        The simulated values of sum_k c_k log S_k(T), see levy_basket_weights.
+    periods : float
+        The time to maturity of the option, typically expressed in years.
+    correlation : ndarray, optional
+        The correlation matrix of the assets' Brownian drivers. Defaults to independent assets.
+
+    Returns:
+    --------
+    ndarray
+        The proxy value of the basket on each simulated path.
+    """
+
+    if correlation is None:
+        correlation = np.eye(len(asset_models))
+
+    mu, _ = np.array([_gbm_parameters(asset_model) for asset_model in asset_models]).T
+    F, sigma, M1, variance = _levy_moments(asset_models, asset_weights, initial_prices, periods, correlation)
+    c = levy_basket_weights(asset_models, asset_weights, initial_prices, periods)
+
+    # Mean and variance of the Gaussian log geometric basket
+    mean = np.dot(c, np.log(initial_prices) + (mu - 0.5 * sigma ** 2) * periods)
+    log_variance = np.einsum('i,j,ij->', c * sigma, c * sigma, correlation) * periods
+
+    Z = (log_basket - mean) / np.sqrt(log_variance)
+
+    return M1 * np.exp(np.sqrt(variance) * Z - 0.5 * variance)
+
+
+def levy_basket_weights(
+    asset_models: list,
+    asset_weights: list[float],
+    initial_prices: list[float],
+    periods: float
+):
+    """
+    Computes the linearization weights c_k = w_k F_k / sum_l w_l F_l of the geometric basket used by levy_basket_proxy.
+
+    Parameters:
+    -----------
+    asset_models : list[model]
+        The StationaryModels of the underlying assets.
+    asset_weights : list[float]
+        The weight of each asset in the basket.
+    initial_prices : list[float]
+        The initial price of each asset in the basket.
+    periods : float
+        The time to maturity of the option, typically expressed in years.
+
+    Returns:
+    --------
+    ndarray
+        The weight of each asset's log-price in the geometric basket.
+    """
+
+    mu, _ = np.array([_gbm_parameters(asset_model) for asset_model in asset_models]).T
+    wF = np.asarray(asset_weights, dtype=float) * np.asarray(initial_prices, dtype=float) * np.exp(mu * periods)
+
+    return wF / np.sum(wF)
+
+
+def _heston_parameters(asset_model: model):
+    """
+    Extracts the (mu, kappa, theta, sigma, rho, lambda_J, mu_J, sigma_J) parameters of a Heston model
+    with log-normal jumps from a StochasticVolatilityModel (no jumps) or a StochasticVolatilityJumpModel.
+    """
+
+    if isinstance(asset_model, StochasticVolatilityJumpModel):
+        return (
+            asset_model.mu, asset_model.kappa, asset_model.theta, asset_model.sigma, asset_model.rho,
+            asset_model.lambda_J, asset_model.mu_J, asset_model.sigma_J
+        )
+    elif isinstance(asset_model, StochasticVolatilityModel):
+        return (
+            asset_model.mu, asset_model.kappa, asset_model.theta, asset_model.sigma, asset_model.rho,
+            0.0, 0.0, 0.0
+        )
+    else:
+        raise ValueError(
+            f"The characteristic function requires a StochasticVolatilityModel or StochasticVolatilityJumpModel, "
+            f"got {type(asset_model).__name__}"
+        )
+
+
+def heston_characteristic_function(asset_model: model, u, periods):
+    """
+    Calculates the characteristic function E[exp(i u log(S_T / S_0))] of the Heston and Bates models.
+
+    The variance starts at its long-term mean theta, as in the models' simulations, and the jumps
+    multiply the price by exp(Y), Y ~ N(mu_J, sigma_J^2), at the rate lambda_J without compensating
+    the drift. The "little trap" formulation keeps the complex logarithm on its principal branch.
+
+    Parameters:
+    -----------
+    asset_model : model
+        A StochasticVolatilityModel or StochasticVolatilityJumpModel.
+    u : complex or ndarray
+        The (possibly complex) arguments of the characteristic function.
+    periods : float or ndarray
+        The times to maturity, broadcast against u.
+
+    Returns:
+    --------
+    complex or ndarray
+        The characteristic function at every (u, period).
+    """
+
+    mu, kappa, theta, sigma, rho, lambda_J, mu_J, sigma_J = _heston_parameters(asset_model)
+
+    iu = 1j * u
+    beta = kappa - rho * sigma * iu
+    d = np.sqrt(beta ** 2 + sigma ** 2 * (iu + u ** 2))
+    g = (beta - d) / (beta + d)
+    decay = np.exp(-d * periods)
+
+    # Integrated variance and initial variance terms
+    C = kappa * theta / sigma ** 2 * ((beta - d) * periods - 2 * np.log((1 - g * decay) / (1 - g)))
+    D = (beta - d) / sigma ** 2 * (1 - decay) / (1 - g * decay)
+
+    # Compound Poisson jumps in the log-price
+    jumps = lambda_J * periods * (np.exp(iu * mu_J - 0.5 * sigma_J ** 2 * u ** 2) - 1)
+
+    return np.exp(iu * mu * periods + C + D * theta + jumps)
+
+
+@functools.lru_cache(maxsize=None)
+def _quadrature_nodes(num_nodes: int, upper_limit: float):
+    """
+    Returns the Gauss-Legendre nodes and weights on [0, upper_limit], computed once per resolution.
+    """
+
+    nodes, weights = np.polynomial.legendre.leggauss(num_nodes)
+
+    return 0.5 * upper_limit * (nodes + 1), 0.5 * upper_limit * weights
+
+
+def heston_vanilla_price(
+    asset_model: model,
+    initial_price: float,
+    strikes,
+    periods,
+    call_option=True,
+    num_nodes: int = 256,
+    upper_limit: float = 200.0
+):
+    """
+    Calculates the undiscounted prices of European options in the Heston and Bates models for many
+    strikes and maturities at once.
+
+    Uses the Lewis formula C = F - sqrt(F K) / pi * int_0^inf Re[exp(i u k) phi(u - i/2)] / (u^2 + 1/4) du,
+    with k = log(F / K) and phi the characteristic function of log(S_T / F). The characteristic
+    function is evaluated once per distinct maturity on fixed quadrature nodes shared by all strikes.
+
+    Parameters:
+    -----------
+    asset_model : model
+        A StochasticVolatilityModel or StochasticVolatilityJumpModel.
+    initial_price : float
+        The initial price of the underlying asset.
+    strikes : float or ndarray
+        The strike prices of the options.
+    periods : float or ndarray
+        The times to maturity of the options, broadcast against strikes.
+    call_option : bool or ndarray, optional
+        Whether each option is a call (True) or a put (False). Defaults to True.
+    num_nodes : int, optional
+        The number of quadrature nodes. Defaults to 256.
+    upper_limit : float, optional
+        The truncation of the integral. Defaults to 200.
+
+    Returns:
+    --------
+    ndarray
+        The expected payoff at maturity of every option.
+    """
+
+    mu, kappa, theta, sigma, rho, lambda_J, mu_J, sigma_J = _heston_parameters(asset_model)
+
+    strikes, periods, call_option = np.broadcast_arrays(
+        np.asarray(strikes, dtype=float), np.asarray(periods, dtype=float), np.asarray(call_option)
+    )
+    shape = strikes.shape
+    strikes, periods, call_option = strikes.ravel(), periods.ravel(), call_option.ravel()
+    maturities, index = np.unique(periods, return_inverse=True)
+    u, weights = _quadrature_nodes(num_nodes, upper_limit)
+
+    # Expected growth of the price, log(F / S_0), including the uncompensated jumps
+    log_growth = mu * maturities + lambda_J * maturities * (np.exp(mu_J + 0.5 * sigma_J ** 2) - 1)
+
+    # The characteristic function of log(S_T / F) at u - i/2 for every maturity and node
+    shifted = u - 0.5j
+    PHI = heston_characteristic_function(asset_model, shifted[None, :], maturities[:, None])
+    PHI *= np.exp(-1j * shifted[None, :] * log_growth[:, None])
+
+    forward = initial_price * np.exp(log_growth[index])
+    k = np.log(forward / strikes)
+
+    integral = (np.real(np.exp(1j * k[:, None] * u) * PHI[index]) / (u ** 2 + 0.25)) @ weights
+    call = forward - np.sqrt(forward * strikes) / np.pi * integral
+
+    # Put-call parity
+    return np.where(call_option, call, call - (forward - strikes)).reshape(shape)
@@ -1,7 +1,14 @@
 from models import model
+from models.instrumentation import instrumented, phase
+from models.stratification import stratum_labels
+from algorithms.closed_form import merton_digital_price
+from algorithms.simulation import simulate_paths, weighted_average
+from algorithms.pde import pde_price
+from algorithms.lattice import lattice_price
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Cash_Digital_Option(
     asset_model: model,
     initial_price: float,
@@ -11,7 +18,9 @@ def Cash_Digital_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of a Cash-or-Nothing digital option using Monte Carlo simulation.
@@ -40,6 +49,19 @@ def Cash_Digital_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only), "importance_sampling" to shift the
+        simulated paths towards the strike (for deep out-of-the-money options), "analytic" for the
+        closed form (European exercise under a StationaryModel or JumpDiffusionModel), "pde" to solve
+        the pricing PDE on num_timesteps time steps, or "binomial" or "trinomial" for backward induction
+        on a lattice of num_timesteps steps (StationaryModel only, see algorithms/pde.py and
+        algorithms/lattice.py; early exercise is then optimal rather than perfect-foresight). Defaults
+        to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the terminal Brownian value to sample with
+        (proportional allocation, European exercise with the monte_carlo engine only). Defaults to
+        no stratification.
 
     Returns:
     --------
@@ -55,41 +77,79 @@ def Cash_Digital_Option(
         # For a put option, the payoff is received if the asset price is below the strike price
         exercise_value = lambda s: payoff if s < strike else 0
 
+    # Price European digitals in closed form with the analytic engine.
+    if engine == "analytic":
+        if not european_exercise:
+            raise ValueError("The analytic engine only prices European exercise")
+
+        if call_option:
+            return payoff * merton_digital_price(asset_model, initial_price, strike, np.inf, periods)
+        else:
+            return payoff * merton_digital_price(asset_model, initial_price, 0, strike, periods)
+
+    # Solve the pricing PDE by finite differences with the pde engine.
+    if engine == "pde":
+        return pde_price(
+            asset_model, initial_price, periods,
+            (lambda s: payoff * (s > strike)) if call_option else (lambda s: payoff * (s < strike)),
+            num_timesteps, early_exercise=not european_exercise, focus=(strike,)
+        )
+
+    # Roll the payoff back on a recombining lattice with the binomial and trinomial engines.
+    if engine in ("binomial", "trinomial"):
+        return lattice_price(
+            asset_model, initial_price, periods,
+            (lambda s: payoff * (s > strike)) if call_option else (lambda s: payoff * (s < strike)),
+            num_timesteps, early_exercise=not european_exercise, method=engine, levels=(strike,)
+        )
+
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,   # Initial price of the asset
-        T=periods,          # Time to maturity
-        M=num_simulations,  # Number of simulations
-        N=num_timesteps     # Number of time steps
-    )
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            periods,         # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain, jump-conditional or importance sampled simulation
+            target=strike,   # Level the importance sampled paths are centred on
+            stratified=stratified # Strata of the terminal Brownian value
+        )
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # For European-style options, calculate the payoff at maturity for each simulation.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(PRICE[i][-1])
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, calculate the payoff at maturity for each simulation.
+            VALUE = np.zeros(shape=(len(PRICE)))
         
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            for i in range(len(PRICE)):
+                VALUE[i] = exercise_value(PRICE[i][-1])
     
-    else:
-        # For American-style options, allow for early exercise.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, allow for early exercise.
+            VALUE = np.zeros(shape=(len(PRICE), num_timesteps + 1))
         
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
+            for i in range(len(PRICE)):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        # At the last timestep, the value is the payoff
+                        VALUE[i][t] = exercise_value(PRICE[i][t])
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        # Return the weighted average payoff across all simulations
+        return weighted_average(VALUE, WEIGHT, stratum_labels(num_simulations, stratified))
 
     
 
+@instrumented("num_simulations")
 def Asset_Digital_Option(
     asset_model: model,
     initial_price: float,
@@ -98,7 +158,9 @@ def Asset_Digital_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of an Asset-or-Nothing digital option using Monte Carlo simulation.
@@ -125,6 +187,19 @@ def Asset_Digital_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only), "importance_sampling" to shift the
+        simulated paths towards the strike (for deep out-of-the-money options), "analytic" for the
+        closed form (European exercise under a StationaryModel or JumpDiffusionModel), "pde" to solve
+        the pricing PDE on num_timesteps time steps, or "binomial" or "trinomial" for backward induction
+        on a lattice of num_timesteps steps (StationaryModel only, see algorithms/pde.py and
+        algorithms/lattice.py; early exercise is then optimal rather than perfect-foresight). Defaults
+        to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the terminal Brownian value to sample with
+        (proportional allocation, European exercise with the monte_carlo engine only). Defaults to
+        no stratification.
 
     Returns:
     --------
@@ -141,41 +216,79 @@ def Asset_Digital_Option(
         # For a put option, the payoff is the asset price if it is below the strike price
         exercise_value = lambda s: s if s < strike else 0
 
+    # Price European digitals in closed form with the analytic engine.
+    if engine == "analytic":
+        if not european_exercise:
+            raise ValueError("The analytic engine only prices European exercise")
+
+        if call_option:
+            return merton_digital_price(asset_model, initial_price, strike, np.inf, periods, asset_or_nothing=True)
+        else:
+            return merton_digital_price(asset_model, initial_price, 0, strike, periods, asset_or_nothing=True)
+
+    # Solve the pricing PDE by finite differences with the pde engine.
+    if engine == "pde":
+        return pde_price(
+            asset_model, initial_price, periods,
+            (lambda s: s * (s > strike)) if call_option else (lambda s: s * (s < strike)),
+            num_timesteps, early_exercise=not european_exercise, focus=(strike,)
+        )
+
+    # Roll the payoff back on a recombining lattice with the binomial and trinomial engines.
+    if engine in ("binomial", "trinomial"):
+        return lattice_price(
+            asset_model, initial_price, periods,
+            (lambda s: s * (s > strike)) if call_option else (lambda s: s * (s < strike)),
+            num_timesteps, early_exercise=not european_exercise, method=engine, levels=(strike,)
+        )
+
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,   # Initial price of the asset
-        T=periods,          # Time to maturity
-        M=num_simulations,  # Number of simulations
-        N=num_timesteps     # Number of time steps
-    )
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            periods,         # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain, jump-conditional or importance sampled simulation
+            target=strike,   # Level the importance sampled paths are centred on
+            stratified=stratified # Strata of the terminal Brownian value
+        )
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # For European-style options, calculate the payoff at maturity for each simulation.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(PRICE[i][-1])
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, calculate the payoff at maturity for each simulation.
+            VALUE = np.zeros(shape=(len(PRICE)))
         
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            for i in range(len(PRICE)):
+                VALUE[i] = exercise_value(PRICE[i][-1])
     
-    else:
-        # For American-style options, allow for early exercise.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, allow for early exercise.
+            VALUE = np.zeros(shape=(len(PRICE), num_timesteps + 1))
         
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
+            for i in range(len(PRICE)):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        # At the last timestep, the value is the payoff
+                        VALUE[i][t] = exercise_value(PRICE[i][t])
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        # Return the weighted average payoff across all simulations
+        return weighted_average(VALUE, WEIGHT, stratum_labels(num_simulations, stratified))
 
     
 
+@instrumented("num_simulations")
 def Cash_Double_Digital_Option(
     asset_model: model,
     initial_price: float,
@@ -185,7 +298,9 @@ def Cash_Double_Digital_Option(
     periods: int,
     num_simulations: int,
     num_timesteps: int,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of a Cash-or-Nothing Double Digital option using Monte Carlo simulation.
@@ -214,6 +329,18 @@ def Cash_Double_Digital_Option(
         The number of discrete time steps within each simulation path.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only), "analytic" for the closed form
+        (European exercise under a StationaryModel or JumpDiffusionModel), "pde" to solve the pricing
+        PDE on num_timesteps time steps, or "binomial" or "trinomial" for backward induction on a
+        lattice of num_timesteps steps (StationaryModel only, see algorithms/pde.py and
+        algorithms/lattice.py; early exercise is then optimal rather than perfect-foresight). Defaults
+        to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the terminal Brownian value to sample with
+        (proportional allocation, European exercise with the monte_carlo engine only). Defaults to
+        no stratification.
 
     Returns:
     --------
@@ -226,41 +353,73 @@ def Cash_Double_Digital_Option(
     # The payoff is received if the asset price is between the lower and upper strike prices.
     exercise_value = lambda s: payoff if lower_strike <= s <= upper_strike else 0
 
+    # Price European digitals in closed form with the analytic engine.
+    if engine == "analytic":
+        if not european_exercise:
+            raise ValueError("The analytic engine only prices European exercise")
+
+        return payoff * merton_digital_price(asset_model, initial_price, lower_strike, upper_strike, periods)
+
+    # Solve the pricing PDE by finite differences with the pde engine.
+    if engine == "pde":
+        return pde_price(
+            asset_model, initial_price, periods, lambda s: payoff * ((lower_strike <= s) & (s <= upper_strike)),
+            num_timesteps, early_exercise=not european_exercise, focus=(lower_strike, upper_strike)
+        )
+
+    # Roll the payoff back on a recombining lattice with the binomial and trinomial engines.
+    if engine in ("binomial", "trinomial"):
+        return lattice_price(
+            asset_model, initial_price, periods, lambda s: payoff * ((lower_strike <= s) & (s <= upper_strike)),
+            num_timesteps, early_exercise=not european_exercise, method=engine, levels=(lower_strike, upper_strike)
+        )
+
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,   # Initial price of the asset
-        T=periods,          # Time to maturity
-        M=num_simulations,  # Number of simulations
-        N=num_timesteps     # Number of time steps
-    )
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            periods,         # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain or jump-conditional simulation
+            stratified=stratified # Strata of the terminal Brownian value
+        )
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # For European-style options, calculate the payoff at maturity for each simulation.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(PRICE[i][-1])
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, calculate the payoff at maturity for each simulation.
+            VALUE = np.zeros(shape=(len(PRICE)))
         
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            for i in range(len(PRICE)):
+                VALUE[i] = exercise_value(PRICE[i][-1])
     
-    else:
-        # For American-style options, allow for early exercise.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, allow for early exercise.
+            VALUE = np.zeros(shape=(len(PRICE), num_timesteps + 1))
         
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
+            for i in range(len(PRICE)):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        # At the last timestep, the value is the payoff
+                        VALUE[i][t] = exercise_value(PRICE[i][t])
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        # Return the weighted average payoff across all simulations
+        return weighted_average(VALUE, WEIGHT, stratum_labels(num_simulations, stratified))
 
     
 
+@instrumented("num_simulations")
 def Asset_Double_Digital_Option(
     asset_model: model,
     initial_price: float,
@@ -269,7 +428,9 @@ def Asset_Double_Digital_Option(
     periods: int,
     num_simulations: int,
     num_timesteps: int,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of an Asset-or-Nothing Double Digital option using Monte Carlo simulation.
@@ -296,6 +457,18 @@ def Asset_Double_Digital_Option(
         The number of discrete time steps within each simulation path.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only), "analytic" for the closed form
+        (European exercise under a StationaryModel or JumpDiffusionModel), "pde" to solve the pricing
+        PDE on num_timesteps time steps, or "binomial" or "trinomial" for backward induction on a
+        lattice of num_timesteps steps (StationaryModel only, see algorithms/pde.py and
+        algorithms/lattice.py; early exercise is then optimal rather than perfect-foresight). Defaults
+        to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the terminal Brownian value to sample with
+        (proportional allocation, European exercise with the monte_carlo engine only). Defaults to
+        no stratification.
 
     Returns:
     --------
@@ -308,35 +481,68 @@ def Asset_Double_Digital_Option(
     # The payoff is the asset price if it is between the lower and upper strike prices.
     exercise_value = lambda s: s if lower_strike <= s <= upper_strike else 0
 
+    # Price European digitals in closed form with the analytic engine.
+    if engine == "analytic":
+        if not european_exercise:
+            raise ValueError("The analytic engine only prices European exercise")
+
+        return merton_digital_price(
+            asset_model, initial_price, lower_strike, upper_strike, periods, asset_or_nothing=True
+        )
+
+    # Solve the pricing PDE by finite differences with the pde engine.
+    if engine == "pde":
+        return pde_price(
+            asset_model, initial_price, periods, lambda s: s * ((lower_strike <= s) & (s <= upper_strike)),
+            num_timesteps, early_exercise=not european_exercise, focus=(lower_strike, upper_strike)
+        )
+
+    # Roll the payoff back on a recombining lattice with the binomial and trinomial engines.
+    if engine in ("binomial", "trinomial"):
+        return lattice_price(
+            asset_model, initial_price, periods, lambda s: s * ((lower_strike <= s) & (s <= upper_strike)),
+            num_timesteps, early_exercise=not european_exercise, method=engine, levels=(lower_strike, upper_strike)
+        )
+
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,   # Initial price of the asset
-        T=periods,          # Time to maturity
-        M=num_simulations,  # Number of simulations
-        N=num_timesteps     # Number of time steps
-    )
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            periods,         # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain or jump-conditional simulation
+            stratified=stratified # Strata of the terminal Brownian value
+        )
 
     # Calculate the option value based on the exercise style.
-    if european_exercise:
-        # For European-style options, calculate the payoff at maturity for each simulation.
-        VALUE = np.zeros(shape=(num_simulations))
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, calculate the payoff at maturity for each simulation.
+            VALUE = np.zeros(shape=(len(PRICE)))
         
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(PRICE[i][-1])
-        
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            for i in range(len(PRICE)):
+                VALUE[i] = exercise_value(PRICE[i][-1])
     
-    else:
-        # For American-style options, allow for early exercise.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, allow for early exercise.
+            VALUE = np.zeros(shape=(len(PRICE), num_timesteps + 1))
         
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    # At the last timestep, the value is the payoff
-                    VALUE[i][t] = exercise_value(PRICE[i][t])
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
+            for i in range(len(PRICE)):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        # At the last timestep, the value is the payoff
+                        VALUE[i][t] = exercise_value(PRICE[i][t])
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(PRICE[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        # Return the weighted average payoff across all simulations
+        return weighted_average(VALUE, WEIGHT, stratum_labels(num_simulations, stratified))
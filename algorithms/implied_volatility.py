@@ -0,0 +1,130 @@
+from algorithms.closed_form import norm_cdf, norm_pdf
+import numpy as np
+
+
+def implied_volatility(
+    prices,
+    forward,
+    strikes,
+    periods,
+    call_option=True,
+    tolerance: float = 1e-12,
+    max_iterations: int = 50
+):
+    """
+    Inverts the Black formula for a batch of option prices at once.
+
+    The prices are converted by put-call parity to the out-of-the-money option, whose value carries
+    the most significant digits, and the total standard deviation sigma sqrt(T) is found from the
+    Corrado-Miller rational initial guess with Householder iterations of order two (Halley's method)
+    on the logarithm of the price, using the closed form vega and volga. Every iterate is kept inside
+    a bracket of the root and replaced by bisection whenever a step leaves it, so the solver cannot
+    diverge. Quotes that have no implied volatility (below intrinsic value or above the forward,
+    non-positive inputs, NaN) or do not converge are reported in a failure mask rather than raising.
+
+    Parameters:
+    -----------
+    prices : float or ndarray
+        The undiscounted option prices, e.g. the output of the pricers.
+    forward : float or ndarray
+        The expected value of the underlying at maturity (initial_price * exp(mu * period) for the
+        models in this package).
+    strikes : float or ndarray
+        The strike prices of the options.
+    periods : float or ndarray
+        The times to maturity of the options.
+    call_option : bool or ndarray, optional
+        Whether each option is a call (True) or a put (False). Defaults to True.
+    tolerance : float, optional
+        The error relative to the out-of-the-money price below which a quote has converged. Defaults to 1e-12.
+    max_iterations : int, optional
+        The maximum number of iterations. Defaults to 50.
+
+    Returns:
+    --------
+    volatility : ndarray
+        The Black implied volatility of every quote, NaN where the inversion failed.
+    failed : ndarray
+        A boolean mask of the quotes without a valid implied volatility.
+    """
+
+    prices, forward, strikes, periods, call_option = np.broadcast_arrays(
+        np.asarray(prices, dtype=float),
+        np.asarray(forward, dtype=float),
+        np.asarray(strikes, dtype=float),
+        np.asarray(periods, dtype=float),
+        np.asarray(call_option, dtype=bool)
+    )
+
+    with np.errstate(all="ignore"):
+        # Price of the out-of-the-money option: a call above the forward, a put below it
+        theta = np.where(strikes >= forward, 1.0, -1.0)
+        call = prices + np.where(call_option, 0.0, forward - strikes)
+        target = call - np.maximum(forward - strikes, 0)
+
+        # An out-of-the-money price lies strictly between zero and the smaller of F and K
+        valid = (
+            (forward > 0) & (strikes > 0) & (periods > 0) &
+            (target > 0) & (target < np.minimum(forward, strikes)) & np.isfinite(target)
+        )
+
+        # Corrado-Miller initial guess from the call price, falling back to the moneyness scale
+        half_moneyness = 0.5 * (forward - strikes)
+        discriminant = np.maximum((call - half_moneyness) ** 2 - (forward - strikes) ** 2 / np.pi, 0)
+        s = np.sqrt(2 * np.pi) / (forward + strikes) * (call - half_moneyness + np.sqrt(discriminant))
+        s = np.where(np.isfinite(s) & (s > 0), s, np.sqrt(2 * np.abs(np.log(forward / strikes))) + 0.1)
+
+        # Iterate on the unresolved quotes only, keeping a bracket of each total standard deviation
+        index = np.flatnonzero(valid)
+        F, K, w, y = forward.ravel()[index], strikes.ravel()[index], theta.ravel()[index], target.ravel()[index]
+        x = s.ravel()[index]
+        log_moneyness = np.log(F / K)
+        lower = np.zeros_like(x)
+        upper = np.full_like(x, np.inf)
+
+        result = s.ravel().copy()
+        unresolved = np.zeros(s.size, dtype=bool)
+        unresolved[index] = True
+
+        for _ in range(max_iterations):
+            if not index.size:
+                break
+
+            d1 = log_moneyness / x + 0.5 * x
+            d2 = d1 - x
+            price = w * (F * norm_cdf(w * d1) - K * norm_cdf(w * d2))
+            error = price - y
+
+            # Retire the quotes priced to the relative tolerance, or whose bracket has collapsed to
+            # the rounding error of the price
+            converged = (np.abs(error) <= tolerance * y) | (upper - lower <= 4 * np.finfo(float).eps * x)
+            result[index[converged]] = x[converged]
+            unresolved[index[converged]] = False
+
+            keep = ~converged
+            index, F, K, w, y, x = index[keep], F[keep], K[keep], w[keep], y[keep], x[keep]
+            log_moneyness, lower, upper = log_moneyness[keep], lower[keep], upper[keep]
+            price, error, d1, d2 = price[keep], error[keep], d1[keep], d2[keep]
+
+            # The price increases with the standard deviation, which narrows the bracket
+            upper = np.where(error > 0, x, upper)
+            lower = np.where(error < 0, x, lower)
+
+            # Halley step on the log price, which is far closer to linear in the standard deviation
+            # than the price itself for out-of-the-money quotes
+            vega = F * norm_pdf(d1) / price
+            volga = vega * d1 * d2 / x - vega ** 2
+            newton = np.log(price / y) / vega
+            candidate = x - newton / (1 - 0.5 * newton * volga / vega)
+
+            # Bisect (or double an unbounded bracket) when the step leaves the bracket
+            outside = ~np.isfinite(candidate) | (candidate <= lower) | (candidate >= upper)
+            bisection = np.where(np.isfinite(upper), 0.5 * (lower + upper), 2 * x)
+            x = np.where(outside, bisection, candidate)
+
+        unresolved = unresolved.reshape(s.shape)
+        s = result.reshape(s.shape)
+
+        failed = ~valid | unresolved | ~np.isfinite(s)
+
+        return np.where(failed, np.nan, s / np.sqrt(periods)), failed
@@ -0,0 +1,140 @@
+"""
+Running path statistics of the path-dependent pricers, on the backend selected in models.kernels.
+
+Each kernel turns price paths of shape (M, N + 1) into the running state of every path at every
+time step in a single pass along the path.
+"""
+
+from models import kernels
+from models.kernels import jit, prange
+import numpy as np
+
+
+def running_mean(PRICE: np.ndarray, arithmetic_averaging: bool = True):
+    """
+    Computes the running arithmetic or geometric average of each price path.
+
+    Parameters:
+    -----------
+    PRICE : ndarray
+        The price paths with shape (M, N + 1).
+    arithmetic_averaging : bool, optional
+        Whether to average arithmetically (True) or geometrically (False). Defaults to True.
+
+    Returns:
+    --------
+    MEAN : ndarray
+        The average of the prices up to each time step, with shape (M, N + 1).
+    """
+
+    if kernels.BACKEND == "numba":
+        MEAN = np.empty(PRICE.shape)
+        _running_mean_compiled(PRICE, arithmetic_averaging, MEAN)
+        return MEAN
+
+    COUNT = np.arange(1, PRICE.shape[1] + 1)
+
+    if arithmetic_averaging:
+        return np.cumsum(PRICE, axis=1) / COUNT
+
+    return np.exp(np.cumsum(np.log(PRICE), axis=1) / COUNT)
+
+
+def running_extremum(PRICE: np.ndarray, maximum: bool = True):
+    """
+    Computes the running maximum or minimum of each price path.
+
+    Parameters:
+    -----------
+    PRICE : ndarray
+        The price paths with shape (M, N + 1).
+    maximum : bool, optional
+        Whether to track the maximum (True) or the minimum (False). Defaults to True.
+
+    Returns:
+    --------
+    MIN_MAX : ndarray
+        The extreme price up to each time step, with shape (M, N + 1).
+    """
+
+    if kernels.BACKEND == "numba":
+        MIN_MAX = np.empty(PRICE.shape)
+        _running_extremum_compiled(PRICE, maximum, MIN_MAX)
+        return MIN_MAX
+
+    if maximum:
+        return np.maximum.accumulate(PRICE, axis=1)
+
+    return np.minimum.accumulate(PRICE, axis=1)
+
+
+def barrier_hit(PRICE: np.ndarray, barrier: float, barrier_up: bool = True):
+    """
+    Tracks whether each price path has touched a barrier.
+
+    Parameters:
+    -----------
+    PRICE : ndarray
+        The price paths with shape (M, N + 1).
+    barrier : float
+        The barrier level.
+    barrier_up : bool, optional
+        Whether the barrier is hit from below (True) or from above (False). Defaults to True.
+
+    Returns:
+    --------
+    HIT_BARRIER : ndarray
+        Whether the barrier has been hit up to each time step, with shape (M, N + 1).
+    """
+
+    if kernels.BACKEND == "numba":
+        HIT_BARRIER = np.empty(PRICE.shape, dtype=np.bool_)
+        _barrier_hit_compiled(PRICE, barrier, barrier_up, HIT_BARRIER)
+        return HIT_BARRIER
+
+    if barrier_up:
+        return np.logical_or.accumulate(PRICE >= barrier, axis=1)
+
+    return np.logical_or.accumulate(PRICE <= barrier, axis=1)
+
+
+def _running_mean_loop(PRICE, arithmetic_averaging, MEAN):
+    M, N = PRICE.shape
+
+    for i in prange(M):
+        total = 0.0
+
+        for t in range(N):
+            if arithmetic_averaging:
+                total += PRICE[i, t]
+                MEAN[i, t] = total / (t + 1)
+            else:
+                total += np.log(PRICE[i, t])
+                MEAN[i, t] = np.exp(total / (t + 1))
+
+
+def _running_extremum_loop(PRICE, maximum, MIN_MAX):
+    M, N = PRICE.shape
+
+    for i in prange(M):
+        extremum = PRICE[i, 0]
+
+        for t in range(N):
+            extremum = max(extremum, PRICE[i, t]) if maximum else min(extremum, PRICE[i, t])
+            MIN_MAX[i, t] = extremum
+
+
+def _barrier_hit_loop(PRICE, barrier, barrier_up, HIT_BARRIER):
+    M, N = PRICE.shape
+
+    for i in prange(M):
+        hit = False
+
+        for t in range(N):
+            hit = hit or (PRICE[i, t] >= barrier if barrier_up else PRICE[i, t] <= barrier)
+            HIT_BARRIER[i, t] = hit
+
+
+_running_mean_compiled = jit(_running_mean_loop)
+_running_extremum_compiled = jit(_running_extremum_loop)
+_barrier_hit_compiled = jit(_barrier_hit_loop)
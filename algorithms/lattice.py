@@ -0,0 +1,269 @@
+"""
+Recombining binomial and trinomial lattices for single-asset contracts under a StationaryModel.
+
+The log price moves by +dx or -dx (binomial), or by +dx, 0 or -dx (trinomial) every time step, with
+probabilities matching the drift and variance of geometric Brownian motion, so the lattice recombines
+and slice t holds only t + 1 or 2t + 1 nodes. The expected payoff (undiscounted, like the Monte Carlo
+pricers) is rolled back from maturity one slice at a time with vectorized expectations, taking the
+exercise value where it is larger (optimal early exercise) and applying the barrier on every
+monitored slice. The prices of every slice are a window of the terminal slice's, so only one slice
+of values is kept unless all are requested.
+
+How the nodes fall relative to a barrier or the edges of a digital band decides how fast a lattice
+converges, so the trinomial lattice is placed with these levels on nodes: its spacing fits a whole
+number of steps between the two outermost levels, and its first step branches from the initial price
+(which then lies between nodes) to the three nodes around its expected move with matched moments.
+The binomial lattice stays centred on the initial price and instead takes the number of steps that
+places a barrier (nearly) on a node. Both average discontinuous payoffs over the cells of the terminal
+nodes, and under discrete monitoring count the nodes around the barrier by the fraction of their cell
+beyond it.
+"""
+
+from models import StationaryModel
+from models.batching import batch_shape
+from algorithms.pde import cell_average
+import numpy as np
+
+
+def lattice_price(
+    asset_model: StationaryModel,
+    initial_price: float,
+    period: float,
+    payoff,
+    num_timesteps: int,
+    early_exercise: bool = False,
+    method: str = "trinomial",
+    levels: tuple = (),
+    barrier: float = None,
+    barrier_up: bool = True,
+    knock_in: bool = False,
+    observation_times: np.ndarray = None,
+    store_slices: bool = False
+):
+    """
+    Calculates the expected payoff of a single-asset contract by backward induction on a recombining lattice.
+
+    Parameters:
+    -----------
+    asset_model : StationaryModel
+        The geometric Brownian motion of the underlying asset.
+    initial_price : float
+        The initial price of the underlying asset.
+    period : float
+        The time to maturity of the contract, typically expressed in years.
+    payoff : callable
+        The payoff (and exercise value) as a function of an array of prices.
+    num_timesteps : int
+        The number of time steps (slices after the initial one) of the lattice. With a barrier, the
+        binomial lattice takes the nearby number of steps that places the barrier on a node.
+    early_exercise : bool, optional
+        Whether the payoff may be received at any time step. Defaults to False.
+    method : str, optional
+        "trinomial" or "binomial". Defaults to "trinomial".
+    levels : tuple, optional
+        Prices at which the payoff jumps (e.g. the edges of a digital band), placed on nodes by the
+        trinomial lattice together with the barrier (the two outermost of them exactly).
+    barrier : float, optional
+        The barrier level of a knock-in or knock-out contract. Defaults to no barrier.
+    barrier_up : bool, optional
+        Whether the barrier is an upper (True) or lower (False) barrier. Defaults to True.
+    knock_in : bool, optional
+        Whether the payoff is only received once the barrier is hit (True) or lost when it is hit
+        (False). Defaults to False.
+    observation_times : ndarray, optional
+        The times in (0, period] at which the barrier is monitored, on the nearest slices (as well as
+        the initial price and maturity). Defaults to monitoring every slice.
+    store_slices : bool, optional
+        Whether to also return the prices and values of every slice, which takes O(N^2) memory
+        rather than O(N). Defaults to False.
+
+    Returns:
+    --------
+    float
+        The expected payoff of the contract.
+    slices : list[tuple[ndarray, ndarray]]
+        With store_slices, the node prices and values of every slice from the initial one to maturity
+        (the initial slice holding the initial price alone).
+    """
+
+    if not isinstance(asset_model, StationaryModel) or batch_shape(asset_model):
+        raise ValueError(f"The lattice engines require a StationaryModel with scalar parameters, got {type(asset_model).__name__}")
+
+    if method not in ("binomial", "trinomial"):
+        raise ValueError(f"Unknown lattice method '{method}', expected 'binomial' or 'trinomial'")
+
+    N = num_timesteps
+    dt = period / N
+    mu, sigma = float(asset_model.mu), float(asset_model.sigma)
+    x0 = np.log(initial_price)
+
+    # Log prices of the terminal slice (every other one for the binomial lattice), whose windows are
+    # the earlier slices, and the branching probabilities of a step (and of the first)
+    if method == "trinomial":
+        anchors = ([] if barrier is None else [np.log(barrier)]) + [np.log(level) for level in levels if level > 0]
+        dx, base = trinomial_spacing(x0, mu, sigma, dt, anchors)
+        drift = (mu - 0.5 * sigma ** 2) * dt
+
+        # The first step branches from the initial price to the nodes around its expected log price
+        centre = int(np.round((x0 + drift - base) / dx))
+        LOG = base + (centre + np.arange(-N, N + 1)) * dx
+        stride = 1
+
+        probabilities = trinomial_probabilities(drift / dx, sigma ** 2 * dt / dx ** 2)
+        first = trinomial_probabilities((x0 + drift - base) / dx - centre, sigma ** 2 * dt / dx ** 2)
+    else:
+        # The number of time steps (near num_timesteps) with the barrier a whole number of spacings
+        # sigma sqrt(dt) from the initial price, up to rounding (Boyle and Lau), unless it needs many more
+        if barrier is not None and barrier != initial_price:
+            distance = abs(np.log(barrier) - x0)
+            steps = max(int(np.round(distance / (sigma * np.sqrt(dt)))), 1)
+            aligned = max(int(np.floor((steps * sigma / distance) ** 2 * period)), 1)
+
+            if aligned <= 4 * num_timesteps:
+                N, dt = aligned, period / aligned
+
+        dx = sigma * np.sqrt(dt)
+        LOG = x0 + np.arange(-N, N + 1) * dx
+        stride = 2
+
+        # The up probability matching the expected price growth over a step
+        p = (np.exp(mu * dt) - np.exp(-dx)) / (np.exp(dx) - np.exp(-dx))
+        if not 0 < p < 1:
+            raise ValueError("The binomial lattice's branching probability leaves (0, 1); increase num_timesteps")
+
+        probabilities = first = (1 - p, p)
+
+    PRICE = np.exp(LOG)
+    nodes = lambda t: slice(N - t, N + t + 1, stride)
+
+    # Terminal values averaged over the cells of the nodes, and point exercise values
+    TERMINAL = cell_average(payoff, PRICE[nodes(N)])
+    EXERCISE = payoff(PRICE).astype(float)
+
+    # The knocked fraction of every node and the monitored slices: under continuous monitoring the
+    # nodes on or beyond the barrier (with a tolerance for the nodes placed on it), under discrete
+    # monitoring the fraction of the node's cell beyond the barrier, so a node on it counts half
+    if barrier is None:
+        KNOCKED = np.zeros(len(PRICE))
+        monitored = np.zeros(N + 1, dtype=np.bool_)
+    elif observation_times is None:
+        tolerance = 1e-9 * dx
+        KNOCKED = (LOG >= np.log(barrier) - tolerance if barrier_up else LOG <= np.log(barrier) + tolerance).astype(float)
+        monitored = np.ones(N + 1, dtype=np.bool_)
+    else:
+        beyond = (LOG - np.log(barrier) if barrier_up else np.log(barrier) - LOG) / (stride * dx)
+        KNOCKED = np.clip(beyond + 0.5, 0.0, 1.0)
+        monitored = np.zeros(N + 1, dtype=np.bool_)
+        monitored[np.clip(np.round(np.asarray(observation_times, dtype=float) / dt).astype(int), 1, N)] = True
+
+    # The plain contract, and the contract before the barrier is hit: taking the plain value on the
+    # knocked nodes (knock-in, never exercised before) or worth nothing there (knock-out)
+    VALUE = TERMINAL
+    ALIVE = None
+    if barrier is not None:
+        ALIVE = VALUE * (KNOCKED[nodes(N)] if knock_in else 1 - KNOCKED[nodes(N)])
+
+    slices = [(PRICE[nodes(N)], (VALUE if ALIVE is None else ALIVE).copy())] if store_slices else None
+
+    for t in range(N - 1, -1, -1):
+        # Expectations over the branches of every node of slice t
+        branching = first if method == "trinomial" and t == 0 else probabilities
+        VALUE = _expectation(VALUE, branching)
+        if ALIVE is not None:
+            ALIVE = _expectation(ALIVE, branching)
+
+        # The initial slice holds the initial price alone
+        if method == "trinomial" and t == 0:
+            SLICE, EXERCISED = np.array([initial_price]), payoff(np.array([initial_price])).astype(float)
+        else:
+            SLICE, EXERCISED = PRICE[nodes(t)], EXERCISE[nodes(t)]
+
+        # Exercise where the payoff exceeds continuing (only once knocked in), then knock in or out
+        if early_exercise:
+            VALUE = np.maximum(VALUE, EXERCISED)
+            if ALIVE is not None and not knock_in:
+                ALIVE = np.maximum(ALIVE, EXERCISED)
+
+        if ALIVE is not None and monitored[t] and t > 0:
+            ALIVE = ALIVE + KNOCKED[nodes(t)] * ((VALUE if knock_in else 0.0) - ALIVE)
+
+        if store_slices:
+            slices.append((SLICE, (VALUE if ALIVE is None else ALIVE).copy()))
+
+    # The barrier is also monitored at the initial price
+    if barrier is None:
+        price = VALUE[0]
+    elif initial_price >= barrier if barrier_up else initial_price <= barrier:
+        price = VALUE[0] if knock_in else 0.0
+    else:
+        price = ALIVE[0]
+
+    if store_slices:
+        return float(price), slices[::-1]
+
+    return float(price)
+
+
+def trinomial_spacing(x0: float, mu: float, sigma: float, dt: float, anchors: list):
+    """
+    Chooses the log price spacing and a node of the trinomial lattice.
+
+    The spacing defaults to sigma sqrt(3 dt) with the initial price on a node. With anchor levels,
+    a node is placed on the lowest of them and the spacing fits a whole number of steps between the
+    outermost two, no finer than the moment-matched first step allows (sigma sqrt(4 dt / 3)).
+
+    Returns:
+    --------
+    dx : float
+        The log price spacing.
+    base : float
+        The log price of a node.
+    """
+
+    dx = sigma * np.sqrt(3 * dt)
+
+    if not anchors:
+        return dx, x0
+
+    span = max(anchors) - min(anchors)
+    if span > 0:
+        steps = max(int(np.round(span / dx)), 1)
+
+        # The finest spacing keeping the first step's branching probabilities valid
+        finest = sigma * np.sqrt(4 * dt / 3)
+        if span / steps < finest:
+            steps = int(np.floor(span / finest))
+
+            if steps == 0:
+                raise ValueError("The levels are closer than one lattice step; increase num_timesteps")
+
+        dx = span / steps
+
+    return dx, min(anchors)
+
+
+def trinomial_probabilities(offset: float, variance: float):
+    """
+    Returns the down, middle and up probabilities of a trinomial step whose expected log price move
+    is offset node spacings from the middle node, with variance (in squared spacings) of the move.
+    """
+
+    up = 0.5 * (variance + offset ** 2 + offset)
+    down = 0.5 * (variance + offset ** 2 - offset)
+    middle = 1 - variance - offset ** 2
+
+    if min(up, middle, down) < 0:
+        raise ValueError("The trinomial branching probabilities leave [0, 1]; increase num_timesteps")
+
+    return down, middle, up
+
+
+def _expectation(VALUE: np.ndarray, probabilities: tuple):
+    """
+    Rolls a slice of values back one step, the probabilities weighting its consecutive windows.
+    """
+
+    if len(probabilities) == 2:
+        return probabilities[0] * VALUE[:-1] + probabilities[1] * VALUE[1:]
+
+    return probabilities[0] * VALUE[:-2] + probabilities[1] * VALUE[1:-1] + probabilities[2] * VALUE[2:]
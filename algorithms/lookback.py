@@ -1,7 +1,12 @@
 from models import model
+from models.instrumentation import instrumented, phase
+from algorithms.simulation import simulate_paths, weighted_average, observation_grid
+from algorithms.kernels import running_extremum
+from algorithms.bridge import step_variance, bridge_extremum
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Fixed_Strike_Lookback_Option(
     asset_model: model,
     initial_price: float,
@@ -10,7 +15,10 @@ def Fixed_Strike_Lookback_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    observation_times: np.ndarray = None,
+    bridge_correction: str = None
 ):
     """
     Calculates the price of a Fixed-Strike Lookback option using Monte Carlo simulation.
@@ -37,6 +45,17 @@ def Fixed_Strike_Lookback_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, or "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only). Defaults to "monte_carlo".
+    observation_times : ndarray, optional
+        The increasing times in (0, period] at which the price is monitored (the maturity is always
+        observed), e.g. daily or monthly dates. When given, the paths are simulated at these dates
+        only and num_timesteps is ignored. Defaults to monitoring every time step.
+    bridge_correction : str, optional
+        "sample" to monitor the price continuously, drawing the extremum of the Brownian bridge between
+        every two time steps from its closed form distribution (without observation_times only).
+        Defaults to None, monitoring the time steps only.
 
     Returns:
     --------
@@ -46,66 +65,66 @@ def Fixed_Strike_Lookback_Option(
     """
 
 
+    if bridge_correction not in (None, "sample"):
+        raise ValueError(f"Unknown bridge correction '{bridge_correction}', expected 'sample'")
+
+    if bridge_correction is not None and observation_times is not None:
+        raise ValueError("The bridge correction approximates continuous monitoring, not observation_times")
+
+    # The price is always observed at maturity.
+    observation_times = observation_grid(observation_times, period)
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,  # Initial price of the asset
-        T=period,          # Time to maturity
-        M=num_simulations, # Number of simulations
-        N=num_timesteps    # Number of time steps
-    )
-
-    # Initialize an array to track the running minimum or maximum of the asset's price.
-    MIN_MAX = np.zeros(shape=(num_simulations, num_timesteps + 1))
-
-    if call_option:
-        # For a call option, the payoff is based on the maximum asset price during the option's life.
-        # The exercise value is the maximum price minus the strike price, or zero if the strike is not exceeded.
-        exercise_value = lambda maximum: max(maximum - strike, 0)
-        
-        # Calculate the running maximum for each simulation.
-        for i in range(num_simulations):
-            MIN_MAX[i][0] = PRICE[i][0]  # Initialize the first element to the initial price
-            for t in range(1, num_timesteps + 1):
-                MIN_MAX[i][t] = max(MIN_MAX[i][t - 1], PRICE[i][t])  # Update with the maximum price up to time t
-
-    else:
-        # For a put option, the payoff is based on the minimum asset price during the option's life.
-        # The exercise value is the strike price minus the minimum price, or zero if the minimum is not below the strike.
-        exercise_value = lambda minimum: max(strike - minimum, 0)
-        
-        # Calculate the running minimum for each simulation.
-        for i in range(num_simulations):
-            MIN_MAX[i][0] = PRICE[i][0]  # Initialize the first element to the initial price
-            for t in range(1, num_timesteps + 1):
-                MIN_MAX[i][t] = min(MIN_MAX[i][t - 1], PRICE[i][t])  # Update with the minimum price up to time t
-
-    if european_exercise:
-        # For European-style options, the option can only be exercised at maturity.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        # Calculate the payoff at maturity for each simulation.
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(MIN_MAX[i][-1])  # Payoff is based on the final running max/min
-        
-        return np.mean(VALUE)  # Return the average payoff across all simulations
-    
-    else:
-        # For American-style options, the option can be exercised at any time before or at maturity.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
-        
-        # Calculate the option value using backward induction, allowing for early exercise.
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    VALUE[i][t] = exercise_value(MIN_MAX[i][t])  # At the last timestep, the value is the payoff
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(MIN_MAX[i][t]), VALUE[i][t + 1])
-        
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            period,          # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain or jump-conditional simulation
+            observation_times # Monitoring dates, or every time step
+        )
+
+    # Calculate the running minimum or maximum of the asset's price for each simulation.
+    with phase("state", paths=num_simulations):
+        if call_option:
+            # For a call option, the payoff is based on the maximum asset price during the option's life.
+            # The exercise value is the maximum price minus the strike price, or zero if the strike is not exceeded.
+            exercise_value = lambda maximum: np.maximum(maximum - strike, 0)
+        else:
+            # For a put option, the payoff is based on the minimum asset price during the option's life.
+            # The exercise value is the strike price minus the minimum price, or zero if the minimum is not below the strike.
+            exercise_value = lambda minimum: np.maximum(strike - minimum, 0)
+
+        if bridge_correction == "sample":
+            # Include the extremum of the price within every step
+            MIN_MAX = running_extremum(
+                bridge_extremum(
+                    PRICE, call_option, step_variance(asset_model, period, num_timesteps, observation_times)
+                ),
+                maximum=call_option
+            )
+        else:
+            MIN_MAX = running_extremum(PRICE, maximum=call_option)
+
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, the option can only be exercised at maturity.
+            VALUE = exercise_value(MIN_MAX[:, -1])  # Payoff is based on the final running max/min
+
+        else:
+            # For American-style options, the option can be exercised at any time before or at maturity.
+            # Backward induction, comparing the payoff to continuing from maturity, leaves the best
+            # payoff along each simulation.
+            VALUE = np.max(exercise_value(MIN_MAX), axis=1)
+
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT)  # Return the weighted average payoff across all simulations
 
     
 
+@instrumented("num_simulations")
 def Floating_Strike_Lookback_Option(
     asset_model: model,
     initial_price: float,
@@ -113,7 +132,10 @@ def Floating_Strike_Lookback_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    engine: str = "monte_carlo",
+    observation_times: np.ndarray = None,
+    bridge_correction: str = None
 ):
     """
     Calculates the price of a Floating-Strike Lookback option using Monte Carlo simulation.
@@ -138,6 +160,17 @@ def Floating_Strike_Lookback_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, or "conditional" to stratify the simulated
+        paths by their number of jumps (JumpDiffusionModel only). Defaults to "monte_carlo".
+    observation_times : ndarray, optional
+        The increasing times in (0, period] at which the price is monitored (the maturity is always
+        observed), e.g. daily or monthly dates. When given, the paths are simulated at these dates
+        only and num_timesteps is ignored. Defaults to monitoring every time step.
+    bridge_correction : str, optional
+        "sample" to monitor the price continuously, drawing the extremum of the Brownian bridge between
+        every two time steps from its closed form distribution (without observation_times only).
+        Defaults to None, monitoring the time steps only.
 
     Returns:
     --------
@@ -147,60 +180,59 @@ def Floating_Strike_Lookback_Option(
     """
 
 
+    if bridge_correction not in (None, "sample"):
+        raise ValueError(f"Unknown bridge correction '{bridge_correction}', expected 'sample'")
+
+    if bridge_correction is not None and observation_times is not None:
+        raise ValueError("The bridge correction approximates continuous monitoring, not observation_times")
+
+    # The price is always observed at maturity.
+    observation_times = observation_grid(observation_times, period)
+
     # Simulate the price path for the underlying asset.
-    PRICE = asset_model.simulate(
-        S0=initial_price,  # Initial price of the asset
-        T=period,          # Time to maturity
-        M=num_simulations, # Number of simulations
-        N=num_timesteps    # Number of time steps
-    )
-
-    # Initialize an array to track the running minimum or maximum of the asset's price.
-    MIN_MAX = np.zeros(shape=(num_simulations, num_timesteps + 1))
-
-    if call_option:
-        # For a call option, the payoff is based on the difference between the maximum price and the asset price.
-        # The exercise value is the maximum price minus the current price, or zero if the current price is not exceeded.
-        exercise_value = lambda maximum, price: max(maximum - price, 0)
-        
-        # Calculate the running maximum for each simulation.
-        for i in range(num_simulations):
-            MIN_MAX[i][0] = PRICE[i][0]  # Initialize the first element to the initial price
-            for t in range(1, num_timesteps + 1):
-                MIN_MAX[i][t] = max(MIN_MAX[i][t - 1], PRICE[i][t])  # Update with the maximum price up to time t
-
-    else:
-        # For a put option, the payoff is based on the difference between the asset price and the minimum price.
-        # The exercise value is the current price minus the minimum price, or zero if the minimum is not exceeded.
-        exercise_value = lambda minimum, price: max(price - minimum, 0)
-        
-        # Calculate the running minimum for each simulation.
-        for i in range(num_simulations):
-            MIN_MAX[i][0] = PRICE[i][0]  # Initialize the first element to the initial price
-            for t in range(1, num_timesteps + 1):
-                MIN_MAX[i][t] = min(MIN_MAX[i][t - 1], PRICE[i][t])  # Update with the minimum price up to time t
-
-    if european_exercise:
-        # For European-style options, the option can only be exercised at maturity.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        # Calculate the payoff at maturity for each simulation.
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(MIN_MAX[i][-1], PRICE[i][-1])  # Payoff is based on the final running max/min and final price
-        
-        return np.mean(VALUE)  # Return the average payoff across all simulations
-    
-    else:
-        # For American-style options, the option can be exercised at any time before or at maturity.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
-        
-        # Calculate the option value using backward induction, allowing for early exercise.
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    VALUE[i][t] = exercise_value(MIN_MAX[i][t], PRICE[i][t])  # At the last timestep, the value is the payoff
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(MIN_MAX[i][t], PRICE[i][t]), VALUE[i][t + 1])
-        
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+    with phase("simulate", paths=num_simulations):
+        PRICE, WEIGHT = simulate_paths(
+            asset_model,
+            initial_price,   # Initial price of the asset
+            period,          # Time to maturity
+            num_simulations, # Number of simulations
+            num_timesteps,   # Number of time steps
+            engine,          # Plain or jump-conditional simulation
+            observation_times # Monitoring dates, or every time step
+        )
+
+    # Calculate the running minimum or maximum of the asset's price for each simulation.
+    with phase("state", paths=num_simulations):
+        if call_option:
+            # For a call option, the payoff is based on the difference between the maximum price and the asset price.
+            # The exercise value is the maximum price minus the current price, or zero if the current price is not exceeded.
+            exercise_value = lambda maximum, price: np.maximum(maximum - price, 0)
+        else:
+            # For a put option, the payoff is based on the difference between the asset price and the minimum price.
+            # The exercise value is the current price minus the minimum price, or zero if the minimum is not exceeded.
+            exercise_value = lambda minimum, price: np.maximum(price - minimum, 0)
+
+        if bridge_correction == "sample":
+            # Include the extremum of the price within every step
+            MIN_MAX = running_extremum(
+                bridge_extremum(
+                    PRICE, call_option, step_variance(asset_model, period, num_timesteps, observation_times)
+                ),
+                maximum=call_option
+            )
+        else:
+            MIN_MAX = running_extremum(PRICE, maximum=call_option)
+
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, the option can only be exercised at maturity.
+            VALUE = exercise_value(MIN_MAX[:, -1], PRICE[:, -1])  # Payoff is based on the final running max/min and final price
+
+        else:
+            # For American-style options, the option can be exercised at any time before or at maturity.
+            # Backward induction, comparing the payoff to continuing from maturity, leaves the best
+            # payoff along each simulation.
+            VALUE = np.max(exercise_value(MIN_MAX, PRICE), axis=1)
+
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT)  # Return the weighted average payoff across all simulations
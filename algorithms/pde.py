@@ -0,0 +1,494 @@
+"""
+Crank-Nicolson finite difference engine for single-asset contracts under a StationaryModel.
+
+The expected payoff u(S, tau) of a contract with time tau left to maturity solves the backward
+Kolmogorov equation of geometric Brownian motion,
+
+    du/dtau = mu S du/dS + 0.5 sigma^2 S^2 d2u/dS2,
+
+undiscounted like the Monte Carlo pricers. It is discretized on a non-uniform price grid concentrated
+around the initial price, the strikes and the barriers (every barrier lying on a node), and stepped
+backwards from the payoff with Crank-Nicolson. Discontinuous payoffs are averaged over the cells of
+their nodes, and the first steps after maturity and after every monitoring date are replaced by
+implicit half steps (Rannacher start-up), which damps the oscillations Crank-Nicolson leaves behind
+discontinuities. Every step solves a tridiagonal system with the Thomas algorithm, and early
+exercise is enforced with the penalty method (the exercised nodes are found by iterating the solve).
+
+Early exercise is valued as an optimal stopping problem (exercise when the payoff exceeds the value
+of continuing), unlike the perfect-foresight maximum of the Monte Carlo engines, and barriers are
+monitored continuously unless monitoring dates are given.
+"""
+
+from models import StationaryModel
+from models.batching import batch_shape
+from models.kernels import jit
+from models import kernels
+import functools
+import numpy as np
+
+
+# The penalty weight enforcing the early exercise constraint, relative to the unit diagonal of a step.
+PENALTY = 1e8
+
+
+def pde_price(
+    asset_model: StationaryModel,
+    initial_price: float,
+    period: float,
+    payoff,
+    num_timesteps: int,
+    num_nodes: int = None,
+    early_exercise: bool = False,
+    focus: tuple = (),
+    barrier: float = None,
+    barrier_up: bool = True,
+    knock_in: bool = False,
+    observation_times: np.ndarray = None
+):
+    """
+    Calculates the expected payoff of a single-asset contract by solving its pricing PDE.
+
+    Parameters:
+    -----------
+    asset_model : StationaryModel
+        The geometric Brownian motion of the underlying asset.
+    initial_price : float
+        The initial price of the underlying asset.
+    period : float
+        The time to maturity of the contract, typically expressed in years.
+    payoff : callable
+        The payoff (and exercise value) as a function of an array of prices.
+    num_timesteps : int
+        The number of time steps to maturity.
+    num_nodes : int, optional
+        The number of price nodes. Defaults to 2 * num_timesteps + 1, at least 201.
+    early_exercise : bool, optional
+        Whether the payoff may be received at any time step. Defaults to False.
+    focus : tuple, optional
+        Prices at which the payoff changes abruptly (e.g. strikes), around which the grid is concentrated.
+    barrier : float, optional
+        The barrier level of a knock-in or knock-out contract. Defaults to no barrier.
+    barrier_up : bool, optional
+        Whether the barrier is an upper (True) or lower (False) barrier. Defaults to True.
+    knock_in : bool, optional
+        Whether the payoff is only received once the barrier is hit (True) or lost when it is hit
+        (False). Defaults to False.
+    observation_times : ndarray, optional
+        The times in (0, period] at which the barrier is monitored (as well as the initial price and
+        maturity). Defaults to continuous monitoring.
+
+    Returns:
+    --------
+    float
+        The expected payoff of the contract.
+    """
+
+    if not isinstance(asset_model, StationaryModel) or batch_shape(asset_model):
+        raise ValueError(f"The pde engine requires a StationaryModel with scalar parameters, got {type(asset_model).__name__}")
+
+    if num_nodes is None:
+        num_nodes = max(2 * num_timesteps + 1, 201)
+
+    anchors = () if barrier is None else (float(barrier),)
+    monitoring = () if barrier is None or observation_times is None else tuple(np.asarray(observation_times, dtype=float).tolist())
+    S, lower, diag, upper, dtau, theta, monitor = _discretization(
+        float(initial_price), float(period), float(asset_model.mu), float(asset_model.sigma), num_nodes, num_timesteps,
+        tuple(float(point) for point in focus) + anchors, anchors, monitoring
+    )
+
+    # Terminal values averaged over the cells of the nodes, and point exercise values
+    TERMINAL = cell_average(payoff, S)
+    EXERCISE = payoff(S).astype(float)
+
+    if barrier is None:
+        # A single layer with no knocked nodes
+        KNOCKED = np.zeros(len(S))
+        VALUE, EXERCISES, source = TERMINAL[None], EXERCISE[None], np.array([-1])
+        early = np.array([early_exercise])
+    else:
+        # The nodes on or beyond the barrier, held at their knocked values under continuous monitoring,
+        # or the fraction of every node's cell beyond it, reset at the monitoring dates
+        hit = (lambda s: s >= barrier) if barrier_up else (lambda s: s <= barrier)
+        KNOCKED = hit(S).astype(float) if observation_times is None else cell_average(hit, S)
+
+        if knock_in:
+            # The contract once knocked in (a plain one), and before, taking its value on the knocked nodes
+            VALUE = np.stack([TERMINAL, cell_average(lambda s: payoff(s) * hit(s), S)])
+            EXERCISES = np.stack([EXERCISE, np.zeros(len(S))])
+            source, early = np.array([-1, 0]), np.array([early_exercise, False])
+        else:
+            # The contract alive, worth nothing on the knocked nodes
+            VALUE = cell_average(lambda s: payoff(s) * ~hit(s), S)[None]
+            EXERCISES = EXERCISE[None]
+            source, early = np.array([-2]), np.array([early_exercise])
+
+    backward_induction(
+        VALUE, EXERCISES, early, source, KNOCKED, lower, diag, upper, dtau, theta, monitor,
+        continuous=barrier is not None and observation_times is None
+    )
+
+    # The barrier is also monitored at the initial price
+    if barrier is not None and (initial_price >= barrier if barrier_up else initial_price <= barrier):
+        return float(np.interp(initial_price, S, VALUE[0])) if knock_in else 0.0
+
+    return float(np.interp(initial_price, S, VALUE[-1]))
+
+
+@functools.lru_cache(maxsize=256)
+def _discretization(
+    initial_price: float,
+    period: float,
+    mu: float,
+    sigma: float,
+    num_nodes: int,
+    num_timesteps: int,
+    focus: tuple,
+    anchors: tuple,
+    monitoring: tuple
+):
+    """
+    Returns the (read-only) grid, generator and time steps of a contract, computed once per set of
+    arguments, since the contracts of a book mostly share them.
+    """
+
+    S = pde_grid(initial_price, period, mu, sigma, num_nodes, focus, anchors)
+    arrays = (S,) + pde_operator(S, mu, sigma) + pde_time_steps(period, num_timesteps, monitoring)
+
+    for array in arrays:
+        array.setflags(write=False)
+
+    return arrays
+
+
+def pde_grid(
+    initial_price: float,
+    period: float,
+    mu: float,
+    sigma: float,
+    num_nodes: int,
+    focus: tuple = (),
+    anchors: tuple = ()
+):
+    """
+    Builds a price grid from zero to well beyond the likely prices at maturity, concentrated around
+    the initial price and the focus points.
+
+    The node density is a sum of 1 / sqrt(w^2 + (S - c)^2) over the concentration points c (the grid
+    is then a sinh mapping of a uniform grid around a single point), with the width w a tenth of the
+    standard deviation of the price at maturity. The anchors (and the initial price unless an anchor
+    takes its node) are moved onto their nearest nodes.
+
+    Returns:
+    --------
+    S : ndarray
+        The increasing price nodes with shape (num_nodes,), starting at zero.
+    """
+
+    points = np.array((initial_price,) + tuple(focus), dtype=float)
+    spread = max(sigma * np.sqrt(period), 0.01)
+    width = 0.1 * spread * initial_price
+    highest = points.max() * np.exp(max(mu, 0.0) * period + 6 * spread)
+
+    # The cumulative density sum(asinh((S - c) / w)), inverted on a fine mesh
+    mesh = np.linspace(0.0, highest, 16 * num_nodes + 1)
+    cumulative = np.arcsinh((mesh[:, None] - points) / width).sum(axis=1)
+    S = np.interp(np.linspace(cumulative[0], cumulative[-1], num_nodes), cumulative, mesh)
+
+    # Move the initial price and then the anchors (which take precedence) onto nodes
+    for point in (initial_price,) + tuple(anchors):
+        index = np.argmin(np.abs(S - point))
+
+        if 0 < index < num_nodes - 1:
+            S[index] = point
+
+    S[0] = 0.0
+
+    return S
+
+
+def pde_operator(S: np.ndarray, mu: float, sigma: float):
+    """
+    Discretizes the generator mu S d/dS + 0.5 sigma^2 S^2 d2/dS2 on a non-uniform grid.
+
+    Interior nodes use central differences, falling back to the upwind first derivative where these
+    would give negative neighbour weights (strong drift against a fine grid). The generator vanishes
+    at S = 0, and the top node assumes a linear value (d2u/dS2 = 0).
+
+    Returns:
+    --------
+    lower, diag, upper : ndarray
+        The weights of the lower neighbour, the node and the upper neighbour of every node, with
+        shape (N,) each (lower[0] and upper[-1] being zero).
+    """
+
+    h = np.diff(S)
+    hm, hp = h[:-1], h[1:]
+    drift = mu * S[1:-1]
+    diffusion = 0.5 * sigma ** 2 * S[1:-1] ** 2
+
+    lower, diag, upper = np.zeros(len(S)), np.zeros(len(S)), np.zeros(len(S))
+
+    # Central differences
+    central_lower = (2 * diffusion - drift * hp) / (hm * (hm + hp))
+    central_upper = (2 * diffusion + drift * hm) / (hp * (hm + hp))
+
+    # Upwind first derivative where a central weight would be negative
+    upwind = (central_lower < 0) | (central_upper < 0)
+    upwind_lower = 2 * diffusion / (hm * (hm + hp)) + np.maximum(-drift, 0) / hm
+    upwind_upper = 2 * diffusion / (hp * (hm + hp)) + np.maximum(drift, 0) / hp
+
+    lower[1:-1] = np.where(upwind, upwind_lower, central_lower)
+    upper[1:-1] = np.where(upwind, upwind_upper, central_upper)
+
+    # Linear value at the top node: only the drift acts, on the backward difference
+    lower[-1] = -mu * S[-1] / h[-1]
+
+    diag[1:-1] = -(lower[1:-1] + upper[1:-1])
+    diag[-1] = -lower[-1]
+
+    return lower, diag, upper
+
+
+def pde_time_steps(period: float, num_timesteps: int, monitoring: np.ndarray = ()):
+    """
+    Divides the time to maturity into steps ending on every monitoring date, with Rannacher start-up.
+
+    The steps are as close to period / num_timesteps as the monitoring dates allow. The first two
+    steps after maturity and after every monitoring date (where the values jump) are replaced by
+    four implicit half steps (a single step by two).
+
+    Returns:
+    --------
+    dtau : ndarray
+        The length of every step, backwards from maturity.
+    theta : ndarray
+        The implicitness of every step: 1 for the implicit start-up steps, 0.5 for Crank-Nicolson.
+    monitor : ndarray
+        Whether a monitoring date ends each step.
+    """
+
+    # Monitoring dates as times to maturity, excluding maturity itself
+    breaks = np.unique(period - np.asarray(monitoring, dtype=float))
+    breaks = np.concatenate(([0.0], breaks[(breaks > 0) & (breaks < period)], [period]))
+
+    dtau, theta, monitor = [], [], []
+    for start, end in zip(breaks[:-1], breaks[1:]):
+        steps = max(int(round((end - start) * num_timesteps / period)), 1)
+        step = (end - start) / steps
+        damped = min(steps, 2)
+
+        dtau += [step / 2] * (2 * damped) + [step] * (steps - damped)
+        theta += [1.0] * (2 * damped) + [0.5] * (steps - damped)
+        monitor += [False] * (2 * damped + steps - damped - 1) + [end < period]
+
+    return np.array(dtau), np.array(theta), np.array(monitor)
+
+
+def cell_average(payoff, S: np.ndarray, samples: int = 16):
+    """
+    Averages a payoff over the cell of every node (between the midpoints to its neighbours), which
+    smooths its discontinuities for the second order accuracy of the scheme.
+    """
+
+    edges = np.concatenate(([S[0]], 0.5 * (S[1:] + S[:-1]), [S[-1]]))
+    fractions = (np.arange(samples) + 0.5) / samples
+    points = edges[:-1, None] + (edges[1:] - edges[:-1])[:, None] * fractions
+
+    return payoff(points.ravel()).reshape(points.shape).mean(axis=1)
+
+
+def backward_induction(
+    VALUE: np.ndarray,
+    EXERCISE: np.ndarray,
+    early_exercise: np.ndarray,
+    source: np.ndarray,
+    KNOCKED: np.ndarray,
+    lower: np.ndarray,
+    diag: np.ndarray,
+    upper: np.ndarray,
+    dtau: np.ndarray,
+    theta: np.ndarray,
+    monitor: np.ndarray,
+    continuous: bool = False
+):
+    """
+    Steps the values of one or more coupled contracts back from maturity with the theta scheme, in place.
+
+    Parameters:
+    -----------
+    VALUE : ndarray
+        The terminal values of K layers with shape (K, N), replaced by their values at the first time.
+    EXERCISE : ndarray
+        The exercise values of every layer with shape (K, N).
+    early_exercise : ndarray
+        Whether each layer may be exercised at every step, with shape (K,).
+    source : ndarray
+        What each layer takes on the knocked nodes, with shape (K,): -1 nothing (no barrier), -2 zero
+        (knocked out), or the index of an earlier layer (knocked in, taking that layer's values).
+    KNOCKED : ndarray
+        The fraction of every node's cell on or beyond the barrier, with shape (N,). Monitoring moves
+        each node's value by this fraction towards its source, and continuous monitoring holds the
+        nodes with a nonzero fraction (ones, for the nodes on or beyond the barrier) at their source.
+    lower, diag, upper : ndarray
+        The generator's weights from pde_operator.
+    dtau, theta, monitor : ndarray
+        The steps from pde_time_steps.
+    continuous : bool, optional
+        Whether the knocked nodes are held at every step (continuous monitoring) rather than only
+        reset at the monitoring dates. Defaults to False.
+
+    Returns:
+    --------
+    VALUE : ndarray
+        The values at the first time.
+    """
+
+    if kernels.BACKEND == "numba":
+        _backward_induction_compiled(
+            VALUE, EXERCISE, early_exercise, source, KNOCKED, lower, diag, upper, dtau, theta, monitor, continuous
+        )
+        return VALUE
+
+    for s in range(len(dtau)):
+        implicit = theta[s] * dtau[s]
+
+        for k in range(len(VALUE)):
+            # Right-hand side (the explicit part of the step) and the tridiagonal system of the implicit part
+            u = VALUE[k]
+            generator = diag * u
+            generator[1:] += lower[1:] * u[:-1]
+            generator[:-1] += upper[:-1] * u[1:]
+
+            r = u + (1 - theta[s]) * dtau[s] * generator
+            a, b, c = -implicit * lower, 1 - implicit * diag, -implicit * upper
+
+            # Continuous monitoring holds the knocked nodes at their source
+            fixed = (KNOCKED > 0) & (continuous and source[k] != -1)
+            a[fixed], b[fixed], c[fixed] = 0.0, 1.0, 0.0
+            r[fixed] = VALUE[source[k], fixed] if source[k] >= 0 else 0.0
+
+            if early_exercise[k]:
+                # Penalize the nodes below their exercise value, repeating until they stop changing
+                active = (u < EXERCISE[k]) & ~fixed
+
+                for _ in range(100):
+                    u = _solve_tridiagonal(a, b + PENALTY * active, c, r + PENALTY * EXERCISE[k] * active)
+                    updated = (u < EXERCISE[k]) & ~fixed
+
+                    if np.array_equal(updated, active):
+                        break
+                    active = updated
+            else:
+                u = _solve_tridiagonal(a, b, c, r)
+
+            # Reset the knocked nodes at the monitoring dates
+            if monitor[s] and source[k] != -1:
+                u += KNOCKED * ((VALUE[source[k]] if source[k] >= 0 else 0.0) - u)
+
+            VALUE[k] = u
+
+    return VALUE
+
+
+def _solve_tridiagonal(a: np.ndarray, b: np.ndarray, c: np.ndarray, r: np.ndarray):
+    """
+    Solves a tridiagonal system with sub-, main and super-diagonals a, b and c by the Thomas algorithm.
+    """
+
+    n = len(b)
+    cp, dp, x = np.empty(n), np.empty(n), np.empty(n)
+
+    cp[0], dp[0] = c[0] / b[0], r[0] / b[0]
+    for i in range(1, n):
+        m = b[i] - a[i] * cp[i - 1]
+        cp[i] = c[i] / m
+        dp[i] = (r[i] - a[i] * dp[i - 1]) / m
+
+    x[-1] = dp[-1]
+    for i in range(n - 2, -1, -1):
+        x[i] = dp[i] - cp[i] * x[i + 1]
+
+    return x
+
+
+def _backward_induction_loop(
+    VALUE, EXERCISE, early_exercise, source, KNOCKED, lower, diag, upper, dtau, theta, monitor, continuous
+):
+    """
+    The fused backward induction compiled for the numba backend, one node at a time.
+    """
+
+    K, n = VALUE.shape
+    r, b, x = np.empty(n), np.empty(n), np.empty(n)
+    cp, dp = np.empty(n), np.empty(n)
+    fixed = np.zeros(n, dtype=np.bool_)
+    active = np.zeros(n, dtype=np.bool_)
+
+    for s in range(len(dtau)):
+        explicit = (1 - theta[s]) * dtau[s]
+        implicit = theta[s] * dtau[s]
+
+        for k in range(K):
+            held = continuous and source[k] != -1
+
+            # Right-hand side of the step, holding the knocked nodes at their source under continuous monitoring
+            for i in range(n):
+                generator = diag[i] * VALUE[k, i]
+                if i > 0:
+                    generator += lower[i] * VALUE[k, i - 1]
+                if i < n - 1:
+                    generator += upper[i] * VALUE[k, i + 1]
+
+                fixed[i] = held and KNOCKED[i] > 0
+                if fixed[i]:
+                    r[i] = VALUE[source[k], i] if source[k] >= 0 else 0.0
+                else:
+                    r[i] = VALUE[k, i] + explicit * generator
+
+                active[i] = early_exercise[k] and not fixed[i] and VALUE[k, i] < EXERCISE[k, i]
+
+            # Solve, repeating with the penalized nodes updated until they stop changing
+            for _ in range(100):
+                for i in range(n):
+                    a_i = 0.0 if fixed[i] else -implicit * lower[i]
+                    c_i = 0.0 if fixed[i] else -implicit * upper[i]
+                    b[i] = 1.0 if fixed[i] else 1 - implicit * diag[i]
+                    rhs = r[i]
+
+                    if active[i]:
+                        b[i] += PENALTY
+                        rhs += PENALTY * EXERCISE[k, i]
+
+                    if i == 0:
+                        cp[i], dp[i] = c_i / b[i], rhs / b[i]
+                    else:
+                        m = b[i] - a_i * cp[i - 1]
+                        cp[i] = c_i / m
+                        dp[i] = (rhs - a_i * dp[i - 1]) / m
+
+                x[n - 1] = dp[n - 1]
+                for i in range(n - 2, -1, -1):
+                    x[i] = dp[i] - cp[i] * x[i + 1]
+
+                if not early_exercise[k]:
+                    break
+
+                changed = False
+                for i in range(n):
+                    updated = not fixed[i] and x[i] < EXERCISE[k, i]
+                    if updated != active[i]:
+                        changed = True
+                        active[i] = updated
+
+                if not changed:
+                    break
+
+            # Reset the knocked nodes at the monitoring dates
+            for i in range(n):
+                if monitor[s] and source[k] != -1:
+                    x[i] += KNOCKED[i] * ((VALUE[source[k], i] if source[k] >= 0 else 0.0) - x[i])
+
+                VALUE[k, i] = x[i]
+
+
+_backward_induction_compiled = jit(_backward_induction_loop, parallel=False)
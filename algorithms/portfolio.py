@@ -0,0 +1,242 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import multiprocessing
+from algorithms.simulation import (
+    pricer_path_arguments,
+    pricer_path_key,
+    path_key,
+    simulate_paths,
+    shared_paths,
+    captured_payoffs
+)
+from models.instrumentation import instrumented, phase
+import numpy as np
+
+
+@instrumented("num_simulations")
+def Price_Portfolio(
+    contracts: list[dict],
+    num_simulations: int,
+    chunk_size: int = 10_000,
+    workers: int = 1
+):
+    """
+    Prices a book of contracts, simulating the paths of each underlying once for all of its contracts.
+
+    Contracts whose pricers simulate the same path set (same model and parameters, initial price,
+    period, number of time steps and engine) form a group. Each group is simulated in chunks of at
+    most chunk_size paths and every contract of the group is evaluated on the shared chunk before
+    the next one is drawn, so memory is bounded by the chunk size rather than num_simulations.
+    Contracts of a group are priced on common random numbers, which makes the error of their
+    aggregate (e.g. a spread of strikes, or a hedged book) much smaller than their individual errors
+    suggest. Contracts on different path sets are independent.
+
+    With several workers, each chunk of a group is simulated into a shared memory block, and the
+    worker processes evaluate their share of the group's contracts on zero-copy read-only views of
+    it, so only the per-path payoffs are sent back. The block is released after every chunk, also
+    when a pricer fails. If a worker process dies, its contracts are evaluated in the calling
+    process on the same paths and a fresh pool is started.
+
+    Parameters:
+    -----------
+    contracts : list[dict]
+        The contracts, each a dictionary with the pricer under "pricer", an optional "quantity"
+        (defaults to 1) and the pricer's remaining arguments by name, without num_simulations, e.g.
+        {"pricer": Asian_Option, "asset_model": model, "initial_price": 100, "strike": 100,
+        "period": 1, "num_timesteps": 252}.
+    num_simulations : int
+        The number of Monte Carlo simulations per path set.
+    chunk_size : int, optional
+        The maximum number of paths simulated at once. Defaults to 10,000.
+    workers : int, optional
+        The number of worker processes evaluating the contracts of a group, or 1 to evaluate them in
+        the calling process. Defaults to 1.
+
+    Returns:
+    --------
+    dict
+        "prices" and "standard_errors": ndarrays with the price and its standard error per contract,
+        "covariance": the (n, n) covariance matrix of the price estimates,
+        "value" and "standard_error": the quantity weighted portfolio value and its standard error.
+    """
+
+    quantities = np.array([contract.get("quantity", 1.0) for contract in contracts], dtype=float)
+    arguments = [
+        {name: value for name, value in contract.items() if name not in ("pricer", "quantity")}
+        for contract in contracts
+    ]
+
+    # Group the contracts by the path set their pricer simulates (unkeyed contracts stand alone)
+    groups = {}
+    for index, contract in enumerate(contracts):
+        key = pricer_path_key(contract["pricer"], (), dict(arguments[index], num_simulations=chunk_size))
+        groups.setdefault(("contract", index) if key is None else key, []).append(index)
+
+    prices = np.zeros(len(contracts))
+    covariance = np.zeros((len(contracts), len(contracts)))
+    executor = _worker_pool(workers) if workers > 1 else None
+
+    try:
+        for indices in groups.values():
+            n = len(indices)
+
+            # The weighted payoffs w V of the paths are independent draws within each stratum of a chunk,
+            # so the covariance of their sums is the sum over chunks and strata of their sample covariances.
+            SUM = np.zeros(n)
+            COVARIANCE = np.zeros((n, n))
+
+            for start in range(0, num_simulations, chunk_size):
+                num_paths = min(chunk_size, num_simulations - start)
+                chunk = [
+                    (contracts[index]["pricer"], dict(arguments[index], num_simulations=num_paths))
+                    for index in indices
+                ]
+
+                # Simulate the chunk once and evaluate every contract of the group on it.
+                with phase("chunk", paths=num_paths):
+                    path_arguments = pricer_path_arguments(chunk[0][0], (), chunk[0][1])
+
+                    if executor is not None and path_arguments is not None:
+                        results, executor = _evaluate_in_workers(executor, workers, chunk, path_arguments)
+                    else:
+                        with shared_paths():
+                            results = [_evaluate(pricer, contract) for pricer, contract in chunk]
+
+                TERMS = np.array([terms for terms, _ in results])
+                STRATUM = next((STRATUM for _, STRATUM in results if STRATUM is not None), np.zeros(num_paths, dtype=int))
+
+                # Rescale the chunk's terms to its share of all simulations
+                TERMS *= num_paths / num_simulations
+
+                # Centre the terms on their stratum means, with the unbiased n / (n - 1) correction
+                # (strata of a single path contribute nothing)
+                sizes = np.bincount(STRATUM)
+                MEANS = np.array([np.bincount(STRATUM, weights=row) for row in TERMS]) / np.maximum(sizes, 1)
+                correction = np.sqrt(np.where(sizes > 1, sizes / np.maximum(sizes - 1, 1), 0))
+
+                CENTRED = (TERMS - MEANS[:, STRATUM]) * correction[STRATUM]
+                SUM += TERMS.sum(axis=1)
+                COVARIANCE += CENTRED @ CENTRED.T
+
+            prices[indices] = SUM
+            covariance[np.ix_(indices, indices)] = COVARIANCE
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    standard_errors = np.sqrt(np.maximum(np.diag(covariance), 0))
+
+    return {
+        "prices": prices,
+        "standard_errors": standard_errors,
+        "covariance": covariance,
+        "value": float(quantities @ prices),
+        "standard_error": float(np.sqrt(max(quantities @ covariance @ quantities, 0))),
+    }
+
+
+def _evaluate(pricer, arguments: dict):
+    """
+    Prices a contract, returning the weighted payoff w V of every path and the paths' strata (None
+    when unstratified).
+    """
+
+    with captured_payoffs() as captured:
+        price = pricer(**arguments)
+
+    if captured:
+        VALUE, WEIGHT, STRATUM = captured[-1]
+        return VALUE * WEIGHT, STRATUM
+
+    # Closed form engines have no simulation error
+    num_paths = arguments["num_simulations"]
+    return np.full(num_paths, (price[0] if isinstance(price, tuple) else price) / num_paths), None
+
+
+def _worker_pool(workers: int):
+    """
+    Starts the worker processes, spawned rather than forked since the calling process may already
+    run the threads of the compiled kernels or the BLAS.
+    """
+
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _evaluate_in_workers(executor: ProcessPoolExecutor, workers: int, chunk: list, path_arguments: dict):
+    """
+    Simulates a chunk's path set into shared memory and evaluates its contracts in the worker processes.
+
+    Returns:
+    --------
+    results : list[tuple]
+        The result of _evaluate for every contract of the chunk.
+    executor : ProcessPoolExecutor
+        The pool, replaced by a fresh one if a worker died.
+    """
+
+    num_paths, num_timesteps = path_arguments["num_simulations"], path_arguments["num_timesteps"]
+    observation_times = path_arguments["observation_times"]
+    shape = (num_paths, (num_timesteps if observation_times is None else len(observation_times)) + 1)
+
+    block = shared_memory.SharedMemory(create=True, size=8 * shape[0] * shape[1])
+    PRICE = None
+
+    try:
+        PRICE = np.ndarray(shape, dtype=float, buffer=block.buf)
+        WEIGHT = simulate_paths(**path_arguments, out=PRICE)[1]
+        PRICE = None
+
+        # Every worker evaluates a contiguous share of the contracts, from its own random seed
+        # (for the pricers drawing after the paths, e.g. bridge sampling)
+        tasks = [
+            (block.name, shape, WEIGHT, path_key(**path_arguments), [chunk[j] for j in share], np.random.randint(2 ** 31))
+            for share in np.array_split(np.arange(len(chunk)), min(workers, len(chunk)))
+        ]
+        futures = [executor.submit(_evaluate_shared, task) for task in tasks]
+
+        results, broken = [], False
+        for task, future in zip(tasks, futures):
+            try:
+                results += future.result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for its memory): evaluate its share here on the same paths
+                results += _evaluate_shared(task)
+                broken = True
+
+        if broken:
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = _worker_pool(workers)
+
+        return results, executor
+    except Exception as error:
+        # Drop the traceback, whose frames hold views of the block, so that the block can be closed
+        raise error.with_traceback(None)
+    finally:
+        PRICE = None
+        block.close()
+        block.unlink()
+
+
+def _evaluate_shared(task: tuple):
+    """
+    Evaluates a share of a chunk's contracts on a read-only view of its shared memory path set
+    (executed in a worker process, or in the calling one after a worker failure).
+    """
+
+    name, shape, WEIGHT, key, share, seed = task
+
+    block = shared_memory.SharedMemory(name=name)
+    PRICE = np.ndarray(shape, dtype=float, buffer=block.buf)
+    PRICE.flags.writeable = False
+    np.random.seed(seed)
+
+    try:
+        with shared_paths(cache={key: (PRICE, WEIGHT)}):
+            return [_evaluate(pricer, arguments) for pricer, arguments in share]
+    except Exception as error:
+        # Drop the traceback, whose frames hold views of the block, so that the block can be closed
+        raise error.with_traceback(None)
+    finally:
+        del PRICE
+        block.close()
@@ -0,0 +1,128 @@
+from algorithms.simulation import pricer_path_arguments
+from models.innovations import replayed_innovations
+from models.instrumentation import count_draws
+from models.stratification import stratify_normals
+from models.batching import batch_shape
+import numpy as np
+import inspect
+
+
+def Richardson_Extrapolation(pricer, *args, order: float = 1.0, refinement: int = 2, **kwargs):
+    """
+    Prices a contract on a fine and a coarse time grid with coupled random numbers and combines
+    them by Richardson extrapolation.
+
+    The fine grid is the pricer's num_timesteps, and the coarse grid merges every refinement fine
+    steps into one, with its innovations summed from those of the fine steps (Brownian increments,
+    jump counts and the total log jump size of the step), so both grids simulate the same paths of
+    the driving noise and their difference carries little sampling noise. With a discretization
+    bias c h^order in the step size h, the fine price carries the bias
+    (coarse - fine) / (refinement^order - 1), which the extrapolated price removes.
+
+    Parameters:
+    -----------
+    pricer : callable
+        A single-asset pricer simulating through simulate_paths with the monte_carlo engine on a
+        uniform grid, e.g. Barrier_Option.
+    *args, **kwargs
+        The arguments of the pricer, with num_timesteps the fine grid (a multiple of refinement).
+    order : float, optional
+        The order of the discretization bias: 1 for the Euler scheme of the stochastic volatility
+        models, 0.5 for the discrete monitoring of barriers and lookbacks. Defaults to 1.
+    refinement : int, optional
+        The number of fine steps per coarse step. Defaults to 2.
+
+    Returns:
+    --------
+    price : float
+        The extrapolated price, or an array of B prices for a model with a batch of B parameter
+        sets (see models.batching).
+    bias : float
+        The estimated discretization bias of the price on the fine grid, likewise per parameter set.
+    """
+
+    arguments = pricer_path_arguments(pricer, args, kwargs)
+
+    if arguments is None:
+        raise ValueError("Richardson extrapolation requires a single-asset pricer simulated through simulate_paths")
+
+    if arguments["engine"] != "monte_carlo" or arguments["observation_times"] is not None:
+        raise ValueError("Richardson extrapolation requires the monte_carlo engine on a uniform time grid")
+
+    # The coarse size normal of a step depends on its jump count, which differs between the parameter
+    # sets of a batch, while the models share one set of size normals across the batch
+    if batch_shape(arguments["asset_model"]) and hasattr(arguments["asset_model"], "lambda_J"):
+        raise ValueError("Richardson extrapolation requires scalar parameters for the jump models; price each parameter set separately")
+
+    M, N = arguments["num_simulations"], arguments["num_timesteps"]
+
+    if refinement < 2 or N % refinement:
+        raise ValueError(f"The number of time steps must be a multiple of the refinement, got {N} and {refinement}")
+
+    fine, coarse = _coupled_innovations(
+        arguments["asset_model"], arguments["period"], M, N, refinement, arguments["stratified"]
+    )
+
+    # Price on both grids, each simulation taking its innovations from the coupled draws
+    bound = inspect.signature(pricer).bind(*args, **kwargs)
+    prices = []
+
+    for innovations, num_timesteps in ((fine, N), (coarse, N // refinement)):
+        bound.arguments["num_timesteps"] = num_timesteps
+
+        with replayed_innovations([innovations]):
+            price = pricer(*bound.args, **bound.kwargs)
+
+        # The control variate engines also return their variance reduction
+        prices.append(price[0] if isinstance(price, tuple) else price)
+
+    bias = (prices[1] - prices[0]) / (refinement ** order - 1)
+
+    if np.ndim(bias):
+        return prices[0] - bias, bias
+
+    return float(prices[0] - bias), float(bias)
+
+
+def _coupled_innovations(asset_model, period: float, M: int, N: int, refinement: int, stratified: int = None):
+    """
+    Draws the innovations of a fine grid of N steps and sums them into those of the coarse grid.
+
+    Returns:
+    --------
+    fine, coarse : dict
+        The innovations of both grids (see models.innovations).
+    """
+
+    dt = np.full(N, period / N)
+    fine, coarse = {}, {}
+
+    # Standard normals of the asset (stratified on the terminal value, which both grids share) and
+    # of the variance process: the coarse normal of a step is the normalized sum of its fine normals
+    names = ["Z", "Z2"] if hasattr(asset_model, "theta") else ["Z"]
+
+    for name in names:
+        Z = np.random.normal(size=(M, N))
+        count_draws(Z.size)
+
+        if name == "Z" and stratified is not None:
+            stratify_normals(Z, stratified, dt)
+
+        fine[name] = Z
+        coarse[name] = Z.reshape(M, N // refinement, refinement).sum(axis=2) / np.sqrt(refinement)
+
+    # Jump counts add up over the merged steps, and so do the log jump sizes: the n_i jumps of fine
+    # step i contribute sqrt(n_i) sigma_J times its size normal
+    if hasattr(asset_model, "lambda_J"):
+        Jumps = np.random.poisson(asset_model.lambda_J * dt, (M, N))
+        JumpSizes = np.random.normal(size=(M, N))
+        count_draws(2 * M * N)
+
+        total = Jumps.reshape(M, N // refinement, refinement).sum(axis=2)
+        weighted = (np.sqrt(Jumps) * JumpSizes).reshape(M, N // refinement, refinement).sum(axis=2)
+
+        fine["jumps"], fine["jump_sizes"] = Jumps, JumpSizes
+        coarse["jumps"] = total
+        coarse["jump_sizes"] = np.divide(weighted, np.sqrt(total), out=np.zeros_like(weighted), where=total > 0)
+
+    return fine, coarse
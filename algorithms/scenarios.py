@@ -0,0 +1,174 @@
+"""
+Scenario and bump-and-revalue grids priced on common random numbers.
+
+A grid maps perturbations to the shifts they take, either of a contract argument by name or of a
+model parameter as "<model argument>.<parameter>" (as in the batch pricer's record format):
+
+    grid = {"initial_price": [-0.1, -0.05, 0, 0.05, 0.1], "asset_model.sigma": [-0.02, 0, 0.02]}
+
+Every contract is revalued at every point of the product of the axes, from the same random draws
+in every scenario, so the differences between scenarios carry none of the independent sampling
+noise of separate runs. Scenarios differing only in initial prices (and contract terms) share one
+simulation per underlying, rescaled to each initial price (see shared_paths(rescale=True)).
+"""
+
+from algorithms.simulation import pricer_path_key, shared_paths
+from models.instrumentation import instrumented, phase
+import numpy as np
+import itertools
+
+
+@instrumented("num_simulations")
+def Price_Scenarios(
+    contracts: list[dict],
+    grid: dict,
+    num_simulations: int,
+    seed: int = 0,
+    relative: tuple = ("initial_price", "initial_prices", "initial_price_1", "initial_price_2")
+):
+    """
+    Revalues a book of contracts over a grid of contract and model perturbations.
+
+    The contracts of each underlying (each path set of the unperturbed book) are priced from the
+    seed plus the underlying's position in the book in every scenario: the scenarios of an
+    underlying reuse its random draws, while different underlyings stay independent.
+
+    Parameters:
+    -----------
+    contracts : list[dict]
+        The contracts as in Price_Portfolio: the pricer under "pricer", an optional "quantity"
+        (defaults to 1) and the pricer's remaining arguments by name, without num_simulations.
+    grid : dict
+        The shifts of every perturbed argument, e.g. {"initial_price": [-0.1, 0, 0.1]}. Model
+        parameters are named "<model argument>.<parameter>" (e.g. "asset_model.theta") and apply to
+        every model of a list. Contracts without the argument are not perturbed by its axis.
+    num_simulations : int
+        The number of Monte Carlo simulations per path set.
+    seed : int, optional
+        The base random seed. Defaults to 0.
+    relative : tuple, optional
+        The arguments whose shifts are relative (value * (1 + shift)); the others are shifted by
+        adding the shift. Defaults to the initial prices.
+
+    Returns:
+    --------
+    dict
+        "axes": the perturbed arguments, "shifts": the shifts of every axis,
+        "base": the (n,) prices of the unperturbed contracts,
+        "prices": the prices with shape (*grid shape, n),
+        "pnl": the quantity weighted changes in value, prices - base, with the same shape,
+        "portfolio_pnl": the change in value of the book with the grid's shape.
+    """
+
+    axes = list(grid)
+    shifts = [np.asarray(grid[axis], dtype=float) for axis in axes]
+    shape = tuple(len(values) for values in shifts)
+
+    quantities = np.array([contract.get("quantity", 1.0) for contract in contracts], dtype=float)
+    arguments = [
+        {name: value for name, value in contract.items() if name not in ("pricer", "quantity")}
+        for contract in contracts
+    ]
+
+    # Seed every underlying by its position in the book, so that its draws are common to all scenarios
+    underlyings = {}
+    seeds = []
+    for index, contract in enumerate(contracts):
+        key = pricer_path_key(contract["pricer"], (), dict(arguments[index], num_simulations=num_simulations), rescaled=True)
+        seeds.append(seed + underlyings.setdefault(("contract", index) if key is None else key, len(underlyings)))
+
+    # The unperturbed book first, then every point of the grid
+    scenarios = [None] + list(itertools.product(*(range(size) for size in shape)))
+
+    # Order the scenarios by the path sets they simulate, so that each is simulated once and
+    # released before the next
+    batches = {}
+    for scenario in scenarios:
+        perturbed = [
+            _perturb(contract, axes, shifts, scenario, relative) for contract in arguments
+        ]
+        paths = tuple(
+            pricer_path_key(contract["pricer"], (), dict(perturbed[index], num_simulations=num_simulations), rescaled=True)
+            for index, contract in enumerate(contracts)
+        )
+        batches.setdefault(paths, []).append((scenario, perturbed))
+
+    base = np.zeros(len(contracts))
+    prices = np.zeros(shape + (len(contracts),))
+
+    for batch in batches.values():
+        with phase("scenarios", paths=num_simulations), shared_paths(rescale=True):
+            for scenario, perturbed in batch:
+                values = base if scenario is None else prices[scenario]
+
+                for index, contract in enumerate(contracts):
+                    np.random.seed(seeds[index])
+                    price = contract["pricer"](num_simulations=num_simulations, **perturbed[index])
+
+                    # The control variate engines also return their variance reduction
+                    values[index] = price[0] if isinstance(price, tuple) else price
+
+    pnl = quantities * (prices - base)
+
+    return {
+        "axes": axes,
+        "shifts": shifts,
+        "base": base,
+        "prices": prices,
+        "pnl": pnl,
+        "portfolio_pnl": pnl.sum(axis=-1),
+    }
+
+
+def _perturb(arguments: dict, axes: list, shifts: list, scenario: tuple, relative: tuple):
+    """
+    Applies the shifts of a scenario (indices into the shifts of every axis, or None for the
+    unperturbed book) to a contract's arguments.
+    """
+
+    arguments = dict(arguments)
+
+    if scenario is None:
+        return arguments
+
+    for axis, values, position in zip(axes, shifts, scenario):
+        shift = values[position]
+        argument, _, parameter = axis.partition(".")
+
+        if argument not in arguments:
+            continue
+
+        if parameter:
+            value = arguments[argument]
+            arguments[argument] = (
+                [_perturb_model(model, parameter, shift, axis in relative) for model in value]
+                if isinstance(value, list) else _perturb_model(value, parameter, shift, axis in relative)
+            )
+        else:
+            arguments[argument] = _shift(arguments[argument], shift, axis in relative)
+
+    return arguments
+
+
+def _perturb_model(model, parameter: str, shift: float, relative: bool):
+    """
+    Instantiates a copy of a model with one parameter shifted.
+    """
+
+    parameters = vars(model)
+
+    if parameter not in parameters:
+        raise ValueError(f"{type(model).__name__} has no parameter '{parameter}'")
+
+    return type(model)(**dict(parameters, **{parameter: _shift(parameters[parameter], shift, relative)}))
+
+
+def _shift(value, shift: float, relative: bool):
+    """
+    Shifts a number, or every element of a list or array, additively or relatively.
+    """
+
+    if isinstance(value, list):
+        return [_shift(element, shift, relative) for element in value]
+
+    return value * (1 + shift) if relative else value + shift
@@ -0,0 +1,257 @@
+"""
+An asyncio front end to the pricers.
+
+Pricing requests are dispatched to a worker pool so that the event loop never blocks on a
+simulation. Requests for single-asset pricers made concurrently with identical model parameters and
+simulation settings (model, initial price, period, number of simulations and time steps, engine)
+are coalesced into one batch that prices every contract on a single shared path set.
+
+    async with PricingService() as service:
+        call, put = await asyncio.gather(
+            service.price(Asian_Option, asset_model, 100, 100, 1, 10_000, 252),
+            service.price(Asian_Option, asset_model, 100, 100, 1, 10_000, 252, call_option=False),
+        )
+
+Each request can be cancelled, or given a timeout after which it fails with TimeoutError. A request
+cancelled before its batch is dispatched is never priced, nor is one past its deadline when the
+worker reaches it. Later cancellations only skip the request within its batch on a thread pool, which
+shares the request with the event loop; a process pool works on a copy and prices it regardless.
+
+With a path_cache (and a thread pool, which shares it in memory), the path sets are kept across
+batches and requests differing only in their initial price are coalesced as well, so a requote on
+a spot tick rescales the cached paths and only evaluates the payoff.
+"""
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from algorithms.simulation import PathCache, pricer_path_key, shared_paths
+import asyncio
+import contextvars
+import functools
+import time
+
+
+class PricingService():
+    """
+    Prices contracts on a worker pool, coalescing concurrent requests that can share their paths.
+
+    Attributes:
+    -----------
+    executor : Executor
+        The worker pool running the pricers.
+    coalesce_window : float
+        The number of seconds a new batch waits for further requests before it is dispatched.
+    path_cache : PathCache
+        The path sets kept across batches, or None to simulate every batch afresh.
+
+    Methods:
+    --------
+    price(pricer, *args, timeout=None, **kwargs):
+        Prices a contract asynchronously.
+    close():
+        Shuts down the worker pool if it is owned by the service.
+    """
+
+    def __init__(
+        self,
+        executor: Executor = None,
+        max_workers: int = None,
+        coalesce_window: float = 0.0,
+        path_cache: PathCache = None
+    ):
+        """
+        Initializes a PricingService.
+
+        Parameters:
+        -----------
+        executor : Executor, optional
+            The worker pool to dispatch to, e.g. a ProcessPoolExecutor. Defaults to a thread pool owned
+            by the service.
+        max_workers : int, optional
+            The number of workers of the default thread pool. Defaults to the ThreadPoolExecutor default.
+        coalesce_window : float, optional
+            The number of seconds a new batch waits for further requests. Defaults to 0, which only
+            coalesces the requests made within the same iteration of the event loop.
+        path_cache : PathCache, optional
+            A cache of path sets shared by all batches, keyed up to their initial price (see
+            shared_paths(rescale=True)). Only effective with a thread pool. Defaults to None.
+        """
+
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers)
+        self.coalesce_window = coalesce_window
+        self.path_cache = path_cache
+
+        self._owns_executor = executor is None
+        self._pending = {}  # The batches waiting for dispatch, keyed by path set
+        self._dispatches = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the worker pool if it is owned by the service.
+        """
+
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def price(self, pricer, *args, timeout: float = None, **kwargs):
+        """
+        Prices a contract on the worker pool.
+
+        Parameters:
+        -----------
+        pricer : callable
+            The pricer, e.g. Asian_Option.
+        *args, **kwargs
+            The arguments of the pricer.
+        timeout : float, optional
+            The number of seconds after which the request fails with TimeoutError. Defaults to no deadline.
+
+        Returns:
+        --------
+        float
+            The price returned by the pricer.
+        """
+
+        loop = asyncio.get_running_loop()
+        request = _Request(pricer, args, kwargs, None if timeout is None else time.monotonic() + timeout)
+        future = loop.create_future()
+        key = pricer_path_key(pricer, args, kwargs, rescaled=self.path_cache is not None)
+
+        if key is not None and key in self._pending:
+            # Join the batch of an identical path set that is still waiting for dispatch
+            self._pending[key].append((request, future))
+        else:
+            batch = [(request, future)]
+            if key is not None:
+                self._pending[key] = batch
+
+            dispatch = loop.create_task(self._dispatch(key, batch))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+
+        try:
+            # The shield keeps a timeout or cancellation of this request from cancelling the batch
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            request.cancelled = True
+            future.cancel()
+            raise
+
+    async def _dispatch(self, key, batch: list):
+        """
+        Waits for further requests to join the batch, then prices it on the worker pool.
+        """
+
+        await asyncio.sleep(self.coalesce_window)
+
+        if key is not None and self._pending.get(key) is batch:
+            del self._pending[key]
+
+        batch = [(request, future) for request, future in batch if not request.cancelled]
+        if not batch:
+            return
+
+        # Threads run the batch in a copy of the requesting context, so that a Profiler active
+        # around the request also measures it (processes start from a fresh context)
+        call = functools.partial(_price_batch, path_cache=self.path_cache)
+        if isinstance(self.executor, ThreadPoolExecutor):
+            call = functools.partial(contextvars.copy_context().run, call)
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, call, [request for request, _ in batch]
+            )
+        except Exception as error:
+            results = [(None, error)] * len(batch)
+
+        for (_, future), (value, error) in zip(batch, results):
+            if future.done():
+                continue
+
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+
+class _Request():
+    """
+    A pricer call together with its deadline and cancellation flag, as passed to the workers.
+    """
+
+    __slots__ = ("pricer", "args", "kwargs", "deadline", "cancelled")
+
+    def __init__(self, pricer, args: tuple, kwargs: dict, deadline: float):
+        self.pricer = pricer
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.cancelled = False
+
+
+def _price_batch(requests: list, path_cache: PathCache = None):
+    """
+    Prices a batch of requests on one shared path set (executed in a worker), rescaled from the
+    path cache when one is given.
+
+    Returns:
+    --------
+    list[tuple]
+        The (price, error) of every request, one of them being None.
+    """
+
+    results = []
+
+    with shared_paths(rescale=path_cache is not None, cache=path_cache):
+        for request in requests:
+            # Skip the requests past their deadline, or cancelled while queued (seen by threads only,
+            # as a process receives a copy of the flag taken at dispatch)
+            if request.cancelled:
+                results.append((None, asyncio.CancelledError()))
+                continue
+            if request.deadline is not None and time.monotonic() > request.deadline:
+                results.append((None, asyncio.TimeoutError()))
+                continue
+
+            try:
+                results.append((request.pricer(*request.args, **request.kwargs), None))
+            except Exception as error:
+                results.append((None, error))
+
+    return results
+
+
+# The service used by price_async, created on first use.
+_DEFAULT_SERVICE = None
+
+
+async def price_async(pricer, *args, timeout: float = None, **kwargs):
+    """
+    Prices a contract on a default PricingService shared by all callers.
+
+    Parameters:
+    -----------
+    pricer : callable
+        The pricer, e.g. Asian_Option.
+    *args, **kwargs
+        The arguments of the pricer.
+    timeout : float, optional
+        The number of seconds after which the request fails with TimeoutError. Defaults to no deadline.
+
+    Returns:
+    --------
+    float
+        The price returned by the pricer.
+    """
+
+    global _DEFAULT_SERVICE
+
+    if _DEFAULT_SERVICE is None:
+        _DEFAULT_SERVICE = PricingService()
+
+    return await _DEFAULT_SERVICE.price(pricer, *args, timeout=timeout, **kwargs)
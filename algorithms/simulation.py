@@ -0,0 +1,604 @@
+from models import model, JumpDiffusionModel
+from models.instrumentation import count_draws
+from models.batching import batch_shape
+from models.stratification import stratum_weights
+from collections import OrderedDict
+from contextlib import contextmanager
+import contextvars
+import functools
+import threading
+import inspect
+import numpy as np
+
+
+# The path sets shared between pricer calls inside a shared_paths() block, keyed by path_key.
+_SHARED_PATHS = contextvars.ContextVar("shared_paths", default=None)
+
+# Whether the shared path sets are keyed up to their initial price and rescaled (shared_paths(rescale=True)).
+_RESCALED_PATHS = contextvars.ContextVar("rescaled_paths", default=False)
+
+# The per-path payoffs recorded by weighted_average inside a captured_payoffs() block.
+_CAPTURED_PAYOFFS = contextvars.ContextVar("captured_payoffs", default=None)
+
+
+def observation_grid(observation_times, period: float):
+    """
+    Returns the observation times the paths are simulated at, which always end at maturity (the
+    maturity being appended when the contract's dates stop before it), or None for the uniform grid.
+    """
+
+    if observation_times is None:
+        return None
+
+    observation_times = np.asarray(observation_times, dtype=float)
+
+    if observation_times.ndim == 1 and observation_times.size and observation_times[-1] < period:
+        observation_times = np.append(observation_times, period)
+
+    return observation_times
+
+
+def path_key(
+    asset_model: model,
+    initial_price: float,
+    period: float,
+    num_simulations: int,
+    num_timesteps: int,
+    engine: str = "monte_carlo",
+    observation_times=None,
+    target: float = None,
+    stratified: int = None,
+    rescaled: bool = False
+):
+    """
+    Identifies a simulated path set by the model type, its parameters and the simulation settings.
+
+    With rescaled=True the key ignores the initial price (and measures the target in units of it),
+    since the paths of every model scale linearly with the initial price.
+
+    Returns:
+    --------
+    tuple
+        A hashable key, equal for calls of simulate_paths that can share their paths.
+    """
+
+    # Batched parameters are compared by value
+    parameters = tuple(sorted(
+        (name, tuple(np.ravel(value).tolist()) if np.ndim(value) else value) for name, value in vars(asset_model).items()
+    ))
+
+    # The observation times replace the uniform grid
+    if observation_times is not None:
+        observation_times, num_timesteps = tuple(np.asarray(observation_times, dtype=float).tolist()), None
+
+    # Only importance sampled paths depend on the contract's target
+    if engine != "importance_sampling":
+        target = None
+
+    if rescaled:
+        initial_price, target = 1.0, None if target is None else target / initial_price
+
+    return (
+        type(asset_model).__name__, parameters, initial_price, period, num_simulations, num_timesteps, engine,
+        observation_times, target, stratified
+    )
+
+
+def pricer_path_key(pricer, args: tuple, kwargs: dict, rescaled: bool = False):
+    """
+    Identifies the path set simulated by a call of a single-asset pricer.
+
+    Parameters:
+    -----------
+    pricer : callable
+        The pricer, e.g. Asian_Option.
+    args : tuple
+        The positional arguments of the call.
+    kwargs : dict
+        The keyword arguments of the call.
+    rescaled : bool, optional
+        Whether to key the path set up to its initial price, as shared by shared_paths(rescale=True).
+        Defaults to False.
+
+    Returns:
+    --------
+    tuple
+        The path_key of the call, or None when the pricer does not simulate a single asset through
+        simulate_paths (e.g. Basket_Option, or the analytic, pde and lattice engines), its paths
+        depend on the contract (importance sampling) or the arguments cannot be keyed.
+    """
+
+    arguments = pricer_path_arguments(pricer, args, kwargs)
+
+    if arguments is None:
+        return None
+
+    try:
+        key = path_key(**arguments, rescaled=rescaled)
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+
+def pricer_path_arguments(pricer, args: tuple, kwargs: dict):
+    """
+    Extracts the simulate_paths arguments of a call of a single-asset pricer.
+
+    Parameters:
+    -----------
+    pricer : callable
+        The pricer, e.g. Asian_Option.
+    args : tuple
+        The positional arguments of the call.
+    kwargs : dict
+        The keyword arguments of the call.
+
+    Returns:
+    --------
+    dict
+        The arguments of simulate_paths by name, or None when the pricer does not simulate a single
+        asset through simulate_paths (e.g. with the analytic, pde or lattice engines) or its paths
+        depend on the contract (importance sampling).
+    """
+
+    try:
+        bound = _signature(pricer).bind(*args, **kwargs)
+    except TypeError:
+        return None
+
+    bound.apply_defaults()
+    arguments = bound.arguments
+
+    # The digital pricers name their time to maturity "periods"
+    period = arguments.get("period", arguments.get("periods"))
+
+    if period is None or not all(name in arguments for name in ("asset_model", "initial_price", "num_simulations", "num_timesteps")):
+        return None
+
+    # The closed form, PDE and lattice engines simulate no paths, and importance sampled paths are
+    # shifted towards the contract's own strike or barrier
+    if arguments.get("engine", "monte_carlo") not in ("monte_carlo", "conditional"):
+        return None
+
+    return {
+        "asset_model": arguments["asset_model"],
+        "initial_price": arguments["initial_price"],
+        "period": period,
+        "num_simulations": arguments["num_simulations"],
+        "num_timesteps": arguments["num_timesteps"],
+        "engine": arguments.get("engine", "monte_carlo"),
+        "observation_times": observation_grid(arguments.get("observation_times"), period),
+        "stratified": arguments.get("stratified"),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _signature(pricer):
+    return inspect.signature(pricer)
+
+
+@contextmanager
+def shared_paths(rescale: bool = False, cache: dict = None):
+    """
+    Shares the simulated paths between pricer calls with identical model parameters and simulation
+    settings made inside the block, so that each distinct path set is simulated once.
+
+        with shared_paths():
+            call = Asian_Option(asset_model, 100, 100, 1, 10_000, 252)
+            put = Asian_Option(asset_model, 100, 100, 1, 10_000, 252, call_option=False)
+
+    With rescale=True, calls differing only in their initial price share their paths too: the path
+    set is simulated from the first initial price requested and multiplied by the ratio of the
+    initial prices for the others, which keeps the same random draws (e.g. for a spot ladder).
+
+    Parameters:
+    -----------
+    rescale : bool, optional
+        Whether to share the path sets between initial prices. Defaults to False.
+    cache : dict, optional
+        The path sets to start from and add to, e.g. a PathCache kept across blocks. It must only be
+        used with the same rescale setting. Defaults to a fresh dictionary released with the block.
+    """
+
+    tokens = _SHARED_PATHS.set({} if cache is None else cache), _RESCALED_PATHS.set(rescale)
+
+    try:
+        yield
+    finally:
+        _SHARED_PATHS.reset(tokens[0])
+        _RESCALED_PATHS.reset(tokens[1])
+
+
+class PathCache(OrderedDict):
+    """
+    A bounded cache of simulated path sets kept across pricer calls, so that a contract is requoted
+    on a new initial price by rescaling its stored paths and re-evaluating only the payoff.
+
+        cache = PathCache()
+
+        with shared_paths(rescale=True, cache=cache):
+            price = Asian_Option(asset_model, 100.0, 100, 1, 100_000, 252)
+
+        with shared_paths(rescale=True, cache=cache):
+            price = Asian_Option(asset_model, 100.2, 100, 1, 100_000, 252)  # no simulation
+
+    Path sets are keyed by path_key up to their initial price, so a change of model parameters or
+    simulation settings simulates a new path set, and the least recently used ones are evicted
+    beyond max_entries. Requotes from the same cache reuse the same random draws.
+
+    Attributes:
+    -----------
+    max_entries : int
+        The maximum number of path sets kept.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                return default
+
+            self.move_to_end(key)
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+
+
+def simulate_paths(
+    asset_model: model,
+    initial_price: float,
+    period: float,
+    num_simulations: int,
+    num_timesteps: int,
+    engine: str = "monte_carlo",
+    observation_times=None,
+    target: float = None,
+    stratified: int = None,
+    out: np.ndarray = None
+):
+    """
+    Simulates the weighted price paths of an underlying asset for the Monte Carlo pricers.
+
+    Parameters:
+    -----------
+    asset_model : model
+        An instance of the asset model used to simulate the price paths of the underlying asset.
+    initial_price : float
+        The initial price of the underlying asset.
+    period : float
+        The time to maturity of the option, typically expressed in years.
+    num_simulations : int
+        The number of Monte Carlo simulations to perform.
+    num_timesteps : int
+        The number of discrete time steps within each simulation path.
+    engine : str, optional
+        "monte_carlo" for plain simulation with equal path weights, "conditional" to stratify the
+        paths by jump count (JumpDiffusionModel only), or "importance_sampling" to shift the drift of
+        the asset's Brownian motion towards target, weighting the paths by their likelihood ratios.
+        Defaults to "monte_carlo".
+    observation_times : ndarray, optional
+        Increasing times in (0, period] at which the contract observes the price (e.g. the fixing
+        dates of an Asian or the monitoring dates of a barrier). When given, the paths are simulated
+        at these times only, stepping directly between them, and at maturity when they stop before
+        it (see observation_grid), and num_timesteps is ignored.
+    target : float, optional
+        The price level the contract's payoff hinges on (e.g. the strike of an out-of-the-money
+        digital), towards which the importance_sampling engine shifts the paths.
+    stratified : int, optional
+        The number of equal-probability strata of the terminal Brownian value (monte_carlo engine).
+        The paths are ordered by stratum, labelled by models.stratification.stratum_labels, and
+        weighted by their stratum's probability over its number of paths. Defaults to no stratification.
+    out : ndarray, optional
+        A preallocated array with the shape of PRICE to write the paths into, e.g. a view of a shared
+        memory block. Not cached by shared_paths().
+
+    Returns:
+    --------
+    PRICE : ndarray
+        Simulated asset price paths with shape (num_simulations, num_timesteps + 1), or one column
+        for the initial price and one per observation time (and maturity) when these are given. Inside a
+        shared_paths() block the array may be shared with other pricers and must not be modified.
+        For a model with a batch of B parameter sets (monte_carlo engine only, see models.batching)
+        the paths of every set follow each other, with shape (B * num_simulations, num_timesteps + 1).
+    WEIGHT : ndarray
+        The weight of each path with shape (num_simulations,), summing to one (in expectation for
+        importance sampling), or (B, num_simulations) for a batch, so that weighted_average returns
+        the B prices.
+    """
+
+    cache = _SHARED_PATHS.get()
+    arguments = (
+        asset_model, initial_price, period, num_simulations, num_timesteps, engine,
+        observation_grid(observation_times, period), target, stratified
+    )
+
+    if out is not None:
+        return _simulate(*arguments, out=out)
+
+    if cache is not None and _RESCALED_PATHS.get():
+        key = path_key(*arguments, rescaled=True)
+        entry = cache.get(key)
+
+        if entry is None:
+            entry = cache[key] = initial_price, _simulate(*arguments)
+
+        # Every model's paths scale linearly with the initial price
+        reference, (PRICE, WEIGHT) = entry
+
+        return (PRICE, WEIGHT) if initial_price == reference else (PRICE * (initial_price / reference), WEIGHT)
+
+    if cache is not None:
+        key = path_key(*arguments)
+
+        if key not in cache:
+            cache[key] = _simulate(*arguments)
+
+        return cache[key]
+
+    return _simulate(*arguments)
+
+
+def _simulate(
+    asset_model: model,
+    initial_price: float,
+    period: float,
+    num_simulations: int,
+    num_timesteps: int,
+    engine: str,
+    observation_times=None,
+    target: float = None,
+    stratified: int = None,
+    out: np.ndarray = None
+):
+    """
+    Simulates a fresh weighted path set for simulate_paths, into out when given.
+    """
+
+    if stratified is not None and engine != "monte_carlo":
+        raise ValueError(f"Stratified sampling requires the monte_carlo engine, got '{engine}'")
+
+    batch = batch_shape(asset_model)
+    if batch and engine != "monte_carlo":
+        raise ValueError(f"Batched model parameters require the monte_carlo engine, got '{engine}'")
+
+    if observation_times is not None:
+        observation_times = np.asarray(observation_times, dtype=float)
+
+        if (
+            observation_times.ndim != 1 or not observation_times.size or observation_times[0] <= 0 or
+            np.any(np.diff(observation_times) <= 0) or observation_times[-1] > period
+        ):
+            raise ValueError("The observation times must be a non-empty increasing array in (0, period]")
+
+    if engine == "conditional":
+        if not isinstance(asset_model, JumpDiffusionModel):
+            raise ValueError(
+                f"The conditional engine requires a JumpDiffusionModel, got {type(asset_model).__name__}"
+            )
+
+        # Stratify the paths by their number of jumps, weighted by the Poisson probabilities.
+        return asset_model.simulate_conditional(
+            S0=initial_price,  # Initial asset price
+            T=period,          # Time to maturity
+            M=num_simulations, # Number of simulations
+            N=num_timesteps,   # Number of time steps
+            times=observation_times,
+            out=out
+        )
+
+    elif engine == "monte_carlo":
+        PRICE = asset_model.simulate(
+            S0=initial_price,  # Initial asset price
+            T=period,          # Time to maturity
+            M=num_simulations, # Number of simulations
+            N=num_timesteps,   # Number of time steps
+            out=None if out is None else out.reshape(batch + (num_simulations, -1)),
+            times=observation_times,
+            stratified=stratified
+        )
+        WEIGHT = stratum_weights(num_simulations, stratified)
+
+        if not batch:
+            return PRICE, WEIGHT
+
+        # The pricers see the paths of every parameter set as one set of rows, weighted per set
+        return PRICE.reshape(-1, PRICE.shape[-1]), np.broadcast_to(WEIGHT, batch + WEIGHT.shape)
+
+    elif engine == "importance_sampling":
+        if target is None:
+            raise ValueError("The importance sampling engine requires a target price level")
+
+        # Time increment of each step, and the mean of each step's standard normal under the shifted measure
+        if observation_times is None:
+            dt = np.full(num_timesteps, period / num_timesteps)
+        else:
+            dt = np.diff(observation_times, prepend=0.0)
+
+        shift = importance_shift(asset_model, initial_price, dt.sum(), target) * np.sqrt(dt)
+
+        # Draw the asset's Brownian increments with the shifted drift
+        Z = np.random.normal(size=(num_simulations, len(dt))) + shift
+        count_draws(Z.size)
+
+        PRICE = asset_model.simulate(
+            S0=initial_price,  # Initial asset price
+            T=period,          # Time to maturity
+            M=num_simulations, # Number of simulations
+            N=len(dt),         # Number of time steps
+            Z=Z,               # Shifted Brownian increments
+            out=out,
+            times=observation_times
+        )
+
+        # Likelihood ratio of the original to the shifted measure (Girsanov) of every path
+        return PRICE, np.exp(0.5 * shift @ shift - Z @ shift) / num_simulations
+
+    else:
+        raise ValueError(
+            f"Unknown simulation engine '{engine}', expected 'monte_carlo', 'conditional' or 'importance_sampling'"
+        )
+
+
+def importance_shift(asset_model: model, initial_price: float, period: float, target: float):
+    """
+    Chooses the drift shift of the importance_sampling engine.
+
+    The shift exponentially tilts the log price at maturity so that its mean lands on the target,
+    which makes the payoff's critical level a likely event and is close to the variance-optimal
+    shift for out-of-the-money digitals and barriers. Only the diffusion can be shifted, so it takes
+    its share of the tilt in proportion to its share of the log price variance, the jumps carrying
+    the rest. The volatility of the stochastic volatility models is taken at its long-run level sqrt(theta).
+
+    Returns:
+    --------
+    float
+        The drift added to the asset's standard Brownian motion, per unit time.
+    """
+
+    # Diffusive volatility, jump variance and mean log drift (the jumps are not compensated in the models)
+    volatility = diffusive_volatility(asset_model)
+    lambda_J, mu_J, sigma_J = (getattr(asset_model, name, 0.0) for name in ("lambda_J", "mu_J", "sigma_J"))
+    drift = asset_model.mu - 0.5 * volatility ** 2 + lambda_J * mu_J
+    variance = volatility ** 2 + lambda_J * (mu_J ** 2 + sigma_J ** 2)
+
+    return (np.log(target / initial_price) - drift * period) * volatility / (variance * period)
+
+
+def diffusive_volatility(asset_model: model):
+    """
+    Returns the volatility of the Brownian part of a model (its long-run level sqrt(theta) for the
+    stochastic volatility models).
+    """
+
+    return np.sqrt(asset_model.theta) if hasattr(asset_model, "theta") else asset_model.sigma
+
+
+def weighted_average(VALUE: np.ndarray, WEIGHT: np.ndarray = None, STRATUM: np.ndarray = None):
+    """
+    Reduces the simulated payoffs of every path to the pricer's estimate.
+
+    Inside a captured_payoffs() block the payoffs, weights and strata are recorded as well, so that
+    callers such as the portfolio pricer can estimate standard errors and covariances between contracts.
+
+    Parameters:
+    -----------
+    VALUE : ndarray
+        The simulated payoff of each path.
+    WEIGHT : ndarray, optional
+        The weight of each path, summing to one. Defaults to equal weights. Batched paths carry
+        weights of shape (B, M), one row per parameter set (see simulate_paths).
+    STRATUM : ndarray, optional
+        The stratum of each path for stratified sampling, within which the paths are independent.
+        Defaults to a single stratum.
+
+    Returns:
+    --------
+    float
+        The weighted average payoff across all simulations, or an ndarray of the B prices of a batch.
+    """
+
+    if WEIGHT is None:
+        WEIGHT = np.full(len(VALUE), 1 / len(VALUE))
+
+    # The payoffs of a batch, one row per parameter set
+    VALUE = VALUE.reshape(WEIGHT.shape)
+
+    captured = _CAPTURED_PAYOFFS.get()
+    if captured is not None:
+        captured.append((VALUE, WEIGHT, STRATUM))
+
+    return np.sum(WEIGHT * VALUE, axis=-1)
+
+
+@contextmanager
+def captured_payoffs():
+    """
+    Records the per-path payoffs, weights and strata (None when unstratified) reduced by
+    weighted_average inside the block.
+
+        with captured_payoffs() as captured:
+            Asian_Option(asset_model, 100, 100, 1, 10_000, 252)
+
+        VALUE, WEIGHT, STRATUM = captured[-1]
+    """
+
+    captured = []
+    token = _CAPTURED_PAYOFFS.set(captured)
+
+    try:
+        yield captured
+    finally:
+        _CAPTURED_PAYOFFS.reset(token)
+
+
+def control_variate(
+    VALUE: np.ndarray,
+    CONTROL: np.ndarray,
+    control_mean: float,
+    WEIGHT: np.ndarray = None,
+    STRATUM: np.ndarray = None
+):
+    """
+    Combines simulated payoffs with a correlated control variate of known expectation.
+
+    The control's coefficient is the regression slope Cov(V, C) / Var(C) of the weighted estimators
+    V = sum(WEIGHT * VALUE) and C = sum(WEIGHT * CONTROL), which minimizes the variance of the adjusted
+    estimator. Their covariances are estimated from the weighted payoffs within every stratum, like
+    the standard errors of the portfolio pricer.
+
+    Parameters:
+    -----------
+    VALUE : ndarray
+        The simulated payoff of each path.
+    CONTROL : ndarray
+        The control variate's payoff on the same paths.
+    control_mean : float
+        The exact expectation of the control variate.
+    WEIGHT : ndarray, optional
+        The weight of each path, as in weighted_average. Defaults to equal weights.
+    STRATUM : ndarray, optional
+        The stratum of each path, as in weighted_average. Defaults to a single stratum.
+
+    Returns:
+    --------
+    price : float
+        The control variate estimate of the expected payoff.
+    variance_reduction : float
+        The ratio of the plain Monte Carlo variance to the control variate estimator's variance.
+    """
+
+    if WEIGHT is not None and np.ndim(WEIGHT) > 1:
+        raise ValueError("Control variates do not support batched model parameters")
+
+    if WEIGHT is None:
+        WEIGHT = np.full(len(VALUE), 1 / len(VALUE))
+
+    # The weighted payoffs of both estimators, centred on their stratum means with the unbiased
+    # n / (n - 1) correction (strata of a single path contribute nothing)
+    TERMS = np.array([WEIGHT * VALUE, WEIGHT * CONTROL])
+    STRATA = np.zeros(len(VALUE), dtype=int) if STRATUM is None else STRATUM
+
+    sizes = np.bincount(STRATA)
+    MEANS = np.array([np.bincount(STRATA, weights=row) for row in TERMS]) / np.maximum(sizes, 1)
+    correction = np.sqrt(np.where(sizes > 1, sizes / np.maximum(sizes - 1, 1), 0))
+
+    CENTRED = (TERMS - MEANS[:, STRATA]) * correction[STRATA]
+    covariance = CENTRED @ CENTRED.T
+
+    beta = covariance[0, 1] / covariance[1, 1] if covariance[1, 1] > 0 else 0.0
+
+    ADJUSTED = VALUE - beta * (CONTROL - control_mean)
+    variance = covariance[0, 0] - 2 * beta * covariance[0, 1] + beta ** 2 * covariance[1, 1]
+
+    return float(weighted_average(ADJUSTED, WEIGHT, STRATUM)), float(covariance[0, 0] / variance) if variance > 0 else np.inf
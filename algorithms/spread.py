@@ -1,7 +1,12 @@
-from models import model
+from models import model, MultiAssetModel
+from models.instrumentation import instrumented, phase
+from models.stratification import stratum_labels, stratum_weights
+from algorithms.closed_form import kirk_spread_price, kirk_spread_proxy
+from algorithms.simulation import control_variate, weighted_average, diffusive_volatility
 import numpy as np
 
 
+@instrumented("num_simulations")
 def Spread_Option(
     asset_model_1: model,
     asset_model_2: model,
@@ -12,7 +17,10 @@ def Spread_Option(
     num_simulations: int,
     num_timesteps: int,
     call_option: bool = True,
-    european_exercise: bool = True
+    european_exercise: bool = True,
+    correlation: float = 0.0,
+    engine: str = "monte_carlo",
+    stratified: int = None
 ):
     """
     Calculates the price of a Spread Option using Monte Carlo simulation.
@@ -39,11 +47,22 @@ def Spread_Option(
         Specifies whether the option is a call (True) or a put (False). Defaults to True.
     european_exercise : bool, optional
         Specifies whether the option is European-style (True) or American-style (False). Defaults to True.
+    correlation : float, optional
+        The correlation between the Brownian drivers of the two assets. Defaults to 0.0.
+    engine : str, optional
+        The pricing engine: "monte_carlo" for plain simulation, "kirk" for Kirk's approximation, or
+        "control_variate" for simulation with Kirk's approximation as control variate. The latter two
+        require European exercise and StationaryModel assets. Defaults to "monte_carlo".
+    stratified : int, optional
+        The number of equal-probability strata of the spread's first order Brownian exposure at maturity
+        to sample with, with proportional allocation (European exercise only). Defaults to no stratification.
 
     Returns:
     --------
     Value : float
         The estimated price of the Spread Option based on the provided parameters.
+    tuple[float, float]
+        With the control variate engine, the estimated price and the variance reduction factor achieved.
     """
     
     if call_option:
@@ -55,43 +74,79 @@ def Spread_Option(
         # The exercise value is the maximum of the result and zero.
         exercise_value = lambda price_1, price_2: max(strike - (price_1 - price_2), 0)
 
-    # Simulate the price path for the first underlying asset.
-    PRICE_1 = asset_model_1.simulate(
-        S0=initial_price_1,  # Initial price of the first asset
-        T=periods,           # Time to maturity
-        M=num_simulations,   # Number of simulations
-        N=num_timesteps      # Number of time steps
-    )
+    if engine not in ("monte_carlo", "kirk", "control_variate"):
+        raise ValueError(f"Unknown spread engine '{engine}'")
 
-    # Simulate the price path for the second underlying asset.
-    PRICE_2 = asset_model_2.simulate(
-        S0=initial_price_2,  # Initial price of the second asset
-        T=periods,           # Time to maturity
-        M=num_simulations,   # Number of simulations
-        N=num_timesteps      # Number of time steps
-    )
+    if engine != "monte_carlo" and not european_exercise:
+        raise ValueError(f"The {engine} engine only prices European exercise")
 
-    if european_exercise:
-        # For European-style options, the option can only be exercised at maturity.
-        VALUE = np.zeros(shape=(num_simulations))
-        
-        # Calculate the payoff at maturity for each simulation.
-        for i in range(num_simulations):
-            VALUE[i] = exercise_value(PRICE_1[i][-1], PRICE_2[i][-1])  # Payoff based on the final prices of the assets
+    if stratified is not None and not european_exercise:
+        raise ValueError("Stratified sampling only prices European exercise")
+
+    # Price with Kirk's approximation.
+    if engine == "kirk":
+        return kirk_spread_price(
+            asset_model_1, asset_model_2, initial_price_1, initial_price_2,
+            strike, periods, correlation, call_option
+        )
+
+    # Stratify the spread's sensitivity to the assets' Brownian motions, weighting the paths by stratum.
+    direction = [
+        initial_price_1 * diffusive_volatility(asset_model_1),
+        -initial_price_2 * diffusive_volatility(asset_model_2)
+    ]
+    WEIGHT = stratum_weights(num_simulations, stratified)
+    STRATUM = stratum_labels(num_simulations, stratified)
+
+    # Jointly simulate the correlated price paths of both underlying assets.
+    with phase("simulate", paths=num_simulations):
+        PRICES = MultiAssetModel(
+            [asset_model_1, asset_model_2],
+            [[1.0, correlation], [correlation, 1.0]]
+        ).simulate(
+            S0=[initial_price_1, initial_price_2],  # Initial prices of the assets
+            T=periods,                              # Time to maturity
+            M=num_simulations,                      # Number of simulations
+            N=num_timesteps,                        # Number of time steps
+            stratified=stratified,                  # Strata of the terminal Brownian exposure
+            direction=direction
+        )
+        PRICE_1, PRICE_2 = PRICES[0], PRICES[1]
+
+    with phase("payoff", paths=num_simulations):
+        if european_exercise:
+            # For European-style options, the option can only be exercised at maturity.
+            VALUE = np.zeros(shape=(num_simulations))
         
-        return np.mean(VALUE)  # Return the average payoff across all simulations
+            # Calculate the payoff at maturity for each simulation.
+            for i in range(num_simulations):
+                VALUE[i] = exercise_value(PRICE_1[i][-1], PRICE_2[i][-1])  # Payoff based on the final prices of the assets
+
+            if engine == "control_variate":
+                # The exchange payoff on Kirk's proxy for S2 + K has Kirk's approximation as its exact expectation.
+                PROXY = kirk_spread_proxy(asset_model_2, initial_price_2, PRICE_2[:, -1], strike, periods)
+                CONTROL = np.maximum(PRICE_1[:, -1] - PROXY, 0) if call_option else np.maximum(PROXY - PRICE_1[:, -1], 0)
+                control_mean = kirk_spread_price(
+                    asset_model_1, asset_model_2, initial_price_1, initial_price_2,
+                    strike, periods, correlation, call_option
+                )
+
+                return control_variate(VALUE, CONTROL, control_mean, WEIGHT, STRATUM)
     
-    else:
-        # For American-style options, the option can be exercised at any time before or at maturity.
-        VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
+        else:
+            # For American-style options, the option can be exercised at any time before or at maturity.
+            VALUE = np.zeros(shape=(num_simulations, num_timesteps + 1))
         
-        # Calculate the option value using backward induction, allowing for early exercise.
-        for i in range(num_simulations):
-            for t in reversed(range(num_timesteps + 1)):
-                if t == num_timesteps:
-                    VALUE[i][t] = exercise_value(PRICE_1[i][t], PRICE_2[i][t])  # At the last timestep, the value is the payoff
-                else:
-                    # Before the last timestep, compare the payoff to continuing
-                    VALUE[i][t] = max(exercise_value(PRICE_1[i][t], PRICE_2[i][t]), VALUE[i][t + 1])
+            # Calculate the option value using backward induction, allowing for early exercise.
+            for i in range(num_simulations):
+                for t in reversed(range(num_timesteps + 1)):
+                    if t == num_timesteps:
+                        VALUE[i][t] = exercise_value(PRICE_1[i][t], PRICE_2[i][t])  # At the last timestep, the value is the payoff
+                    else:
+                        # Before the last timestep, compare the payoff to continuing
+                        VALUE[i][t] = max(exercise_value(PRICE_1[i][t], PRICE_2[i][t]), VALUE[i][t + 1])
         
-        return np.mean(VALUE[:, 0])  # Return the average initial payoff across all simulations
+            VALUE = VALUE[:, 0]  # The initial value of each simulation
+
+    with phase("reduction", paths=num_simulations):
+        return weighted_average(VALUE, WEIGHT, STRATUM)  # Return the weighted average payoff across all simulations
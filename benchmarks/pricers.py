@@ -0,0 +1,316 @@
+"""
+Benchmark harness sweeping every pricer in algorithms/ across the four asset models and several
+problem sizes.
+
+Each case runs in a forked worker process so that its peak resident set size is measured in
+isolation. The time spent inside the models' simulate methods is measured separately from the
+total, splitting every run into simulation and payoff evaluation. A case that raises, dies or
+times out is recorded as failed instead of stalling the sweep. Results can be saved as a JSON
+baseline and later runs compared against it:
+
+    python -m benchmarks.pricers --sizes 1000x52,10000x252 --save baseline.json
+    python -m benchmarks.pricers --compare baseline.json
+"""
+
+from models import (
+    StationaryModel,
+    JumpDiffusionModel,
+    StochasticVolatilityModel,
+    StochasticVolatilityJumpModel
+)
+from algorithms.asian import Asian_Option
+from algorithms.barrier import Barrier_Option
+from algorithms.basket import Basket_Option
+from algorithms.digital import (
+    Cash_Digital_Option,
+    Asset_Digital_Option,
+    Cash_Double_Digital_Option,
+    Asset_Double_Digital_Option
+)
+from algorithms.lookback import Fixed_Strike_Lookback_Option, Floating_Strike_Lookback_Option
+from algorithms.spread import Spread_Option
+import numpy as np
+import multiprocessing
+from queue import Empty
+import argparse
+import platform
+import resource
+import time
+import json
+import sys
+
+
+# The benchmarked models, keyed by name.
+MODELS = {
+    "stationary": StationaryModel,
+    "jump_diffusion": JumpDiffusionModel,
+    "stochastic_volatility": StochasticVolatilityModel,
+    "stochastic_volatility_jump": StochasticVolatilityJumpModel,
+}
+
+# Every pricer as a function of (model, num_simulations, num_timesteps), keyed by name.
+PRICERS = {
+    "asian": lambda m, M, N: Asian_Option(m, 100, 100, 1, M, N),
+    "barrier": lambda m, M, N: Barrier_Option(m, 100, 120, 100, 1, M, N),
+    "cash_digital": lambda m, M, N: Cash_Digital_Option(m, 100, 100, 1, 1, M, N),
+    "asset_digital": lambda m, M, N: Asset_Digital_Option(m, 100, 100, 1, M, N),
+    "cash_double_digital": lambda m, M, N: Cash_Double_Digital_Option(m, 100, 90, 110, 1, 1, M, N),
+    "asset_double_digital": lambda m, M, N: Asset_Double_Digital_Option(m, 100, 90, 110, 1, M, N),
+    "fixed_strike_lookback": lambda m, M, N: Fixed_Strike_Lookback_Option(m, 100, 100, 1, M, N),
+    "floating_strike_lookback": lambda m, M, N: Floating_Strike_Lookback_Option(m, 100, 1, M, N),
+    "basket": lambda m, M, N: Basket_Option([m, m, m], [1 / 3] * 3, [100, 95, 105], 100, 1, M, N),
+    "spread": lambda m, M, N: Spread_Option(m, m, 100, 95, 5, 1, M, N),
+}
+
+# The default (num_simulations, num_timesteps) problem sizes.
+SIZES = [(1_000, 52), (10_000, 52), (10_000, 252)]
+
+
+def _timed_simulate(asset_model, timer: list):
+    """
+    Wraps the simulate method of a model instance to accumulate its wall time into timer[0].
+    """
+
+    simulate = asset_model.simulate
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return simulate(*args, **kwargs)
+        finally:
+            timer[0] += time.perf_counter() - start
+
+    asset_model.simulate = wrapper
+
+
+def _run_case(pricer: str, model: str, num_simulations: int, num_timesteps: int, seed: int, queue):
+    """
+    Runs a single benchmark case and puts its measurements on the queue (executed in a worker process).
+    """
+
+    np.random.seed(seed)
+    case = {"pricer": pricer, "model": model, "num_simulations": num_simulations, "num_timesteps": num_timesteps}
+
+    try:
+        asset_model = MODELS[model]()
+        timer = [0.0]
+        _timed_simulate(asset_model, timer)
+
+        start = time.perf_counter()
+        PRICERS[pricer](asset_model, num_simulations, num_timesteps)
+        seconds = time.perf_counter() - start
+    except Exception as error:
+        # Report the failure rather than leaving the harness waiting for a result
+        queue.put(dict(case, error=f"{type(error).__name__}: {error}"))
+        return
+
+    queue.put({
+        **case,
+        "seconds": seconds,
+        "simulation_seconds": timer[0],
+        "payoff_seconds": seconds - timer[0],
+        "paths_per_second": num_simulations / seconds,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def run_benchmarks(
+    pricers: list[str] = None,
+    models: list[str] = None,
+    sizes: list[tuple[int, int]] = None,
+    repeat: int = 1,
+    seed: int = 0,
+    timeout: float = None
+):
+    """
+    Runs the benchmark sweep over pricers x models x sizes.
+
+    A case whose run raises, dies without a result (e.g. killed for its memory) or exceeds the
+    timeout is recorded as failed, with the reason under "error", and the sweep moves on.
+
+    Parameters:
+    -----------
+    pricers : list[str], optional
+        The names of the pricers to benchmark (keys of PRICERS). Defaults to all of them.
+    models : list[str], optional
+        The names of the models to benchmark (keys of MODELS). Defaults to all of them.
+    sizes : list[tuple[int, int]], optional
+        The (num_simulations, num_timesteps) problem sizes. Defaults to SIZES.
+    repeat : int, optional
+        The number of runs per case, of which the fastest is kept. Defaults to 1.
+    seed : int, optional
+        The random seed of every run. Defaults to 0.
+    timeout : float, optional
+        The maximum number of seconds of a run, after which its worker is terminated. Defaults to no limit.
+
+    Returns:
+    --------
+    dict
+        The benchmark metadata and one result record per case.
+    """
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    results = []
+
+    for pricer in pricers or PRICERS:
+        for model in models or MODELS:
+            for num_simulations, num_timesteps in sizes or SIZES:
+                case = {"pricer": pricer, "model": model, "num_simulations": num_simulations, "num_timesteps": num_timesteps}
+                runs = []
+
+                for _ in range(repeat):
+                    worker = context.Process(
+                        target=_run_case,
+                        args=(pricer, model, num_simulations, num_timesteps, seed, queue)
+                    )
+                    worker.start()
+                    runs.append(dict(case, **_wait_for_case(worker, queue, timeout)))
+                    worker.join()
+
+                failed = [run for run in runs if "error" in run]
+                if failed:
+                    results.append(failed[0])
+                    print(f"{pricer:<26}{model:<28}{num_simulations:>8} x {num_timesteps:<6} FAILED: {failed[0]['error']}", flush=True)
+                    continue
+
+                best = min(runs, key=lambda run: run["seconds"])
+                results.append(best)
+
+                print(
+                    f"{pricer:<26}{model:<28}{num_simulations:>8} x {num_timesteps:<6}"
+                    f"{best['seconds']:>9.3f}s {best['paths_per_second']:>12.0f} paths/s "
+                    f"(simulate {best['simulation_seconds']:.3f}s, payoff {best['payoff_seconds']:.3f}s, "
+                    f"peak RSS {best['peak_rss_mb']:.0f} MB)",
+                    flush=True
+                )
+
+    return {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def _wait_for_case(worker, queue, timeout: float = None):
+    """
+    Waits for the result of a worker's case, polling so that a worker that dies without a result or
+    outlives the timeout is noticed, and returns its record (a failed one in those cases).
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while True:
+        try:
+            return queue.get(timeout=1.0)
+        except Empty:
+            pass
+
+        if not worker.is_alive():
+            # The result may have arrived just before the worker exited
+            try:
+                return queue.get(timeout=1.0)
+            except Empty:
+                return {"error": f"worker exited with code {worker.exitcode} without a result"}
+
+        if deadline is not None and time.monotonic() > deadline:
+            worker.terminate()
+            return {"error": f"timed out after {timeout:g}s"}
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.1):
+    """
+    Compares benchmark results against a saved baseline.
+
+    Parameters:
+    -----------
+    results : dict
+        The output of run_benchmarks.
+    baseline : dict
+        A previously saved output of run_benchmarks.
+    threshold : float, optional
+        The relative slowdown above which a case is reported as a regression. Defaults to 0.1.
+
+    Returns:
+    --------
+    list[dict]
+        The cases that regressed, with their baseline and current timings.
+    """
+
+    key = lambda r: (r["pricer"], r["model"], r["num_simulations"], r["num_timesteps"])
+    reference = {key(r): r for r in baseline["results"]}
+    regressions = []
+
+    for result in results["results"]:
+        # Failed cases have no timings to compare
+        if key(result) not in reference or "error" in result or "error" in reference[key(result)]:
+            continue
+
+        before = reference[key(result)]
+        ratio = result["seconds"] / before["seconds"]
+
+        print(
+            f"{result['pricer']:<26}{result['model']:<28}{result['num_simulations']:>8} x {result['num_timesteps']:<6}"
+            f"{before['seconds']:>9.3f}s -> {result['seconds']:.3f}s ({ratio:.2f}x)"
+        )
+
+        if ratio > 1 + threshold:
+            regressions.append({"baseline": before, "current": result, "ratio": ratio})
+
+    return regressions
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the option pricers across models and problem sizes.")
+    parser.add_argument("--pricers", help="comma separated pricer names (default: all)")
+    parser.add_argument("--models", help="comma separated model names (default: all)")
+    parser.add_argument("--sizes", help="comma separated MxN sizes, e.g. 1000x52,10000x252")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of every run")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare the results against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument("--timeout", type=float, help="seconds after which a run is terminated and its case failed")
+    args = parser.parse_args(argv)
+
+    sizes = None
+    if args.sizes:
+        sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+
+    results = run_benchmarks(
+        pricers=args.pricers.split(",") if args.pricers else None,
+        models=args.models.split(",") if args.models else None,
+        sizes=sizes,
+        repeat=args.repeat,
+        seed=args.seed,
+        timeout=args.timeout
+    )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    failures = sum("error" in result for result in results["results"])
+    if failures:
+        print(f"{failures} case(s) failed")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
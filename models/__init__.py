@@ -3,6 +3,7 @@ from .stationary import StationaryModel
 from .jump_diffusion import JumpDiffusionModel
 from .stochastic_volatility import StochasticVolatilityModel
 from .stochastic_volatility_jump import StochasticVolatilityJumpModel
+from .multi_asset import MultiAssetModel
 
 model = Union[
     StationaryModel,
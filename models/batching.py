@@ -0,0 +1,39 @@
+"""
+Batched model parameters.
+
+Every model parameter may be a scalar or a one-dimensional array of B values, one per parameter
+set, e.g. StochasticVolatilityModel(kappa=np.linspace(0.5, 3, 1000)). simulate then simulates the
+M paths of every set in one broadcasted call and returns an array with a leading batch axis,
+(B, M, N + 1). All sets share the draws that do not depend on the parameters (the normals and
+uniforms), which couples them like common random numbers; the jump counts are drawn per set.
+"""
+
+import numpy as np
+
+
+def batch_shape(asset_model):
+    """
+    Returns the batch shape of a model's parameters: () for scalar parameters, (B,) for a batch.
+    """
+
+    shape = np.broadcast_shapes(*(np.shape(value) for value in vars(asset_model).values()))
+
+    if len(shape) > 1:
+        raise ValueError(f"Batched model parameters must be scalars or one-dimensional arrays, got shape {shape}")
+
+    return shape
+
+
+def batch_parameters(asset_model, *names: str):
+    """
+    Returns the named parameters of a model: unchanged when none is batched, otherwise all as (B, 1)
+    columns that broadcast against the (B, M) paths of a batch.
+    """
+
+    batch = batch_shape(asset_model)
+    values = [getattr(asset_model, name) for name in names]
+
+    if not batch:
+        return values
+
+    return [np.broadcast_to(np.asarray(value, dtype=float), batch)[:, None] for value in values]
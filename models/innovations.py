@@ -0,0 +1,213 @@
+"""
+Caller-supplied, recorded and replayed random inputs (innovations) of the model simulators.
+
+Every simulate method takes innovations, a dictionary of the random inputs it would otherwise draw:
+
+    StationaryModel.simulate                  Z (M, N) standard normals of the Brownian motion
+    JumpDiffusionModel.simulate               Z (M, N); jumps (M, N) jump counts of every step;
+                                              jump_sizes (M, N) standard normals driving the sum of
+                                              the log jump sizes of every step
+    JumpDiffusionModel.simulate_conditional   Z (M, N); jump_counts (R,) jump counts of the R paths
+                                              sampling the strata without a path of their own;
+                                              jump_times (J,) uniforms placing the J jumps of all
+                                              paths; jump_sizes (J,) standard normals of their log sizes
+    StochasticVolatilityModel.simulate        Z (M, N) asset normals; Z2 (M, N) independent normals of
+                                              the variance; U (M, N) uniforms of the QE scheme (with
+                                              observation times only)
+    StochasticVolatilityJumpModel.simulate    Z, Z2, jumps, jump_sizes and U, as above
+    MultiAssetModel.simulate(_basket)         Z (K, M, N) uncorrelated asset normals, or with factor
+                                              loadings F (F, M, N) factor normals and E<k> (M, N)
+                                              idiosyncratic normals of asset k; assets, a list of the
+                                              asset models' own innovations
+
+For a model with a batch of B parameter sets (see models.batching) the jumps have shape (B, M, N),
+the other innovations being shared by all sets.
+
+Missing entries are drawn as usual (including the stratification of Z), so quasi-random normals can
+drive the diffusion while the jumps stay pseudo-random. Supplied arrays are copied, never modified.
+
+Inside a recorded_innovations() block the inputs of every simulate call are recorded in call order.
+save_innovations writes them compressed to an .npz file, and inside a replayed_innovations(blocks)
+block the simulate calls take their inputs from the blocks in the same order, which reproduces the
+recorded run bit for bit when the same pricer calls are made. Draws made outside the models (the
+importance sampling normals and the bridge uniforms of algorithms/) are not recorded.
+
+    with recorded_innovations() as blocks:
+        price = Asian_Option(asset_model, 100, 100, 1, 100_000, 252)
+    save_innovations("run.npz", blocks)
+
+    with replayed_innovations(load_innovations("run.npz")):
+        assert Asian_Option(asset_model, 100, 100, 1, 100_000, 252) == price
+"""
+
+from .instrumentation import count_draws
+from contextlib import contextmanager
+import contextvars
+import numpy as np
+
+
+# The innovations recorded inside a recorded_innovations() block, one dictionary per simulate call.
+_RECORDED_INNOVATIONS = contextvars.ContextVar("recorded_innovations", default=None)
+
+# The iterator over the blocks replayed inside a replayed_innovations() block.
+_REPLAYED_INNOVATIONS = contextvars.ContextVar("replayed_innovations", default=None)
+
+
+class InnovationSource():
+    """
+    The random inputs of one simulate call: supplied by the caller, replayed, or drawn (and recorded).
+
+    Attributes:
+    -----------
+    supplied : dict
+        The supplied (or replayed) innovations by name.
+    recorded : dict
+        The innovations used by the call, or None outside a recorded_innovations() block.
+
+    Methods:
+    --------
+    draw(name, shape, sampler):
+        Returns the innovations of the given name, drawing them with sampler unless supplied.
+    """
+
+    def __init__(self, innovations: dict = None):
+        """
+        Initializes the source of a simulate call, taking the next replayed block when no innovations are supplied.
+        """
+
+        replayed = _REPLAYED_INNOVATIONS.get()
+
+        if innovations is None and replayed is not None:
+            innovations = next(replayed, None)
+
+            if innovations is None:
+                raise ValueError("The replayed run has no innovations left for this simulation")
+
+        self.supplied = {} if innovations is None else innovations
+        self.recorded = None
+
+        recorded = _RECORDED_INNOVATIONS.get()
+        if recorded is not None:
+            self.recorded = {}
+            recorded.append(self.recorded)
+
+    def draw(self, name: str, shape: tuple, sampler):
+        """
+        Returns the innovations of the given name.
+
+        Parameters:
+        -----------
+        name : str
+            The name of the innovations, e.g. "Z".
+        shape : tuple
+            Their expected shape.
+        sampler : callable
+            Draws them when they are not supplied.
+
+        Returns:
+        --------
+        ndarray
+            A copy of the supplied innovations, or fresh draws.
+        """
+
+        if name in self.supplied:
+            value = np.array(self.supplied[name])
+
+            if value.shape != tuple(shape):
+                raise ValueError(f"The innovations '{name}' must have shape {tuple(shape)}, got {value.shape}")
+        else:
+            value = sampler()
+            count_draws(value.size)
+
+        # Record a copy, since the models may transform their draws in place
+        if self.recorded is not None:
+            self.recorded[name] = value.copy()
+
+        return value
+
+    def get(self, name: str, default=None):
+        """
+        Returns the supplied innovations of the given name without recording them, e.g. the nested
+        innovations of the assets of a MultiAssetModel.
+        """
+
+        return self.supplied.get(name, default)
+
+
+@contextmanager
+def recorded_innovations():
+    """
+    Records the innovations of every simulate call made inside the block, in call order.
+
+        with recorded_innovations() as blocks:
+            price = Asian_Option(asset_model, 100, 100, 1, 10_000, 252)
+    """
+
+    blocks = []
+    token = _RECORDED_INNOVATIONS.set(blocks)
+
+    try:
+        yield blocks
+    finally:
+        _RECORDED_INNOVATIONS.reset(token)
+
+
+@contextmanager
+def replayed_innovations(blocks: list):
+    """
+    Feeds recorded innovations to the simulate calls made inside the block, one block per call in
+    order. Calls given innovations explicitly do not consume a block.
+    """
+
+    token = _REPLAYED_INNOVATIONS.set(iter(blocks))
+
+    try:
+        yield
+    finally:
+        _REPLAYED_INNOVATIONS.reset(token)
+
+
+def save_innovations(path: str, blocks: list):
+    """
+    Writes recorded innovations to a compressed .npz file, storing integer draws (e.g. jump counts)
+    in the smallest integer type holding them.
+
+    Parameters:
+    -----------
+    path : str
+        The output file.
+    blocks : list[dict]
+        The innovations of every simulate call, as recorded by recorded_innovations().
+    """
+
+    arrays = {}
+    for index, block in enumerate(blocks):
+        for name, value in block.items():
+            if np.issubdtype(value.dtype, np.integer) and value.size:
+                value = value.astype(np.promote_types(np.min_scalar_type(value.min()), np.min_scalar_type(value.max())))
+
+            arrays[f"{index}/{name}"] = value
+
+    np.savez_compressed(path, num_blocks=len(blocks), **arrays)
+
+
+def load_innovations(path: str):
+    """
+    Reads innovations written by save_innovations.
+
+    Returns:
+    --------
+    list[dict]
+        The innovations of every recorded simulate call, for replayed_innovations.
+    """
+
+    with np.load(path) as data:
+        blocks = [{} for _ in range(int(data["num_blocks"]))]
+
+        for key in data.files:
+            if key != "num_blocks":
+                index, name = key.split("/", 1)
+                value = data[key]
+                blocks[int(index)][name] = value.astype(np.int64) if np.issubdtype(value.dtype, np.integer) else value
+
+    return blocks
@@ -0,0 +1,310 @@
+"""
+Instrumentation of the hot paths of the models and pricers.
+
+Pricers and model simulate methods are wrapped with `instrumented` and split their work into named
+phases with `phase` (simulate, state, payoff and reduction in the pricers). While no Profiler is
+active and no callback is registered every hook returns immediately, so the instrumentation costs
+a couple of attribute lookups per call.
+
+    with Profiler(track_memory=True) as profiler:
+        Asian_Option(StationaryModel(), 100, 100, 1, 10_000, 252)
+
+    profiler.to_dict()
+    # {'Asian_Option': {...}, 'Asian_Option/simulate': {...},
+    #  'Asian_Option/simulate/StationaryModel.simulate': {...}, 'Asian_Option/state': {...}, ...}
+
+A Profiler measures the calls made in the context (thread or asyncio task) it is entered in, and
+each context nests its phases on its own stack, so pricers running concurrently do not mix their
+phases; PricingService runs its batches in a copy of the requesting context. Phases are keyed by
+their nesting path. Each record holds the number of calls, the wall time in
+seconds, the paths processed and paths per second, the random draws made, and (with track_memory)
+the net and peak bytes allocated as seen by tracemalloc.
+"""
+
+from contextlib import contextmanager
+import functools
+import contextvars
+import inspect
+import threading
+import tracemalloc
+import time
+import json
+
+
+# The profilers active in the current context (thread or task) and the callbacks registered process
+# wide; instrumentation is disabled while both are empty.
+_PROFILERS = contextvars.ContextVar("profilers", default=())
+_CALLBACKS = []
+
+# The stack of currently open phases in the current context, so that pricers running concurrently on
+# several threads or tasks nest their phases independently.
+_STACK = contextvars.ContextVar("phase_stack", default=())
+
+
+class Profiler():
+    """
+    Collects the per-phase measurements of instrumented pricers and models while active.
+
+    Attributes:
+    -----------
+    track_memory : bool
+        Whether the bytes allocated per phase are traced with tracemalloc.
+    records : dict
+        The aggregated measurements keyed by phase path.
+
+    Methods:
+    --------
+    to_dict():
+        Returns the measurements as a dictionary.
+    to_json(path=None):
+        Serializes the measurements to JSON, optionally writing them to a file.
+    """
+
+    def __init__(self, track_memory: bool = False):
+        """
+        Initializes a Profiler.
+
+        Parameters:
+        -----------
+        track_memory : bool, optional
+            Whether to trace the bytes allocated per phase with tracemalloc, which slows down the
+            profiled code. Defaults to False.
+        """
+
+        self.track_memory = track_memory
+        self.records = {}
+        self._started_tracing = False
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        self._tokens.append(_PROFILERS.set(_PROFILERS.get() + (self,)))
+        return self
+
+    def __exit__(self, *exc_info):
+        _PROFILERS.reset(self._tokens.pop())
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def record(self, key: str, measurement: dict):
+        """
+        Adds the measurement of one phase call to the aggregated records (from any thread).
+        """
+
+        with self._lock:
+            record = self.records.setdefault(key, {
+                "calls": 0, "seconds": 0.0, "paths": 0, "draws": 0, "allocated_bytes": 0, "peak_bytes": 0
+            })
+
+            record["calls"] += 1
+            record["seconds"] += measurement["seconds"]
+            record["paths"] += measurement["paths"]
+            record["draws"] += measurement["draws"]
+            record["allocated_bytes"] += measurement["allocated_bytes"]
+            record["peak_bytes"] = max(record["peak_bytes"], measurement["peak_bytes"])
+
+    def to_dict(self):
+        """
+        Returns the measurements keyed by phase path, including paths per second.
+
+        Returns:
+        --------
+        dict
+            The aggregated record of every phase.
+        """
+
+        return {
+            key: dict(record, paths_per_second=record["paths"] / record["seconds"] if record["seconds"] > 0 else 0.0)
+            for key, record in self.records.items()
+        }
+
+    def to_json(self, path: str = None):
+        """
+        Serializes the measurements to JSON.
+
+        Parameters:
+        -----------
+        path : str, optional
+            A file to write the JSON to. Defaults to None.
+
+        Returns:
+        --------
+        str
+            The JSON encoded measurements.
+        """
+
+        encoded = json.dumps(self.to_dict(), indent=2)
+
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(encoded)
+
+        return encoded
+
+
+def register_callback(callback):
+    """
+    Registers a callback invoked as callback(key, measurement) whenever a phase ends.
+
+    Parameters:
+    -----------
+    callback : callable
+        The function receiving the phase path and its measurement dictionary.
+    """
+
+    _CALLBACKS.append(callback)
+
+
+def unregister_callback(callback):
+    """
+    Removes a callback registered with register_callback.
+
+    Parameters:
+    -----------
+    callback : callable
+        The callback to remove.
+    """
+
+    _CALLBACKS.remove(callback)
+
+
+def enabled():
+    """
+    Returns whether any profiler or callback is listening.
+    """
+
+    return bool(_PROFILERS.get() or _CALLBACKS)
+
+
+@contextmanager
+def phase(name: str, paths: int = 0):
+    """
+    Measures a named phase of work, nested under the currently open phases.
+
+    Parameters:
+    -----------
+    name : str
+        The name of the phase.
+    paths : int, optional
+        The number of simulated paths processed by the phase. Defaults to 0.
+    """
+
+    profilers = _PROFILERS.get()
+    if not (profilers or _CALLBACKS):
+        yield
+        return
+
+    frame = {"name": name, "paths": paths, "draws": 0, "peak_bytes": 0, "start_bytes": None}
+
+    if tracemalloc.is_tracing():
+        # Fold the peak reached so far into the enclosing phase before resetting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        _fold_peak(peak)
+        tracemalloc.reset_peak()
+        frame["start_bytes"] = current
+
+    stack = _STACK.get()
+    key = "/".join([parent["name"] for parent in stack] + [name])
+    _STACK.set(stack + (frame,))
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _STACK.set(stack)
+
+        allocated_bytes = 0
+        if frame["start_bytes"] is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            allocated_bytes = current - frame["start_bytes"]
+            frame["peak_bytes"] = max(frame["peak_bytes"], peak - frame["start_bytes"])
+
+            # The enclosing phase peaked at least as high as this one
+            _fold_peak(frame["start_bytes"] + frame["peak_bytes"])
+
+        # Draws made inside this phase also count towards the enclosing phase
+        if stack:
+            stack[-1]["draws"] += frame["draws"]
+
+        measurement = {
+            "seconds": seconds,
+            "paths": frame["paths"],
+            "draws": frame["draws"],
+            "allocated_bytes": allocated_bytes,
+            "peak_bytes": frame["peak_bytes"],
+        }
+
+        for profiler in profilers:
+            profiler.record(key, measurement)
+        for callback in _CALLBACKS:
+            callback(key, measurement)
+
+
+def _fold_peak(peak: int):
+    """
+    Raises the peak of the innermost open phase to an absolute traced memory level.
+    """
+
+    stack = _STACK.get()
+
+    if stack and stack[-1]["start_bytes"] is not None:
+        stack[-1]["peak_bytes"] = max(stack[-1]["peak_bytes"], peak - stack[-1]["start_bytes"])
+
+
+def count_draws(n: int):
+    """
+    Adds n random draws to the innermost open phase.
+
+    Parameters:
+    -----------
+    n : int
+        The number of random variates drawn.
+    """
+
+    stack = _STACK.get()
+
+    if stack:
+        stack[-1]["draws"] += n
+
+
+def instrumented(paths_argument: str = None):
+    """
+    Decorates a pricer or simulate method so that each call is measured as a phase named after it.
+
+    Parameters:
+    -----------
+    paths_argument : str, optional
+        The name of the argument holding the number of simulated paths. Defaults to None.
+
+    Returns:
+    --------
+    callable
+        The decorator.
+    """
+
+    def decorator(function):
+        signature = inspect.signature(function)
+        name = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not (_PROFILERS.get() or _CALLBACKS):
+                return function(*args, **kwargs)
+
+            paths = 0
+            if paths_argument is not None:
+                paths = signature.bind(*args, **kwargs).arguments.get(paths_argument) or 0
+
+            with phase(name, paths=paths):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
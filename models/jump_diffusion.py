@@ -1,4 +1,10 @@
+from typing import Optional
+from .instrumentation import instrumented
+from .stratification import brownian_normals
+from .innovations import InnovationSource
+from .batching import batch_shape, batch_parameters
 import numpy as np
+import math
 
 class JumpDiffusionModel():
     """
@@ -6,21 +12,23 @@ class JumpDiffusionModel():
 
     Attributes:
     -----------
-    mu : float
+    mu : float or ndarray
         The drift rate of the asset's return, representing the average rate of return of the asset.
-    sigma : float
+    sigma : float or ndarray
         The volatility of the asset's return, representing the standard deviation of the return.
-    lambda_J : float
+    lambda_J : float or ndarray
         The intensity (or rate) of the jump process, representing the average number of jumps per unit time.
-    mu_J : float
+    mu_J : float or ndarray
         The mean of the log-normal distribution for jump sizes, indicating the average size of the jumps.
-    sigma_J : float
+    sigma_J : float or ndarray
         The standard deviation of the log-normal distribution for jump sizes, indicating the variability of jump sizes.
 
     Methods:
     --------
     simulate(S0, T, M, N):
         Simulates the path of the asset price over time incorporating stochastic jumps.
+    simulate_conditional(S0, T, M, N):
+        Simulates weighted price paths stratified by the number of jumps over the horizon.
     """
 
     def __init__(
@@ -54,7 +62,19 @@ class JumpDiffusionModel():
         self.mu_J = mu_J            # Mean of jump size: average magnitude of jumps
         self.sigma_J = sigma_J      # Volatility of jump size: variability in jump magnitudes
 
-    def simulate(self, S0: float, T: float, M: int, N: int):
+    @instrumented("M")
+    def simulate(
+        self,
+        S0: float,
+        T: float,
+        M: int,
+        N: int,
+        Z: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+        times: Optional[np.ndarray] = None,
+        stratified: Optional[int] = None,
+        innovations: Optional[dict] = None
+    ):
         """
         Simulates the path of the asset price over time incorporating jumps.
 
@@ -68,38 +88,191 @@ class JumpDiffusionModel():
             Number of simulated paths (trajectories) to generate.
         N : int
             Number of time steps in each path.
+        Z : ndarray, optional
+            Standard normal draws with shape (M, N) driving the asset's Brownian motion, e.g. correlated
+            across assets by MultiAssetModel. Drawn internally when omitted.
+        out : ndarray, optional
+            A preallocated array with shape (M, N + 1) to write the price paths into.
+        times : ndarray, optional
+            Increasing observation times in (0, T]. When given, the paths step directly from one
+            observation to the next (the diffusion and the compound Poisson jumps are sampled exactly),
+            and N is the number of observation times.
+        stratified : int, optional
+            The number of equal-probability strata of the terminal value of the Brownian motion,
+            with paths allocated proportionally and ordered by stratum (see models.stratification).
+            Ignored when Z is supplied. Defaults to no stratification.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z, jumps and jump_sizes (see models.innovations).
+            Missing ones are drawn.
 
         Returns:
         --------
         S : ndarray
-            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps.
+            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps,
+            or (B, M, N + 1) for a batch of B parameter sets (see models.batching).
         """
         
-        # Calculate time increment for each step
-        dt = T / N  
+        # Calculate time increment for each step: uniform, or between consecutive observation times
+        if times is None:
+            dt = np.full(N, T / N)
+        else:
+            dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)
+            N = len(dt)
+
+        # Draw the standard normals driving the Brownian motion unless they are supplied, with the
+        # terminal value of the Brownian motion stratified (paths ordered by stratum)
+        source = InnovationSource(innovations)
+        if Z is None:
+            Z = source.draw("Z", (M, N), lambda: brownian_normals(M, N, dt, stratified))
+
+        # Parameters, as (B, 1) columns for a batch of parameter sets sharing the normals
+        batch = batch_shape(self)
+        mu, sigma, lambda_J, mu_J, sigma_J = batch_parameters(self, "mu", "sigma", "lambda_J", "mu_J", "sigma_J")
+
+        # Draw the jump counts of every step (per parameter set, as their intensity differs) and the
+        # normals driving the sums of their log sizes
+        Jumps = source.draw("jumps", batch + (M, N), lambda: np.random.poisson(np.expand_dims(lambda_J, -1) * dt, batch + (M, N)))
+        JumpSizes = source.draw("jump_sizes", (M, N), lambda: np.random.normal(size=(M, N)))
 
-        # Initialize array to hold asset price paths
-        S = np.zeros((M, N + 1))  
+        # Initialize array to hold asset price paths (or write into the supplied one)
+        S = np.zeros(batch + (M, N + 1)) if out is None else out
         
-        S[:, 0] = S0  # Set initial price for all paths
+        S[..., 0] = S0  # Set initial price for all paths
 
         for t in range(1, N + 1):
             # Generate Brownian motion increment
-            dW = np.random.normal(scale=np.sqrt(dt), size=M)
+            dW = np.sqrt(dt[t - 1]) * Z[:, t - 1]
 
             # Calculate price process without jumps
-            S[:, t] = S[:, t - 1] * np.exp(
-                (self.mu - 0.5 * self.sigma ** 2) * dt + 
-                self.sigma * dW
+            S[..., t] = S[..., t - 1] * np.exp(
+                (mu - 0.5 * sigma ** 2) * dt[t - 1] + 
+                sigma * dW
             )
 
-            # Generate jump component
-            Jumps = np.random.poisson(self.lambda_J * dt, M)  # Number of jumps per path
-            JumpSizes = np.exp(
-                np.random.normal(self.mu_J, self.sigma_J, M)
-            ) - 1  # Size of each jump
-
-            # Adjust asset price for jumps
-            S[:, t] *= (1 + Jumps * JumpSizes)
+            # Adjust asset price for jumps: the product of n lognormal jumps is lognormal with
+            # mean n * mu_J and variance n * sigma_J^2 of its logarithm
+            S[..., t] *= np.exp(
+                Jumps[..., t - 1] * mu_J + np.sqrt(Jumps[..., t - 1]) * sigma_J * JumpSizes[:, t - 1]
+            )
 
         return S
+
+    @instrumented("M")
+    def simulate_conditional(
+        self,
+        S0: float,
+        T: float,
+        M: int,
+        N: int,
+        tolerance: float = 1e-10,
+        times: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+        innovations: Optional[dict] = None
+    ):
+        """
+        Simulates asset price paths stratified by the number of jumps up to T.
+
+        Conditioning on the jump count removes the (dominant) variance contributed by the Poisson
+        process: the paths are split across strata of 0, 1, 2, ... jumps in proportion to their
+        Poisson probabilities, every path of a stratum carries exactly that many jumps at uniformly
+        distributed times, and each path is weighted by its stratum's probability divided by the
+        number of paths allocated to it. The paths left over by the rounding sample the jump counts
+        of the strata too unlikely for a path of their own (all of them when M is small against the
+        expected number of jumps), weighted by their total probability.
+
+        Parameters:
+        -----------
+        S0 : float
+            Initial asset price.
+        T : float
+            Total time horizon for the simulation.
+        M : int
+            Number of simulated paths (trajectories) to generate.
+        N : int
+            Number of time steps in each path.
+        tolerance : float, optional
+            The maximum Poisson probability mass of the jump counts left unsampled. Defaults to 1e-10.
+        times : ndarray, optional
+            Increasing observation times in (0, T]. When given, the paths step directly from one
+            observation to the next and N is the number of observation times.
+        out : ndarray, optional
+            A preallocated array with shape (M, N + 1) to write the price paths into.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z, jump_counts, jump_times and jump_sizes
+            (see models.innovations). Missing ones are drawn.
+
+        Returns:
+        --------
+        S : ndarray
+            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps.
+        W : ndarray
+            The weight of each path with shape (M,), summing to one (less the truncated tail), so that np.sum(W * payoff) estimates the expected payoff.
+        """
+
+        if batch_shape(self):
+            raise ValueError("Jump-conditional simulation does not support batched model parameters")
+
+        # Calculate time increment for each step: uniform, or between consecutive observation times
+        if times is None:
+            dt = np.full(N, T / N)
+        else:
+            dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)
+            N = len(dt)
+            T = np.sum(dt)
+
+        # Poisson probabilities of the jump counts (from their logarithms, which do not underflow for
+        # large intensities), truncated once the tail mass left unsampled is below the tolerance
+        rate = self.lambda_J * T
+        P, total = [], 0.0
+        while 1 - total > tolerance and (len(P) <= rate or P[-1] > 0):
+            k = len(P)
+            P.append(np.exp((k * np.log(rate) if k else 0.0) - rate - math.lgamma(k + 1)))
+            total += P[-1]
+        P = np.array(P)
+
+        # Proportional allocation of paths to strata, each path weighted by its stratum's probability
+        # divided by its number of paths
+        counts = np.floor(M * P).astype(int)
+        spare = M - counts.sum()
+        tail = np.where(counts == 0, P, 0.0)
+
+        # The spare paths sample the strata left without a path from their conditional distribution,
+        # weighted by their total probability; a stratum gives up a path if none is spare
+        if tail.sum() == 0:
+            counts[np.argmax(P)] += spare
+            spare = 0
+        elif spare == 0:
+            counts[np.argmax(counts)] -= 1
+            spare = 1
+
+        source = InnovationSource(innovations)
+        sampled = source.draw(
+            "jump_counts", (spare,),
+            lambda: np.random.choice(len(P), size=spare, p=tail / tail.sum()) if spare else np.zeros(0, dtype=int)
+        )
+
+        # Number of jumps and weight of every path
+        num_jumps = np.concatenate([np.repeat(np.arange(len(P)), counts), sampled]).astype(int)
+        W = np.concatenate([
+            np.repeat(np.divide(P, counts, out=np.zeros(len(P)), where=counts > 0), counts),
+            np.full(spare, tail.sum() / max(spare, 1))
+        ])
+
+        # Brownian log-price increments, as in simulate
+        dW = np.sqrt(dt) * source.draw("Z", (M, N), lambda: np.random.normal(size=(M, N)))
+        dX = (self.mu - 0.5 * self.sigma ** 2) * dt + self.sigma * dW
+
+        # Place each path's jumps at uniformly distributed times and add their log-sizes
+        path = np.repeat(np.arange(M), num_jumps)
+        JumpTimes = source.draw("jump_times", path.shape, lambda: np.random.uniform(size=path.size))
+        JumpSizes = source.draw("jump_sizes", path.shape, lambda: np.random.normal(size=path.size))
+        step = np.minimum(np.searchsorted(np.cumsum(dt), JumpTimes * T, side="right"), N - 1)
+        np.add.at(dX, (path, step), self.mu_J + self.sigma_J * JumpSizes)
+
+        # Initialize array to hold asset price paths (or write into the supplied one)
+        S = np.zeros((M, N + 1)) if out is None else out
+
+        S[:, 0] = S0  # Set initial price for all paths
+        S[:, 1:] = S0 * np.exp(np.cumsum(dX, axis=1))
+
+        return S, W
@@ -0,0 +1,340 @@
+"""
+Compiled kernels for the hot loops of the models and pricers.
+
+When Numba is installed the kernels are JIT compiled with parallel=True, each path being stepped in
+a single fused loop over time by its own thread; otherwise (or with OPTION_PRICING_BACKEND=numpy in
+the environment) the NumPy implementations step all paths at once. Both backends consume the same
+pre-drawn random inputs, so they produce the same paths up to floating point rounding.
+
+The model parameters may be scalars or (B, 1) columns of a batch of B parameter sets sharing the
+random inputs (see models.batching), the paths then having shape (B, M, N + 1).
+
+    from models import kernels
+    kernels.set_backend("numpy")
+"""
+
+import numpy as np
+import os
+
+try:
+    import numba
+except ImportError:  # Numba is optional, the NumPy kernels are used without it
+    numba = None
+
+# Prefer the OpenMP threading layer unless one is configured: the kernels are also called from the
+# worker threads of the pricing service, after which the TBB layer can hang at interpreter exit.
+if numba is not None and "NUMBA_THREADING_LAYER" not in os.environ:
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+
+# The active backend, "numba" or "numpy".
+BACKEND = None
+
+# Parallel range over paths in the compiled kernels (a plain range when they run as Python).
+prange = numba.prange if numba is not None else range
+
+
+def set_backend(backend: str):
+    """
+    Selects the backend used by every kernel.
+
+    Parameters:
+    -----------
+    backend : str
+        "numba" for the compiled kernels or "numpy" for the vectorized NumPy kernels.
+    """
+
+    global BACKEND
+
+    if backend not in ("numba", "numpy"):
+        raise ValueError(f"Unknown kernel backend '{backend}', expected 'numba' or 'numpy'")
+    if backend == "numba" and numba is None:
+        raise ImportError("The numba kernel backend requires Numba to be installed")
+
+    BACKEND = backend
+
+
+def jit(function, parallel: bool = True):
+    """
+    Compiles a kernel with Numba, parallel over paths unless parallel=False (for kernels without a
+    prange loop), or returns None when Numba is not installed.
+    """
+
+    if numba is None:
+        return None
+
+    return numba.njit(parallel=parallel, cache=True, nogil=True)(function)
+
+
+def _compiled_arguments(S: np.ndarray, jump_factors: np.ndarray, *parameters):
+    """
+    Flattens the (B, M, N + 1) paths of a batch (or (M, N + 1) paths, B = 1) into rows for a
+    compiled kernel, with the jump factors likewise and every parameter as an array of its B values.
+    """
+
+    B = S.shape[0] if S.ndim == 3 else 1
+    paths = S.reshape(-1, S.shape[-1])
+    jumps = np.empty((0, 0)) if jump_factors is None else jump_factors.reshape(-1, jump_factors.shape[-1])
+
+    return paths, jumps, [np.ascontiguousarray(np.broadcast_to(np.ravel(value), B), dtype=float) for value in parameters]
+
+
+def stochastic_volatility_paths(
+    S: np.ndarray,
+    Z1: np.ndarray,
+    Z2: np.ndarray,
+    mu: float,
+    kappa: float,
+    theta: float,
+    sigma: float,
+    rho: float,
+    dt: np.ndarray,
+    jump_factors: np.ndarray = None
+):
+    """
+    Steps the Heston price and variance processes with the Euler scheme, with optional multiplicative jumps, in place.
+
+    Parameters:
+    -----------
+    S : ndarray
+        The price paths with shape (M, N + 1) and the initial prices set in S[:, 0].
+    Z1 : ndarray
+        Standard normals with shape (M, N) driving the price.
+    Z2 : ndarray
+        Independent standard normals with shape (M, N), correlated with Z1 to drive the variance.
+    mu, kappa, theta, sigma, rho : float or ndarray
+        The drift, mean reversion rate, long-term variance (also the initial variance), volatility of
+        variance and price-variance correlation, as scalars or (B, 1) columns of a batch.
+    dt : ndarray
+        The time increment of each step with shape (N,).
+    jump_factors : ndarray, optional
+        The price multipliers (the product of the jumps) over each step with shape (M, N), or
+        (B, M, N) for a batch. Defaults to no jumps.
+
+    Returns:
+    --------
+    S : ndarray
+        The filled price paths.
+    """
+
+    if BACKEND == "numba":
+        paths, jumps, parameters = _compiled_arguments(S, jump_factors, mu, kappa, theta, sigma, rho)
+        _stochastic_volatility_compiled(paths, Z1, Z2, jumps, *parameters, dt)
+
+        # Copy back when the paths could not be flattened in place
+        if not np.shares_memory(paths, S):
+            S[...] = paths.reshape(S.shape)
+        return S
+
+    M, N = Z1.shape
+    sqrt_dt = np.sqrt(dt)
+    rho_bar = np.sqrt(1 - rho ** 2)
+
+    # Only the current variance of every path is kept
+    V = np.full(S.shape[:-1], theta, dtype=float)
+
+    for t in range(1, N + 1):
+        sqrt_V = np.sqrt(V)
+
+        # Simulate the asset price process
+        S[..., t] = S[..., t - 1] * np.exp((mu - 0.5 * V) * dt[t - 1] + sqrt_V * (sqrt_dt[t - 1] * Z1[:, t - 1]))
+
+        # Adjust price paths for jumps
+        if jump_factors is not None:
+            S[..., t] *= jump_factors[..., t - 1]
+
+        # Simulate the variance process, driven by the correlated increment rho * Z1 + sqrt(1 - rho^2) * Z2
+        V = np.maximum(
+            V + kappa * (theta - V) * dt[t - 1] +
+            sigma * sqrt_V * (sqrt_dt[t - 1] * (rho * Z1[:, t - 1] + rho_bar * Z2[:, t - 1])), 0
+        )
+
+    return S
+
+
+def _stochastic_volatility_loop(S, Z1, Z2, jumps, mu, kappa, theta, sigma, rho, dt):
+    """
+    The fused per-path loop compiled for the numba backend (jumps is empty when there are none).
+
+    The rows of S are the M paths of each of the B parameter sets in turn, row i using the
+    parameters of set i // M and the random inputs of path i % M.
+    """
+
+    M, N = Z1.shape
+    sqrt_dt = np.sqrt(dt)
+    has_jumps = jumps.shape[0] > 0
+    batched_jumps = jumps.shape[0] == S.shape[0]
+
+    for i in prange(S.shape[0]):
+        b = i // M
+        k = i - b * M
+        j = k + b * M * batched_jumps
+        rho_bar = np.sqrt(1 - rho[b] ** 2)
+        v = theta[b]
+
+        for t in range(1, N + 1):
+            sqrt_v = np.sqrt(v)
+
+            s = S[i, t - 1] * np.exp((mu[b] - 0.5 * v) * dt[t - 1] + sqrt_v * (sqrt_dt[t - 1] * Z1[k, t - 1]))
+            if has_jumps:
+                s *= jumps[j, t - 1]
+            S[i, t] = s
+
+            v = max(
+                v + kappa[b] * (theta[b] - v) * dt[t - 1] +
+                sigma[b] * sqrt_v * (sqrt_dt[t - 1] * (rho[b] * Z1[k, t - 1] + rho_bar * Z2[k, t - 1])), 0.0
+            )
+
+
+_stochastic_volatility_compiled = jit(_stochastic_volatility_loop)
+
+
+def stochastic_volatility_qe_paths(
+    S: np.ndarray,
+    Z1: np.ndarray,
+    Z2: np.ndarray,
+    U: np.ndarray,
+    mu: float,
+    kappa: float,
+    theta: float,
+    sigma: float,
+    rho: float,
+    dt: np.ndarray,
+    jump_factors: np.ndarray = None
+):
+    """
+    Steps the Heston price and variance processes with Andersen's quadratic-exponential (QE) scheme, in place.
+
+    The variance is drawn from a moment matched approximation of its exact transition (a scaled
+    squared normal when the variance is well away from zero, a mixture of zero and an exponential
+    otherwise), and the log price from its exact conditional mean and variance given the variances
+    at both ends of the step (trapezoidal rule for the integrated variance). Unlike the Euler scheme
+    it stays accurate for steps of months, so paths can be simulated at the observation dates only.
+
+    Parameters:
+    -----------
+    S : ndarray
+        The price paths with shape (M, N + 1) and the initial prices set in S[:, 0].
+    Z1 : ndarray
+        Standard normals with shape (M, N) driving the price, independently of the variance.
+    Z2 : ndarray
+        Independent standard normals with shape (M, N) driving the variance (quadratic branch).
+    U : ndarray
+        Independent uniforms on [0, 1) with shape (M, N) driving the variance (exponential branch).
+    mu, kappa, theta, sigma, rho : float or ndarray
+        The drift, mean reversion rate, long-term variance (also the initial variance), volatility of
+        variance and price-variance correlation, as scalars or (B, 1) columns of a batch.
+    dt : ndarray
+        The time increment of each step with shape (N,).
+    jump_factors : ndarray, optional
+        The price multipliers (the product of the jumps) over each step with shape (M, N), or
+        (B, M, N) for a batch. Defaults to no jumps.
+
+    Returns:
+    --------
+    S : ndarray
+        The filled price paths.
+    """
+
+    if BACKEND == "numba":
+        paths, jumps, parameters = _compiled_arguments(S, jump_factors, mu, kappa, theta, sigma, rho)
+        _stochastic_volatility_qe_compiled(paths, Z1, Z2, U, jumps, *parameters, dt)
+
+        # Copy back when the paths could not be flattened in place
+        if not np.shares_memory(paths, S):
+            S[...] = paths.reshape(S.shape)
+        return S
+
+    M, N = Z1.shape
+
+    # Only the current variance and log price of every path are kept
+    V = np.full(S.shape[:-1], theta, dtype=float)
+    X = np.log(S[..., 0])
+
+    for t in range(1, N + 1):
+        h = dt[t - 1]
+        decay = np.exp(-kappa * h)
+
+        # Conditional mean and variance of the next variance, and their ratio psi
+        m = theta + (V - theta) * decay
+        s2 = V * sigma ** 2 * decay * (1 - decay) / kappa + theta * sigma ** 2 * (1 - decay) ** 2 / (2 * kappa)
+        psi = s2 / m ** 2
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Quadratic branch: a (b + Z)^2, used for psi <= 1.5
+            b2 = 2 / psi - 1 + np.sqrt(2 / psi) * np.sqrt(np.maximum(2 / psi - 1, 0))
+            quadratic = m / (1 + b2) * (np.sqrt(b2) + Z2[:, t - 1]) ** 2
+
+            # Exponential branch: zero with probability p, exponential with rate beta otherwise
+            p = (psi - 1) / (psi + 1)
+            exponential = np.where(U[:, t - 1] <= p, 0.0, np.log((1 - p) / (1 - U[:, t - 1])) * m / (1 - p))
+
+        V_next = np.where(psi <= 1.5, quadratic, exponential)
+
+        # Log price given both variances, the correlated part entering through the variance increment
+        X = X + (
+            mu * h - rho * kappa * theta * h / sigma +
+            (0.5 * h * (kappa * rho / sigma - 0.5) - rho / sigma) * V +
+            (0.5 * h * (kappa * rho / sigma - 0.5) + rho / sigma) * V_next +
+            np.sqrt(0.5 * h * (1 - rho ** 2) * (V + V_next)) * Z1[:, t - 1]
+        )
+
+        # Adjust price paths for jumps
+        if jump_factors is not None:
+            X = X + np.log(jump_factors[..., t - 1])
+
+        S[..., t] = np.exp(X)
+        V = V_next
+
+    return S
+
+
+def _stochastic_volatility_qe_loop(S, Z1, Z2, U, jumps, mu, kappa, theta, sigma, rho, dt):
+    """
+    The fused per-path QE loop compiled for the numba backend (jumps is empty when there are none),
+    with the rows of S laid out as in _stochastic_volatility_loop.
+    """
+
+    M, N = Z1.shape
+    has_jumps = jumps.shape[0] > 0
+    batched_jumps = jumps.shape[0] == S.shape[0]
+
+    for i in prange(S.shape[0]):
+        b = i // M
+        k = i - b * M
+        j = k + b * M * batched_jumps
+        mu_b, kappa_b, theta_b, sigma_b, rho_b = mu[b], kappa[b], theta[b], sigma[b], rho[b]
+        v = theta_b
+        x = np.log(S[i, 0])
+
+        for t in range(1, N + 1):
+            h = dt[t - 1]
+            decay = np.exp(-kappa_b * h)
+
+            m = theta_b + (v - theta_b) * decay
+            s2 = v * sigma_b ** 2 * decay * (1 - decay) / kappa_b + theta_b * sigma_b ** 2 * (1 - decay) ** 2 / (2 * kappa_b)
+            psi = s2 / m ** 2
+
+            if psi <= 1.5:
+                b2 = 2 / psi - 1 + np.sqrt(2 / psi) * np.sqrt(2 / psi - 1)
+                v_next = m / (1 + b2) * (np.sqrt(b2) + Z2[k, t - 1]) ** 2
+            else:
+                p = (psi - 1) / (psi + 1)
+                v_next = 0.0 if U[k, t - 1] <= p else np.log((1 - p) / (1 - U[k, t - 1])) * m / (1 - p)
+
+            x += (
+                mu_b * h - rho_b * kappa_b * theta_b * h / sigma_b +
+                (0.5 * h * (kappa_b * rho_b / sigma_b - 0.5) - rho_b / sigma_b) * v +
+                (0.5 * h * (kappa_b * rho_b / sigma_b - 0.5) + rho_b / sigma_b) * v_next +
+                np.sqrt(0.5 * h * (1 - rho_b ** 2) * (v + v_next)) * Z1[k, t - 1]
+            )
+            if has_jumps:
+                x += np.log(jumps[j, t - 1])
+
+            S[i, t] = np.exp(x)
+            v = v_next
+
+
+_stochastic_volatility_qe_compiled = jit(_stochastic_volatility_qe_loop)
+
+set_backend(os.environ.get("OPTION_PRICING_BACKEND", "numba" if numba is not None else "numpy"))
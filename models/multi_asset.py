@@ -0,0 +1,289 @@
+from typing import Optional
+from .instrumentation import instrumented
+from .stratification import stratify_normals
+from .innovations import InnovationSource
+import numpy as np
+
+class MultiAssetModel():
+    """
+    A joint model of several underlying assets whose Brownian drivers are correlated.
+
+    Each asset keeps its own single-asset model (Stationary, Jump Diffusion, Stochastic Volatility or
+    Stochastic Volatility Jump), so different model types can be mixed. The correlation applies to the
+    Brownian motions driving the asset prices; variance and jump processes stay asset specific.
+
+    For large baskets the correlation can instead be given by a factor model: asset k is driven by
+    B_k . F + sqrt(1 - |B_k|^2) e_k, with a few systematic factors F shared by all assets and an
+    idiosyncratic noise e_k, so no K x K factorization or (K, M, N) draw is needed.
+
+    Attributes:
+    -----------
+    asset_models : list[model]
+        The single-asset models of the underlying assets.
+    correlation : ndarray
+        The (K, K) correlation matrix of the assets' Brownian drivers.
+    cholesky : ndarray
+        The lower triangular Cholesky factor of the correlation matrix, or None for independent assets
+        and factor models.
+    factor_loadings : ndarray
+        The (K, F) loadings of the assets on the systematic factors, or None for a full correlation matrix.
+
+    Methods:
+    --------
+    simulate(S0, T, M, N):
+        Simulates the joint price paths of all assets.
+    simulate_basket(S0, weights, T, M, N):
+        Simulates the paths of a weighted basket of the assets.
+    """
+
+    def __init__(
+        self,
+        asset_models: list,
+        correlation: Optional[np.ndarray] = None,
+        factor_loadings: Optional[np.ndarray] = None
+    ):
+        """
+        Initializes a MultiAssetModel and factorizes its correlation matrix once.
+
+        Parameters:
+        -----------
+        asset_models : list[model]
+            The single-asset models of the underlying assets.
+        correlation : ndarray, optional
+            The (K, K) correlation matrix of the assets' Brownian drivers. Defaults to independent assets.
+        factor_loadings : ndarray, optional
+            The (K, F) loadings of the assets on F systematic factors, used instead of a correlation matrix.
+            Each row must have a Euclidean norm of at most one.
+        """
+
+        self.asset_models = list(asset_models)
+        self.factor_loadings = None
+
+        if factor_loadings is not None:
+            if correlation is not None:
+                raise ValueError("Specify either a correlation matrix or factor loadings, not both")
+
+            self.factor_loadings = np.atleast_2d(np.asarray(factor_loadings, dtype=float))
+            loading = np.sum(self.factor_loadings ** 2, axis=1)
+
+            if np.any(loading > 1):
+                raise ValueError("The factor loadings of each asset must have a norm of at most one")
+
+            # Idiosyncratic volatility of each asset's Brownian driver
+            self.idiosyncratic = np.sqrt(1 - loading)
+
+            self.correlation = self.factor_loadings @ self.factor_loadings.T + np.diag(1 - loading)
+            self.cholesky = None
+
+        elif correlation is None:
+            self.correlation = np.eye(len(self.asset_models))
+            self.cholesky = None
+        else:
+            self.correlation = np.asarray(correlation, dtype=float)
+            self.cholesky = np.linalg.cholesky(self.correlation)
+
+    @instrumented("M")
+    def simulate(
+        self,
+        S0: list[float],
+        T: float,
+        M: int,
+        N: int,
+        out: Optional[np.ndarray] = None,
+        stratified: Optional[int] = None,
+        direction: Optional[np.ndarray] = None,
+        innovations: Optional[dict] = None
+    ):
+        """
+        Simulates the joint price paths of all assets.
+
+        A single (K, M, N) block of standard normals is drawn and correlated in place with the Cholesky
+        factor, then every asset model writes its paths directly into one preallocated array.
+
+        Parameters:
+        -----------
+        S0 : list[float]
+            Initial price of each asset.
+        T : float
+            Total time horizon for the simulation.
+        M : int
+            Number of simulated paths (trajectories) to generate.
+        N : int
+            Number of time steps in each path.
+        out : ndarray, optional
+            A preallocated array with shape (K, M, N + 1) to write the price paths into.
+        stratified : int, optional
+            The number of equal-probability strata of the direction combination of the assets' terminal
+            Brownian values (see models.stratification). Defaults to no stratification.
+        direction : ndarray, optional
+            The (K,) exposures of the payoff to the assets' Brownian motions whose combination is
+            stratified. Defaults to equal exposures.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z, or F and E<k> with factor loadings,
+            and the assets' own innovations under "assets" (see models.innovations). Missing ones are drawn.
+
+        Returns:
+        --------
+        S : ndarray
+            Simulated asset price paths with shape (K, M, N + 1), where K is the number of assets.
+        """
+
+        K = len(self.asset_models)
+        source = InnovationSource(innovations)
+        assets = source.get("assets", [None] * K)
+
+        # Initialize array to hold the price paths of all assets (or write into the supplied one)
+        S = np.empty((K, M, N + 1)) if out is None else out
+
+        if self.factor_loadings is not None:
+            # Draw the systematic factors once and each asset's idiosyncratic noise on the fly
+            F = self._factors(source, T, M, N, stratified, direction)
+
+            for k in range(K):
+                self.asset_models[k].simulate(
+                    S0=S0[k], T=T, M=M, N=N, Z=self._factor_normals(F, k, source), out=S[k], innovations=assets[k]
+                )
+
+            return S
+
+        # Draw the standard normals of every asset at once
+        Z = source.draw(
+            "Z", (K, M, N), lambda: self._stratify(np.random.normal(size=(K, M, N)), T, N, stratified, direction)
+        )
+
+        # Correlate the draws in place: row k of the lower triangular factor only combines
+        # rows l <= k, so updating from the last asset down never reads an overwritten row
+        if self.cholesky is not None:
+            for k in reversed(range(K)):
+                Z[k] = np.tensordot(self.cholesky[k, :k + 1], Z[:k + 1], axes=1)
+
+        for k in range(K):
+            self.asset_models[k].simulate(S0=S0[k], T=T, M=M, N=N, Z=Z[k], out=S[k], innovations=assets[k])
+
+        return S
+
+    @instrumented("M")
+    def simulate_basket(
+        self,
+        S0: list[float],
+        weights: list[float],
+        T: float,
+        M: int,
+        N: int,
+        log_weights: Optional[list[float]] = None,
+        stratified: Optional[int] = None,
+        direction: Optional[np.ndarray] = None,
+        innovations: Optional[dict] = None
+    ):
+        """
+        Simulates the paths of a weighted basket of the assets.
+
+        With factor loadings the assets are simulated one at a time into a reused buffer and their
+        weighted prices accumulated on the fly, so memory grows with the number of factors rather
+        than the number of assets and the (K, M, N + 1) array of asset paths is never materialized.
+
+        Parameters:
+        -----------
+        S0 : list[float]
+            Initial price of each asset.
+        weights : list[float]
+            The weight of each asset in the basket.
+        T : float
+            Total time horizon for the simulation.
+        M : int
+            Number of simulated paths (trajectories) to generate.
+        N : int
+            Number of time steps in each path.
+        log_weights : list[float], optional
+            When given, the weighted sum of the assets' terminal log-prices (a log geometric basket)
+            is accumulated as well. Defaults to None.
+        stratified : int, optional
+            The number of equal-probability strata, as in simulate. Defaults to no stratification.
+        direction : ndarray, optional
+            The (K,) exposures whose combination is stratified, as in simulate. Defaults to equal exposures.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them, as in simulate.
+
+        Returns:
+        --------
+        B : ndarray
+            Simulated basket price paths with shape (M, N + 1).
+        G : ndarray
+            The log geometric basket at T with shape (M,), only returned when log_weights are given.
+        """
+
+        if self.factor_loadings is None:
+            S = self.simulate(S0=S0, T=T, M=M, N=N, stratified=stratified, direction=direction, innovations=innovations)
+
+            # Weighted sum across assets of the jointly simulated paths
+            B = np.tensordot(weights, S, axes=1)
+
+            if log_weights is None:
+                return B
+
+            return B, np.tensordot(log_weights, np.log(S[:, :, -1]), axes=1)
+
+        # Draw the systematic factors once
+        source = InnovationSource(innovations)
+        assets = source.get("assets", [None] * len(self.asset_models))
+        F = self._factors(source, T, M, N, stratified, direction)
+
+        # Initialize the basket paths and a buffer reused for every asset's paths
+        B = np.zeros((M, N + 1))
+        G = np.zeros(M)
+        S = np.empty((M, N + 1))
+
+        for k in range(len(self.asset_models)):
+            self.asset_models[k].simulate(
+                S0=S0[k], T=T, M=M, N=N, Z=self._factor_normals(F, k, source), out=S, innovations=assets[k]
+            )
+
+            if log_weights is not None:
+                G += log_weights[k] * np.log(S[:, -1])
+
+            # Accumulate the weighted asset price into the basket
+            S *= weights[k]
+            B += S
+
+        if log_weights is None:
+            return B
+
+        return B, G
+
+    def _factors(self, source: InnovationSource, T: float, M: int, N: int, stratified: Optional[int], direction: Optional[np.ndarray]):
+        """
+        Draws (or takes from the innovations) the normals of the systematic factors.
+        """
+
+        shape = (self.factor_loadings.shape[1], M, N)
+
+        return source.draw("F", shape, lambda: self._stratify(np.random.normal(size=shape), T, N, stratified, direction))
+
+    def _stratify(self, X: np.ndarray, T: float, N: int, stratified: Optional[int], direction: Optional[np.ndarray]):
+        """
+        Stratifies, in place, the independent normals X (the uncorrelated asset normals, or the systematic
+        factors of a factor model) along the direction combination of the assets' Brownian motions.
+        """
+
+        if stratified is None:
+            return X
+
+        direction = np.ones(len(self.asset_models)) if direction is None else np.asarray(direction, dtype=float)
+
+        # The combination of the assets' normals expressed in the independent normals they are built from
+        if self.factor_loadings is not None:
+            direction = self.factor_loadings.T @ direction
+        elif self.cholesky is not None:
+            direction = self.cholesky.T @ direction
+
+        return stratify_normals(X, stratified, np.full(N, T / N), direction)
+
+    def _factor_normals(self, F: np.ndarray, k: int, source: InnovationSource):
+        """
+        Combines the systematic factors with the idiosyncratic noise E<k> into the standard normals of asset k.
+        """
+
+        Z = self.idiosyncratic[k] * source.draw(f"E{k}", F.shape[1:], lambda: np.random.normal(size=F.shape[1:]))
+        Z += np.tensordot(self.factor_loadings[k], F, axes=1)
+
+        return Z
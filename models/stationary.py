@@ -1,3 +1,8 @@
+from typing import Optional
+from .instrumentation import instrumented
+from .stratification import brownian_normals
+from .innovations import InnovationSource
+from .batching import batch_shape, batch_parameters
 import numpy as np
 
 class StationaryModel():
@@ -7,9 +12,9 @@ class StationaryModel():
 
     Attributes:
     -----------
-    mu : float
+    mu : float or ndarray
         The drift rate of the asset's return, representing the average rate of return of the asset.
-    sigma : float
+    sigma : float or ndarray
         The volatility of the asset's return, representing the standard deviation of the return.
 
     Methods:
@@ -37,7 +42,19 @@ class StationaryModel():
         self.mu = mu
         self.sigma = sigma
 
-    def simulate(self, S0: float, T: float, M: int, N: int):
+    @instrumented("M")
+    def simulate(
+        self,
+        S0: float,
+        T: float,
+        M: int,
+        N: int,
+        Z: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+        times: Optional[np.ndarray] = None,
+        stratified: Optional[int] = None,
+        innovations: Optional[dict] = None
+    ):
         """
         Simulates the path of the asset price over time using Geometric Brownian Motion (GBM).
 
@@ -51,29 +68,59 @@ class StationaryModel():
             Number of simulated paths (trajectories) to generate.
         N : int
             Number of time steps in each path.
+        Z : ndarray, optional
+            Standard normal draws with shape (M, N) driving the asset's Brownian motion, e.g. correlated
+            across assets by MultiAssetModel. Drawn internally when omitted.
+        out : ndarray, optional
+            A preallocated array with shape (M, N + 1) to write the price paths into.
+        times : ndarray, optional
+            Increasing observation times in (0, T]. When given, the paths step directly from one
+            observation to the next (GBM is sampled exactly, so no accuracy is lost), and N is the
+            number of observation times.
+        stratified : int, optional
+            The number of equal-probability strata of the terminal value of the Brownian motion,
+            with paths allocated proportionally and ordered by stratum (see models.stratification).
+            Ignored when Z is supplied. Defaults to no stratification.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z (see models.innovations).
+            Missing ones are drawn.
 
         Returns:
         --------
         S : ndarray
-            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps.
+            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps,
+            or (B, M, N + 1) for a batch of B parameter sets (see models.batching).
         """
 
-        # Calculate time increment for each step
-        dt = T / N  
+        # Calculate time increment for each step: uniform, or between consecutive observation times
+        if times is None:
+            dt = np.full(N, T / N)
+        else:
+            dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)
+            N = len(dt)
+
+        # Draw the standard normals driving the Brownian motion unless they are supplied, with the
+        # terminal value of the Brownian motion stratified (paths ordered by stratum)
+        source = InnovationSource(innovations)
+        if Z is None:
+            Z = source.draw("Z", (M, N), lambda: brownian_normals(M, N, dt, stratified))
+
+        # Parameters, as (B, 1) columns for a batch of parameter sets sharing the draws
+        mu, sigma = batch_parameters(self, "mu", "sigma")
 
-        # Initialize array to hold asset price paths
-        S = np.zeros((M, N + 1))  
+        # Initialize array to hold asset price paths (or write into the supplied one)
+        S = np.zeros(batch_shape(self) + (M, N + 1)) if out is None else out
 
-        S[:, 0] = S0    # Set initial price for all paths
+        S[..., 0] = S0    # Set initial price for all paths
 
         for t in range(1, N + 1):
             # Generate Brownian motion increment
-            dW = np.random.normal(scale=np.sqrt(dt), size=M)
+            dW = np.sqrt(dt[t - 1]) * Z[:, t - 1]
             
             # Calculate price process with GBM
-            S[:, t] = S[:, t - 1] * np.exp(
-                (self.mu - 0.5 * self.sigma ** 2) * dt +
-                self.sigma * dW
+            S[..., t] = S[..., t - 1] * np.exp(
+                (mu - 0.5 * sigma ** 2) * dt[t - 1] +
+                sigma * dW
             )
 
         return S
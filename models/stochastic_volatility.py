@@ -1,3 +1,9 @@
+from typing import Optional
+from .instrumentation import instrumented
+from .stratification import brownian_normals
+from .innovations import InnovationSource
+from .batching import batch_shape, batch_parameters
+from . import kernels
 import numpy as np
 
 class StochasticVolatilityModel():
@@ -6,15 +12,15 @@ class StochasticVolatilityModel():
 
     Attributes:
     -----------
-    mu : float
+    mu : float or ndarray
         The drift rate of the asset's return.
-    kappa : float
+    kappa : float or ndarray
         The rate at which the variance reverts to the long-term mean.
-    theta : float
+    theta : float or ndarray
         The long-term mean of the variance.
-    sigma : float
+    sigma : float or ndarray
         The volatility of the variance process.
-    rho : float
+    rho : float or ndarray
         The correlation between the asset price and variance processes.
 
     Methods:
@@ -53,7 +59,19 @@ class StochasticVolatilityModel():
         self.sigma = sigma
         self.rho = rho
 
-    def simulate(self, S0: float, T: float, M: int, N: int):
+    @instrumented("M")
+    def simulate(
+        self,
+        S0: float,
+        T: float,
+        M: int,
+        N: int,
+        Z: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+        times: Optional[np.ndarray] = None,
+        stratified: Optional[int] = None,
+        innovations: Optional[dict] = None
+    ):
         """
         Simulates the path of the asset price and variance over time incorporating stochastic volatility.
 
@@ -67,40 +85,60 @@ class StochasticVolatilityModel():
             Number of simulated paths (trajectories) to generate.
         N : int
             Number of time steps in each path.
+        Z : ndarray, optional
+            Standard normal draws with shape (M, N) driving the asset's Brownian motion, e.g. correlated
+            across assets by MultiAssetModel. Drawn internally when omitted.
+        out : ndarray, optional
+            A preallocated array with shape (M, N + 1) to write the price paths into.
+        times : ndarray, optional
+            Increasing observation times in (0, T]. When given, the paths step directly from one
+            observation to the next with Andersen's QE scheme, which stays accurate for long steps,
+            and N is the number of observation times.
+        stratified : int, optional
+            The number of equal-probability strata of the terminal value of the Brownian motion,
+            with paths allocated proportionally and ordered by stratum (see models.stratification).
+            Ignored when Z is supplied. Defaults to no stratification.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z, Z2 and U (see models.innovations).
+            Missing ones are drawn.
 
         Returns:
         --------
         S : ndarray
-            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps.
+            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps,
+            or (B, M, N + 1) for a batch of B parameter sets (see models.batching).
         """
 
-        # Calculate time increment for each step
-        dt = T / N  
-
-        # Initialize arrays to hold asset price paths and variance paths
-        S = np.zeros((M, N + 1))
-        V = np.zeros((M, N + 1))
-
-        S[:, 0] = S0            # Set initial price for all paths
-        V[:, 0] = self.theta    # Set initial variance to the long-term mean
-
-        for t in range(1, N + 1):
-            # Generate correlated Brownian motion increments
-            Z1 = np.random.normal(size=(M,))
-            Z2 = np.random.normal(size=(M,))
-            dW_1 = np.sqrt(dt) * Z1
-            dW_2 = np.sqrt(dt) * (self.rho * Z1 + np.sqrt(1 - self.rho**2) * Z2)
-
-            # Simulate the variance process
-            V[:, t] = np.maximum(
-                V[:, t - 1] + self.kappa * (self.theta - V[:, t - 1]) * dt +
-                self.sigma * np.sqrt(V[:, t - 1]) * dW_2, 0
-            )
-
-            # Simulate the asset price process with stochastic volatility
-            S[:, t] = S[:, t - 1] * np.exp(
-                (self.mu - 0.5 * V[:, t - 1]) * dt +
-                np.sqrt(V[:, t - 1]) * dW_1
-            )
+        # Calculate time increment for each step: uniform, or between consecutive observation times
+        if times is None:
+            dt = np.full(N, T / N)
+        else:
+            dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)
+            N = len(dt)
+
+        # Draw the standard normals driving the asset's Brownian motion unless they are supplied, with the
+        # terminal value of the Brownian motion stratified (paths ordered by stratum)
+        source = InnovationSource(innovations)
+        if Z is None:
+            Z = source.draw("Z", (M, N), lambda: brownian_normals(M, N, dt, stratified))
+
+        # Draw the independent normals of the variance process up front
+        Z2 = source.draw("Z2", (M, N), lambda: np.random.normal(size=(M, N)))
+
+        # Parameters, as (B, 1) columns for a batch of parameter sets sharing the draws
+        parameters = batch_parameters(self, "mu", "kappa", "theta", "sigma", "rho")
+
+        # Initialize array to hold asset price paths (or write into the supplied one)
+        S = np.zeros(batch_shape(self) + (M, N + 1)) if out is None else out
+        S[..., 0] = S0  # Set initial price for all paths
+
+        # Step the price and variance (initially the long-term mean) of every path, with the QE
+        # scheme between observation times (the supplied normals then drive the price given the variance)
+        if times is None:
+            kernels.stochastic_volatility_paths(S, Z, Z2, *parameters, dt)
+        else:
+            U = source.draw("U", (M, N), lambda: np.random.uniform(size=(M, N)))
+
+            kernels.stochastic_volatility_qe_paths(S, Z, Z2, U, *parameters, dt)
 
         return S
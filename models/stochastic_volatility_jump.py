@@ -1,3 +1,9 @@
+from typing import Optional
+from .instrumentation import instrumented
+from .stratification import brownian_normals
+from .innovations import InnovationSource
+from .batching import batch_shape, batch_parameters
+from . import kernels
 import numpy as np
 
 class StochasticVolatilityJumpModel():
@@ -7,21 +13,21 @@ class StochasticVolatilityJumpModel():
 
     Attributes:
     -----------
-    mu : float
+    mu : float or ndarray
         The drift rate of the asset's return.
-    kappa : float
+    kappa : float or ndarray
         The rate at which the variance reverts to the long-term mean.
-    theta : float
+    theta : float or ndarray
         The long-term mean of the variance.
-    sigma : float
+    sigma : float or ndarray
         The volatility of the variance process.
-    rho : float
+    rho : float or ndarray
         The correlation between the asset price and variance processes.
-    lambda_J : float
+    lambda_J : float or ndarray
         The intensity (or rate) of the jump process, i.e., the average number of jumps per unit time.
-    mu_J : float
+    mu_J : float or ndarray
         The mean of the log-normal distribution for jump sizes.
-    sigma_J : float
+    sigma_J : float or ndarray
         The standard deviation of the log-normal distribution for jump sizes.
 
     Methods:
@@ -73,7 +79,19 @@ class StochasticVolatilityJumpModel():
         self.mu_J = mu_J
         self.sigma_J = sigma_J
 
-    def simulate(self, S0: float, T: float, M: int, N: int):
+    @instrumented("M")
+    def simulate(
+        self,
+        S0: float,
+        T: float,
+        M: int,
+        N: int,
+        Z: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+        times: Optional[np.ndarray] = None,
+        stratified: Optional[int] = None,
+        innovations: Optional[dict] = None
+    ):
         """
         Simulates the path of the asset price and variance over time incorporating
         stochastic volatility and jumps.
@@ -90,49 +108,70 @@ class StochasticVolatilityJumpModel():
             Number of simulated paths (trajectories) to generate.
         N : int
             Number of time steps in each path.
+        Z : ndarray, optional
+            Standard normal draws with shape (M, N) driving the asset's Brownian motion, e.g. correlated
+            across assets by MultiAssetModel. Drawn internally when omitted.
+        out : ndarray, optional
+            A preallocated array with shape (M, N + 1) to write the price paths into.
+        times : ndarray, optional
+            Increasing observation times in (0, T]. When given, the paths step directly from one
+            observation to the next with Andersen's QE scheme, which stays accurate for long steps,
+            and N is the number of observation times.
+        stratified : int, optional
+            The number of equal-probability strata of the terminal value of the Brownian motion,
+            with paths allocated proportionally and ordered by stratum (see models.stratification).
+            Ignored when Z is supplied. Defaults to no stratification.
+        innovations : dict, optional
+            The random inputs to use instead of drawing them: Z, Z2, jumps, jump_sizes and U (see models.innovations).
+            Missing ones are drawn.
 
         Returns:
         --------
         S : ndarray
-            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps.
+            Simulated asset price paths with shape (M, N + 1), where M is the number of paths and N + 1 is the number of time steps,
+            or (B, M, N + 1) for a batch of B parameter sets (see models.batching).
         """
 
-        # Calculate time increment for each step
-        dt = T / N  
-
-        # Initialize arrays to hold asset price paths and variance paths
-        S = np.zeros((M, N + 1))
-        V = np.zeros((M, N + 1))
-
-        S[:, 0] = S0            # Set initial price for all paths
-        V[:, 0] = self.theta    # Set initial variance to the long-term mean
-
-        for t in range(1, N + 1):
-            # Generate correlated Brownian motion increments
-            Z1 = np.random.normal(size=(M,))
-            Z2 = np.random.normal(size=(M,))
-            dW_1 = np.sqrt(dt) * Z1
-            dW_2 = np.sqrt(dt) * (self.rho * Z1 + np.sqrt(1 - self.rho**2) * Z2)
-
-            # Simulate the variance process
-            V[:, t] = np.maximum(
-                V[:, t - 1] + self.kappa * (self.theta - V[:, t - 1]) * dt +
-                self.sigma * np.sqrt(V[:, t - 1]) * dW_2, 0
-            )
-
-            # Simulate the asset price process without jumps
-            S[:, t] = S[:, t - 1] * np.exp(
-                (self.mu - 0.5 * V[:, t - 1]) * dt +
-                np.sqrt(V[:, t - 1]) * dW_1
-            )
-
-            # Generate jumps
-            Jumps = np.random.poisson(self.lambda_J * dt, M)  # Number of jumps per path
-            JumpSizes = np.exp(
-                np.random.normal(self.mu_J, self.sigma_J, M)
-            ) - 1  # Sizes of the jumps
-
-            # Adjust price paths for jumps
-            S[:, t] *= (1 + Jumps * JumpSizes)
+        # Calculate time increment for each step: uniform, or between consecutive observation times
+        if times is None:
+            dt = np.full(N, T / N)
+        else:
+            dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)
+            N = len(dt)
+
+        # Draw the standard normals driving the asset's Brownian motion unless they are supplied, with the
+        # terminal value of the Brownian motion stratified (paths ordered by stratum)
+        source = InnovationSource(innovations)
+        if Z is None:
+            Z = source.draw("Z", (M, N), lambda: brownian_normals(M, N, dt, stratified))
+
+        # Draw the independent normals of the variance process up front
+        Z2 = source.draw("Z2", (M, N), lambda: np.random.normal(size=(M, N)))
+
+        # Parameters, as (B, 1) columns for a batch of parameter sets sharing the normals
+        batch = batch_shape(self)
+        parameters = batch_parameters(self, "mu", "kappa", "theta", "sigma", "rho")
+        lambda_J, mu_J, sigma_J = (
+            np.expand_dims(value, -1) if batch else value
+            for value in batch_parameters(self, "lambda_J", "mu_J", "sigma_J")
+        )
+
+        # Draw the jumps of every step (the counts per parameter set) and combine them into price multipliers
+        Jumps = source.draw("jumps", batch + (M, N), lambda: np.random.poisson(lambda_J * dt, batch + (M, N)))
+        JumpSizes = source.draw("jump_sizes", (M, N), lambda: np.random.normal(size=(M, N)))
+        JumpFactors = np.exp(Jumps * mu_J + np.sqrt(Jumps) * sigma_J * JumpSizes)
+
+        # Initialize array to hold asset price paths (or write into the supplied one)
+        S = np.zeros(batch + (M, N + 1)) if out is None else out
+        S[..., 0] = S0  # Set initial price for all paths
+
+        # Step the price and variance (initially the long-term mean) of every path, with the QE
+        # scheme between observation times (the supplied normals then drive the price given the variance)
+        if times is None:
+            kernels.stochastic_volatility_paths(S, Z, Z2, *parameters, dt, JumpFactors)
+        else:
+            U = source.draw("U", (M, N), lambda: np.random.uniform(size=(M, N)))
+
+            kernels.stochastic_volatility_qe_paths(S, Z, Z2, U, *parameters, dt, JumpFactors)
 
         return S
@@ -0,0 +1,152 @@
+"""
+Stratified sampling of the terminal value of the Brownian motions driving the models.
+
+The paths are split into num_strata equal-probability strata of the terminal Brownian value
+(proportional allocation), the paths of stratum s being the consecutive block of stratum_labels == s.
+Within its stratum the terminal value of every path is drawn by inversion, and the Brownian path is
+bridged back to it by replacing the component of the standard normals along the terminal direction,
+so every time step keeps its exact joint distribution and path-dependent payoffs remain unbiased.
+"""
+
+from .instrumentation import count_draws
+import numpy as np
+
+
+# Coefficients of Acklam's rational approximation of the inverse normal distribution function.
+_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+
+
+def norm_ppf(p):
+    """
+    Evaluates the inverse of the standard normal distribution function (Acklam's approximation,
+    accurate to a relative error of about 1e-9).
+
+    Parameters:
+    -----------
+    p : float or ndarray
+        Probabilities in (0, 1).
+
+    Returns:
+    --------
+    ndarray
+        The standard normal quantiles of p.
+    """
+
+    p = np.asarray(p, dtype=float)
+    x = np.empty_like(p)
+
+    # Rational approximation in the central region, and in sqrt(-2 log p) in the tails
+    central = (p > 0.02425) & (p < 1 - 0.02425)
+    q = p[central] - 0.5
+    r = q * q
+    x[central] = (
+        (((((_A[0] * r + _A[1]) * r + _A[2]) * r + _A[3]) * r + _A[4]) * r + _A[5]) * q /
+        (((((_B[0] * r + _B[1]) * r + _B[2]) * r + _B[3]) * r + _B[4]) * r + 1)
+    )
+
+    tail = ~central
+    q = np.sqrt(-2 * np.log(np.minimum(p[tail], 1 - p[tail])))
+    value = (
+        (((((_C[0] * q + _C[1]) * q + _C[2]) * q + _C[3]) * q + _C[4]) * q + _C[5]) /
+        ((((_D[0] * q + _D[1]) * q + _D[2]) * q + _D[3]) * q + 1)
+    )
+    x[tail] = np.where(p[tail] < 0.5, value, -value)
+
+    return x
+
+
+def stratum_sizes(M: int, num_strata: int):
+    """
+    Allocates M paths to num_strata equal-probability strata, as evenly as possible.
+    """
+
+    if not 1 <= num_strata <= M:
+        raise ValueError(f"The number of strata must be between 1 and the number of paths, got {num_strata}")
+
+    return M // num_strata + (np.arange(num_strata) < M % num_strata)
+
+
+def stratum_labels(M: int, num_strata: int = None):
+    """
+    Returns the stratum of every path, or None without stratification.
+    """
+
+    if num_strata is None:
+        return None
+
+    return np.repeat(np.arange(num_strata), stratum_sizes(M, num_strata))
+
+
+def stratum_weights(M: int, num_strata: int = None):
+    """
+    Returns the weight of every path, its stratum's probability divided by the stratum's number of
+    paths (equal weights 1 / M when num_strata divides M).
+    """
+
+    if num_strata is None:
+        return np.full(M, 1 / M)
+
+    sizes = stratum_sizes(M, num_strata)
+
+    return np.repeat(1 / (num_strata * sizes), sizes)
+
+
+def stratify_normals(Z: np.ndarray, num_strata: int, dt: np.ndarray, direction: np.ndarray = None):
+    """
+    Stratifies, in place, the terminal value of the Brownian motion built from standard normals.
+
+    Parameters:
+    -----------
+    Z : ndarray
+        Independent standard normals with shape (M, N), or (K, M, N) for K Brownian motions.
+    num_strata : int
+        The number of equal-probability strata.
+    dt : ndarray
+        The time increment of each of the N steps.
+    direction : ndarray, optional
+        For K Brownian motions, the (K,) combination of their terminal values to stratify.
+
+    Returns:
+    --------
+    Z : ndarray
+        The normals, whose (combined) terminal Brownian value lies in stratum s on the paths labelled s.
+    """
+
+    M = Z.shape[-2]
+
+    # Unit vector of the terminal value in the space of the normals of a path
+    e = np.sqrt(dt / np.sum(dt))
+    if direction is not None:
+        direction = np.asarray(direction, dtype=float)
+        direction = direction / np.linalg.norm(direction)
+
+    # Stratified standard normal terminal values, drawn uniformly within each stratum
+    U = np.random.uniform(size=M)
+    count_draws(M)
+    target = norm_ppf(np.clip((stratum_labels(M, num_strata) + U) / num_strata, 1e-300, 1 - 1e-16))
+
+    # Replace the component of the normals along the terminal direction
+    if direction is None:
+        Z += np.outer(target - Z @ e, e)
+    else:
+        terminal = np.einsum("k,kmn,n->m", direction, Z, e)
+        Z += direction[:, None, None] * np.outer(target - terminal, e)[None]
+
+    return Z
+
+
+def brownian_normals(M: int, N: int, dt: np.ndarray, num_strata: int = None):
+    """
+    Draws the (M, N) standard normals of a Brownian motion, with its terminal value stratified when
+    num_strata is given (the draws themselves are counted by the caller).
+    """
+
+    Z = np.random.normal(size=(M, N))
+
+    return Z if num_strata is None else stratify_normals(Z, num_strata, dt)
@@ -0,0 +1,30 @@
+from models import JumpDiffusionModel
+from algorithms.closed_form import merton_digital_price
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("M, lambda_J", [(20, 10.0), (10, 1.0), (5, 10.0), (1, 0.5)])
+def test_conditional_simulation_with_more_strata_than_paths(M, lambda_J):
+    asset_model = JumpDiffusionModel(mu=0.05, sigma=0.2, lambda_J=lambda_J, mu_J=-0.05, sigma_J=0.1)
+
+    S, W = asset_model.simulate_conditional(100, 1, M, 10)
+
+    assert S.shape == (M, 11)
+    assert W.shape == (M,)
+    assert np.all(W >= 0)
+    assert np.sum(W) == pytest.approx(1, abs=1e-9)
+
+
+def test_conditional_simulation_is_unbiased_for_few_paths():
+    np.random.seed(0)
+    asset_model = JumpDiffusionModel(mu=0.05, sigma=0.2, lambda_J=10.0, mu_J=-0.05, sigma_J=0.1)
+
+    # The average over many runs of 5 paths of the probability of finishing above 120
+    estimates = []
+    for _ in range(20_000):
+        S, W = asset_model.simulate_conditional(100, 1, 5, 1)
+        estimates.append(np.sum(W * (S[:, -1] > 120)))
+
+    exact = merton_digital_price(asset_model, 100, 120, np.inf, 1)
+    assert np.mean(estimates) == pytest.approx(exact, abs=4 * np.std(estimates) / np.sqrt(len(estimates)))
@@ -0,0 +1,52 @@
+from models import StationaryModel
+from algorithms.portfolio import Price_Portfolio
+from algorithms.digital import Cash_Digital_Option
+from algorithms.barrier import Barrier_Option
+from algorithms.asian import Asian_Option
+import numpy as np
+import pytest
+
+
+def test_workers_price_a_book_mixing_simulation_and_deterministic_engines():
+    asset_model = StationaryModel(mu=0.05, sigma=0.2)
+    digital = {"pricer": Cash_Digital_Option, "asset_model": asset_model, "initial_price": 100, "strike": 105, "periods": 1, "payoff": 1, "num_timesteps": 20}
+    barrier = {"pricer": Barrier_Option, "asset_model": asset_model, "initial_price": 100, "barrier": 90, "strike": 100, "period": 1, "num_timesteps": 50, "barrier_up": False, "knock_in": False}
+
+    contracts = [
+        digital,
+        dict(digital, strike=110),
+        dict(digital, engine="analytic"),
+        dict(barrier, engine="pde"),
+        dict(barrier, engine="trinomial"),
+    ]
+
+    np.random.seed(0)
+    in_process = Price_Portfolio(contracts, 4_000, chunk_size=2_000)
+    np.random.seed(0)
+    in_workers = Price_Portfolio(contracts, 4_000, chunk_size=2_000, workers=2)
+
+    # The deterministic engines price identically and without simulation error
+    np.testing.assert_allclose(in_workers["prices"][2:], in_process["prices"][2:])
+    np.testing.assert_allclose(in_workers["standard_errors"][2:], 0, atol=1e-12)
+
+    # The simulated contracts agree within their sampling error
+    np.testing.assert_allclose(in_workers["prices"][:2], in_process["prices"][:2], atol=5 * in_process["standard_errors"][:2].max())
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_contracts_on_dates_before_maturity_share_their_paths(workers):
+    asset_model = StationaryModel(mu=0.05, sigma=0.2)
+    dates = np.array([0.25, 0.5, 0.75])
+    common = {"asset_model": asset_model, "initial_price": 100, "strike": 100, "period": 1, "num_timesteps": 0, "observation_times": dates}
+
+    # A barrier that is never hit pays the plain call at maturity, which the Asian's paths also reach
+    contracts = [
+        dict(common, pricer=Asian_Option),
+        dict(common, pricer=Barrier_Option, barrier=1e9, knock_in=False),
+    ]
+
+    np.random.seed(0)
+    result = Price_Portfolio(contracts, 20_000, chunk_size=5_000, workers=workers)
+
+    covariance = result["covariance"]
+    assert covariance[0, 1] / np.sqrt(covariance[0, 0] * covariance[1, 1]) > 0.5